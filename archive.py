@@ -0,0 +1,155 @@
+"""Packs of fetched pages, for replaying a crawl without the network.
+
+A pack is an uncompressed tar file with a member per page, named by the
+percent-encoded url of the page and holding its text. Next to it,
+<pack>.idx has a line per page with the offset of the text in the pack, its
+size and the url, appended as pages are added. Reading a page is then a
+slice of the memory-mapped pack, with no tar parsing. If the index is lost,
+it is rebuilt from the names of the members.
+
+With --archive, every page that fetch requests is also added to a pack (see
+fetch.archive); with --replay, pages are read from a pack instead of being
+requested (see fetch.source).
+"""
+
+import argparse
+import atexit
+import io
+import mmap
+import os
+import tarfile
+import threading
+import time
+from urllib.parse import quote, unquote
+
+import fetch
+
+
+def blocks(size: int):
+    """Return size rounded up to whole tar blocks."""
+    return -(-size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+
+
+class Pack:
+    def __init__(self, path: str):
+        """Initialize Pack object.
+
+        Args:
+            path: Path of the tar file. It is created when the first page is
+                added.
+        """
+        self.path = path
+        self.index_path = path + '.idx'
+        # url -> (offset, size) of its text in the pack
+        self.offsets = dict()
+        self.tar = None
+        self.index = None
+        self.file = None
+        self.map = None
+        self.lock = threading.Lock()
+        if os.path.exists(self.index_path):
+            self.read_index()
+        elif os.path.exists(path):
+            self.reindex()
+
+    def read_index(self):
+        with open(self.index_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    offset, size, url = line.rstrip('\n').split('\t', 2)
+                    self.offsets[url] = (int(offset), int(size))
+                except ValueError:
+                    # Torn last line of an interrupted run
+                    continue
+
+    def reindex(self):
+        """Rebuild the index from the members of the pack."""
+        self.offsets.clear()
+        with tarfile.open(self.path, 'r:') as tar:
+            for member in tar:
+                if member.isfile():
+                    self.offsets[unquote(member.name)] = \
+                        (member.offset_data, member.size)
+        with open(self.index_path, 'w', encoding='utf-8') as f:
+            for url, (offset, size) in self.offsets.items():
+                f.write('{}\t{}\t{}\n'.format(offset, size, url))
+
+    def __contains__(self, url: str):
+        return url in self.offsets
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def add(self, url: str, text: str):
+        """Add the page at url, unless the pack already has it."""
+        body = text.encode('utf-8')
+        with self.lock:
+            if url in self.offsets:
+                return
+            if self.tar is None:
+                self.tar = tarfile.open(self.path, 'a:',
+                                        format=tarfile.PAX_FORMAT)
+                self.index = open(self.index_path, 'a', encoding='utf-8')
+
+            info = tarfile.TarInfo(quote(url, safe=''))
+            info.size = len(body)
+            info.mtime = time.time()
+            self.tar.addfile(info, io.BytesIO(body))
+            # The text ends the member, padded to whole blocks
+            offset = self.tar.offset - blocks(len(body))
+            self.tar.fileobj.flush()
+            self.index.write('{}\t{}\t{}\n'.format(offset, len(body), url))
+            self.index.flush()
+            self.offsets[url] = (offset, len(body))
+
+    def get(self, url: str):
+        """Return the text of the page at url.
+
+        Raises requests.exceptions.HTTPError if the pack does not have it.
+        """
+        try:
+            offset, size = self.offsets[url]
+        except KeyError:
+            import requests
+            raise requests.exceptions.HTTPError(
+                '404 Client Error: Not in {} for url: {}'
+                .format(self.path, url))
+        if self.map is None:
+            with self.lock:
+                if self.map is None:
+                    self.file = open(self.path, 'rb')
+                    self.map = mmap.mmap(self.file.fileno(), 0,
+                                         access=mmap.ACCESS_READ)
+        return self.map[offset:offset + size].decode('utf-8')
+
+    def close(self):
+        with self.lock:
+            if self.tar is not None:
+                self.tar.close()
+                self.index.close()
+                self.tar = self.index = None
+            if self.map is not None:
+                self.map.close()
+                self.file.close()
+                self.map = self.file = None
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--archive', metavar='PACK',
+                        help='also add every fetched page to the pack PACK')
+    parser.add_argument('--replay', metavar='PACK',
+                        help='read pages from the pack PACK instead of '
+                             'requesting them')
+
+
+def setup(args: argparse.Namespace):
+    """Archive or replay pages as given by add_arguments."""
+    if args.replay:
+        pack = Pack(args.replay)
+        fetch.source = pack.get
+    elif args.archive:
+        pack = Pack(args.archive)
+        fetch.archive = pack
+    else:
+        return
+    atexit.register(pack.close)
@@ -0,0 +1,266 @@
+#!/usr/bin/python3
+"""Micro-benchmarks of the extractors and of the loader, on the fixture
+pages of parity.
+
+Each extractor is timed on every fixture page of its kind, without using the
+database: parse_html on every page, Game.get_data and
+GameRelease.get_releases on the game pages, Company.get_data on the company
+pages and Platform.get_data on the platform pages. The game pages cover the
+"b" (Super Mario World), "NavFrame" (Phoenix Wright: Ace Attorney) and
+"plainlist" (Dark Souls III) layouts of the Release row, and a page without
+an infobox. The extractors are timed on pages parsed once, as a crawl
+extracts every field from the same parsed page. The pages they link to, e.g.
+the company of a platform, are read from the fixtures instead of being
+fetched, and their extraction is memoized by a first call that is not timed.
+A timing is the best of --rounds rounds of --repeat calls, in microseconds
+per call.
+
+With --insert N, N copies of the fixture games, under titles of their own,
+are also written with data.WriteUnit to the database of mysql_config, or to
+--database, and timed in games per second. The games are left in the
+database, so point it at a scratch database.
+
+Every run is compared with the baseline saved by --save, and timings slower
+than the baseline by more than --tolerance are reported as regressions.
+"""
+
+import argparse
+import json
+import logging
+import sys
+import time
+from urllib.parse import unquote, urlsplit
+
+import data
+import fetch
+import gamedb
+import parity
+
+BASELINE_FILE = 'bench_baseline.json'
+REPEAT = 20
+ROUNDS = 5
+BATCH_SIZE = 10
+# Fraction by which a timing may be slower than the baseline
+TOLERANCE = 0.1
+
+
+def game_data(page):
+    data.Game().get_data(page, use_db=False)
+
+
+def game_releases(page):
+    data.GameRelease().get_releases(page, use_db=False)
+
+
+def company_data(page):
+    data.Company().get_data(page, use_db=False)
+
+
+def platform_data(page):
+    data.Platform().get_data(page, use_db=False)
+
+
+# name -> (kind of the pages it is timed on, function of a parsed page)
+extractors = {
+    'Game.get_data': ('game', game_data),
+    'GameRelease.get_releases': ('game', game_releases),
+    'Company.get_data': ('company', company_data),
+    'Platform.get_data': ('platform', platform_data),
+}
+
+
+def best_time(f, arg, repeat: int, rounds: int):
+    """Return the seconds per call of f(arg) in the fastest of rounds rounds
+    of repeat calls, after a first call that is not timed. Exceptions of f
+    count as returning."""
+    try:
+        f(arg)
+    except Exception:
+        pass
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            try:
+                f(arg)
+            except Exception:
+                pass
+        elapsed = (time.perf_counter() - start) / repeat
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def bench_extractors(pages, repeat: int = REPEAT, rounds: int = ROUNDS):
+    """Return {extractor: {page: microseconds per call}}."""
+    results = {'parse_html': dict()}
+    parsed = dict()
+    for kind, filename, html in pages:
+        key = '{}/{}'.format(kind, filename)
+        results['parse_html'][key] = 1e6 * best_time(data.parse_html, html,
+                                                     repeat, rounds)
+        parsed[key] = (kind, data.parse_html(html))
+    for name, (kind, f) in extractors.items():
+        results[name] = {key: 1e6 * best_time(f, page, repeat, rounds)
+                         for key, (page_kind, page) in parsed.items()
+                         if page_kind == kind}
+    return results
+
+
+def fixture_key(url: str):
+    """Return the name of the fixture file of the page at url, without the
+    characters the fixture names leave out."""
+    title = unquote(urlsplit(url).path.rsplit('/', 1)[-1])
+    return title.replace(':', '').replace(' ', '_') + '.html'
+
+
+def fixture_source(pages):
+    """Return a fetch.source reading the pages linked to from the fixture
+    pages."""
+    by_name = {filename: html for _, filename, html in pages}
+
+    def source(url: str):
+        try:
+            return by_name[fixture_key(url)]
+        except KeyError:
+            import requests
+            raise requests.exceptions.HTTPError(
+                '404 Client Error: Not a fixture: {}'.format(url))
+    return source
+
+
+def extract_game(page, title: str):
+    """Return (game, game_release) of a game page as load_game_page would,
+    under title."""
+    game = data.Game()
+    game.title = title
+    game.get_details(page)
+    game.ensure_attr_existence()
+    game_release = data.GameRelease(game=game)
+    try:
+        game_release.get_releases(page)
+    except Exception:
+        pass
+    if not game_release.releases:
+        game_release.releases.append(data.GameRelease.generic_r())
+    game.get_earliest_release_date(game_release)
+    return game, game_release
+
+
+def bench_insert(pages, games: int, batch_size: int = BATCH_SIZE):
+    """Return the games per second written by WriteUnit, of games copies of
+    the fixture games."""
+    game_pages = [(data.wiki_title(page), page) for page in
+                  (data.parse_html(html)
+                   for kind, _, html in pages if kind == 'game')
+                  if page.infobox is not None]
+    run = int(time.time())
+    with gamedb.connection():
+        # The companies and platforms are written by the first flush or when
+        # extracted, outside of the timing
+        extracted = []
+        for i in range(games):
+            title, page = game_pages[i % len(game_pages)]
+            extracted.append(extract_game(page, '{} (bench {} #{})'
+                                          .format(title, run, i)))
+    unit = data.WriteUnit(batch_size)
+    start = time.perf_counter()
+    for game, game_release in extracted:
+        unit.add(game, game_release)
+    unit.flush()
+    return len(extracted) / (time.perf_counter() - start)
+
+
+def compare(results: dict, baseline: dict, tolerance: float = TOLERANCE):
+    """Print every timing next to its baseline, and return the number of
+    regressions."""
+    regressions = 0
+    for name, timings in results.get('extract', dict()).items():
+        for key, now in sorted(timings.items()):
+            base = baseline.get('extract', dict()).get(name, dict()).get(key)
+            line = '{:26} {:50} {:10.1f} us'.format(name, key, now)
+            if base:
+                line += '  {:+6.1%}'.format(now / base - 1)
+                if now > base * (1 + tolerance):
+                    line += '  REGRESSION'
+                    regressions += 1
+            print(line)
+    if 'insert' in results:
+        now = results['insert']['games_per_second']
+        line = '{:77} {:10.1f} games/s'.format('WriteUnit.flush', now)
+        base = baseline.get('insert', dict()).get('games_per_second')
+        if base:
+            line += '  {:+6.1%}'.format(now / base - 1)
+            if now < base / (1 + tolerance):
+                line += '  REGRESSION'
+                regressions += 1
+        print(line)
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=REPEAT,
+                        help='calls per round of a timing')
+    parser.add_argument('--rounds', type=int, default=ROUNDS,
+                        help='rounds of a timing, of which the fastest counts')
+    parser.add_argument('--insert', type=int, default=0, metavar='N',
+                        help='also time writing N games to the database')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help='with --insert, games written per transaction')
+    parser.add_argument('--database', default=None,
+                        help='with --insert, database to write to instead of '
+                             'that of mysql_config')
+    parser.add_argument('--baseline', default=BASELINE_FILE,
+                        help='file of the baseline timings')
+    parser.add_argument('--save', action='store_true',
+                        help='save the timings of this run as the baseline')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help='fraction by which a timing may be slower than '
+                             'the baseline')
+    parser.add_argument('--fixtures', default=parity.FIXTURES_DIR,
+                        help='corpus directory')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    # Extraction logs the links it cannot resolve, for every repetition
+    logging.disable(logging.ERROR)
+    # Relative links resolve the same wherever the corpus was saved from
+    data.wikipedia_baseurl = 'https://en.wikipedia.org/'
+    pages = parity.corpus(args.fixtures)
+    fetch.source = fixture_source(pages)
+    fetch.cache = None
+    fetch.throttle = None
+
+    results = {'extract': bench_extractors(pages, args.repeat, args.rounds)}
+    if args.insert:
+        if args.database:
+            gamedb.pool = gamedb.Pool(database=args.database)
+        data.preload_entities()
+        results['insert'] = {
+            'games_per_second': bench_insert(pages, args.insert,
+                                             args.batch_size),
+            'batch_size': args.batch_size,
+        }
+
+    try:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    except OSError:
+        baseline = dict()
+    regressions = compare(results, baseline, args.tolerance)
+
+    if args.save:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+            f.write('\n')
+        print('Saved the baseline in {}.'.format(args.baseline))
+    elif baseline:
+        print('{} regressions'.format(regressions))
+    sys.exit(1 if regressions and not args.save else 0)
+
+
+if __name__ == '__main__':
+    main()
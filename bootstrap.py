@@ -0,0 +1,266 @@
+#!/usr/bin/python3
+"""Bulk load the whole url.txt corpus into an empty or small database.
+
+Instead of inserting rows one game at a time, BulkLoader writes the
+extracted company, employee, game, game_release, develops and game_url rows
+to TSV files, assigning their ids itself, and then loads each file with
+LOAD DATA LOCAL INFILE. With the game_url rows, a later data_gen crawl skips
+the pages of the games loaded.
+"""
+
+import argparse
+import datetime
+import logging
+import os
+import sys
+
+import data
+import data_gen
+import gamedb
+
+URL_FILE = 'url.txt'
+LOG_FILE = 'bootstrap.log'
+TSV_DIR = 'bootstrap'
+
+# Ids left free for rows inserted the usual way during the bootstrap, such as
+# platforms and their companies
+ID_RESERVE = 10000
+
+# Tables in the order they are loaded, with their columns and id column
+tables = (
+    ('company', ('company_id', 'defunct_date', 'founder', 'founding_date',
+                 'hq_address', 'name', 'website'), 'company_id'),
+    ('developing_company', ('company_id',), None),
+    ('publishing_company', ('company_id',), None),
+    ('employee', ('employee_id', 'role', 'name'), 'employee_id'),
+    ('game', ('game_id', 'earliest_release_date', 'reception', 'title'),
+     'game_id'),
+    ('game_release', ('release_id', 'game_id', 'platform_id', 'region',
+                      'release_date', 'title'), 'release_id'),
+    ('develops', ('release_id', 'employee_id', 'employee_role',
+                  'developing_company_id', 'publishing_company_id'), None),
+    ('game_url', ('url', 'game_id', 'revision'), None),
+)
+
+max_id_sql = "SELECT COALESCE(MAX({id}), 0) FROM {table}"
+
+load_sql = """LOAD DATA LOCAL INFILE %s IGNORE INTO TABLE {table}
+              CHARACTER SET utf8mb4
+              FIELDS TERMINATED BY '\\t' LINES TERMINATED BY '\\n'
+              ({columns})"""
+
+# Same settings as gamedb.sql
+load_begin_sqls = (
+    "SET @OLD_UNIQUE_CHECKS=@@UNIQUE_CHECKS, UNIQUE_CHECKS=0",
+    "SET @OLD_FOREIGN_KEY_CHECKS=@@FOREIGN_KEY_CHECKS, FOREIGN_KEY_CHECKS=0",
+)
+load_end_sqls = (
+    "SET FOREIGN_KEY_CHECKS=@OLD_FOREIGN_KEY_CHECKS",
+    "SET UNIQUE_CHECKS=@OLD_UNIQUE_CHECKS",
+)
+
+
+def tsv_path(path: str, table: str):
+    return os.path.join(path, table + '.tsv')
+
+
+def tsv_field(value):
+    """Return value as a field of a file read by LOAD DATA."""
+    if value is None:
+        return '\\N'
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t') \
+                     .replace('\n', '\\n').replace('\r', '\\r')
+
+
+class BulkLoader:
+    """Stand-in for data.WriteUnit that writes rows to TSV files.
+
+    Ids are assigned client-side, starting ID_RESERVE past the largest id
+    in each table, so that the develops rows refer to the right releases,
+    employees and companies once all files are loaded. New companies and
+    employees are put in the entity caches, so that later games and
+    platforms reuse their ids instead of inserting them again.
+    """
+
+    def __init__(self, path: str = TSV_DIR):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.files = dict()
+        self.next_ids = dict()
+        with gamedb.connection() as conn, conn.cursor() as cu:
+            for table, columns, id_ in tables:
+                self.files[table] = open(tsv_path(path, table), 'w',
+                                         encoding='utf-8', newline='\n')
+                if id_:
+                    cu.execute(max_id_sql.format(id=id_, table=table))
+                    self.next_ids[table] = cu.fetchone()[0] + 1 + ID_RESERVE
+        self.titles = set()
+        self.company_ids = dict()
+        self.employee_ids = dict()
+        self.links = {'developing_company': set(),
+                      'publishing_company': set()}
+        self.develops = set()
+        self.urls = set()
+
+    def write(self, table: str, row):
+        print('\t'.join(map(tsv_field, row)), file=self.files[table])
+
+    def new_id(self, table: str):
+        id_ = self.next_ids[table]
+        self.next_ids[table] += 1
+        return id_
+
+    def add(self, game: data.Game, game_release: data.GameRelease):
+        if game.title in self.titles:
+            logging.error('BulkLoader.add: {} is already loaded'
+                          .format(game.title))
+            return
+        self.titles.add(game.title)
+
+        self.add_companies(game)
+        self.add_employees(game)
+
+        game.game_id = self.new_id('game')
+        self.write('game', (game.game_id,) + game.insert_args())
+        self.write_url(game)
+
+        releases = []
+        for release in game_release.releases:
+            if release[1].platform_id is None:
+                logging.error(
+                    'GameRelease: Attempted to insert NULL in non-NULLable column for {}.'
+                    .format(game_release.title))
+                releases.append(release)
+                continue
+            release_id = self.new_id('game_release')
+            self.write('game_release',
+                       (release_id, game.game_id, release[1].platform_id,
+                        release[2], release[3], game_release.title))
+            releases.append((release_id,) + release[1:])
+        game_release.releases = releases
+
+        for row in data.Develops.rows(game, game_release):
+            if None not in row and row not in self.develops:
+                self.develops.add(row)
+                self.write('develops', row)
+
+    def add_url(self, game: data.Game):
+        """Record game.url of a game already in the database, like
+        data.WriteUnit.add_url."""
+        self.write_url(game)
+
+    def write_url(self, game: data.Game):
+        if game.url and game.url not in self.urls:
+            self.urls.add(game.url)
+            self.write('game_url', (game.url, game.game_id, game.revision))
+
+    def add_companies(self, game: data.Game):
+        for table, companies in (
+                ('developing_company', game.developing_companies),
+                ('publishing_company', game.publishing_companies)):
+            for company in companies:
+                if not company.company_id:
+                    company.company_id = self.company_ids.get(company.name)
+                if not company.company_id:
+                    company.company_id = self.new_id('company')
+                    self.company_ids[company.name] = company.company_id
+                    tuple_ = (company.company_id,) + company.insert_args()
+                    self.write('company', tuple_)
+                    data.Company.cache.add(tuple_, company.url)
+                company.in_database = True
+
+                if company.company_id not in self.links[table]:
+                    self.links[table].add(company.company_id)
+                    self.write(table, (company.company_id,))
+
+    def add_employees(self, game: data.Game):
+        for employee in game.employees:
+            employee.employee_ids = []
+            for role in employee.roles:
+                key = (employee.name, role)
+                tuple_ = data.Employee.cache.get('name', key)
+                if tuple_:
+                    id_ = tuple_[0]
+                elif key in self.employee_ids:
+                    id_ = self.employee_ids[key]
+                else:
+                    id_ = self.new_id('employee')
+                    self.employee_ids[key] = id_
+                    tuple_ = (id_, role, employee.name)
+                    self.write('employee', tuple_)
+                    data.Employee.cache.add(tuple_)
+                employee.employee_ids.append(id_)
+
+    def flush(self):
+        for f in self.files.values():
+            f.flush()
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+
+    def load(self):
+        self.close()
+        load(self.path)
+
+
+def load(path: str = TSV_DIR):
+    """Load the TSV files in path into the database in one transaction.
+
+    Nothing is loaded if any file fails to load. No DDL, such as ALTER
+    TABLE ... DISABLE KEYS, may run here: it would commit the tables
+    loaded so far.
+    """
+    db = gamedb.connect(local_infile=True)
+    try:
+        with db.cursor() as cu:
+            for sql in load_begin_sqls:
+                cu.execute(sql)
+            for table, columns, _ in tables:
+                cu.execute(load_sql.format(table=table,
+                                           columns=', '.join(columns)),
+                           (os.path.abspath(tsv_path(path, table)),))
+                print('{}: {} rows'.format(table, cu.rowcount))
+            for sql in load_end_sqls:
+                cu.execute(sql)
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    data_gen.add_crawl_arguments(parser)
+    parser.add_argument('--url-file', default=URL_FILE,
+                        help='file with one game url per line')
+    parser.add_argument('--tsv-dir', default=TSV_DIR,
+                        help='directory the TSV files are written to')
+    parser.add_argument('--load-only', action='store_true',
+                        help='only load the TSV files of an earlier run')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.sqlite:
+        # LOAD DATA LOCAL INFILE is MySQL's
+        sys.exit('--sqlite cannot be used with bootstrap')
+    data_gen.setup(args, LOG_FILE)
+    if args.load_only:
+        load(args.tsv_dir)
+        return
+
+    data.preload_entities()
+    loader = BulkLoader(args.tsv_dir)
+    with open(args.url_file, 'r') as f:
+        data_gen.crawl(args, data_gen.get_urls(f), loader, max_urls=None)
+    loader.load()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+#!/usr/bin/python3
+"""Check that a database backend behaves as data expects of gamedb.
+
+The checks run the statements of data, in the MySQL dialect, against the
+MySQL server of mysql_config, or --database, or against the SQLite database
+--sqlite, e.g. a new file, and check what data relies on: the ids of
+multi-row inserts, the ids and row counts of upserts, duplicate keys raising
+gamedb.IntegrityError with gamedb.DUP_ENTRY, lookups by title hash, dates and
+decimals coming back as they went in, and rollbacks, and that every
+statement of data is accepted. It exits with status 1 if any check fails. Every check is rolled
+back, so the database is left as it was, but point it at a scratch database
+anyway.
+"""
+
+import argparse
+import datetime
+import decimal
+import inspect
+import sys
+import time
+
+import data
+import gamedb
+import gamedb_sqlite
+
+# Titles of the rows written by a run, unique to it
+TAG = 'conformance {}'.format(time.time_ns())
+
+
+def title(name: str):
+    # Not ASCII, to check the hashes of titles are of their UTF-8 encoding
+    return '{} {} éテ'.format(TAG, name)
+
+
+def expect(what: str, got, expected):
+    if got != expected:
+        raise AssertionError('{}: got {!r}, expected {!r}'
+                             .format(what, got, expected))
+
+
+def company_args(name: str):
+    return (datetime.date(1889, 9, 23), 'Fusajiro Yamauchi', None, None,
+            title(name)[:50], None)
+
+
+def check_insert_rows(cu):
+    rows = [(datetime.date(1990, 11, 21), i, title('insert_rows {}'
+                                                   .format(i)))
+            for i in range(3)]
+    ids = data.insert_rows(cu, data.Game.insert_sql, rows)
+    for id_, row in zip(ids, rows):
+        cu.execute(data.Game.check_sql_id, (id_,))
+        expect('game {}'.format(id_), cu.fetchone(), (id_,) + row)
+
+
+def check_upsert(cu):
+    cu.execute(data.Company.upsert_sql, company_args('upsert'))
+    id_ = cu.lastrowid
+    expect('rowcount of a new row', cu.rowcount, 1)
+    cu.execute(data.Company.upsert_sql, company_args('upsert'))
+    expect('lastrowid of an existing row', cu.lastrowid, id_)
+    expect('rowcount of an existing row', cu.rowcount == 1, False)
+
+
+def check_insert_new_rows(cu):
+    cu.execute(data.Company.upsert_sql, company_args('old'))
+    old_id = cu.lastrowid
+    rows = [company_args('new 1'), company_args('old'), company_args('new 2')]
+    ids = data.insert_new_rows(cu, data.Company.insert_sql,
+                               data.Company.upsert_sql, rows)
+    expect('ids of the rows', [inserted for _, inserted in ids],
+           [True, False, True])
+    expect('id of the old row', ids[1][0], old_id)
+    expect('ids are distinct', len({id_ for id_, _ in ids}), 3)
+
+
+def check_insert_batch(cu):
+    cu.execute(data.Employee.insert_sql, (title('employee old'), 'Director'))
+    old_id = cu.lastrowid
+    keys = [(title('employee new 1'), 'Director'),
+            (title('employee old'), 'Director'),
+            (title('employee new 2'), 'Director')]
+    ids, inserted = data.Employee.insert_batch(cu, keys)
+    expect('id of the old row', ids[1], old_id)
+    expect('ids are distinct', len(set(ids)), 3)
+    for id_, (name, role) in zip(ids, keys):
+        cu.execute(data.Employee.get_id_sql, (name, role))
+        expect('employee {}'.format(id_), cu.fetchone(), (id_, role, name))
+
+
+def statements():
+    """Yield the statements of data that take parameters only, not
+    formatted first."""
+    for cls in vars(data).values():
+        if not inspect.isclass(cls) or cls.__module__ != data.__name__:
+            continue
+        for name, sql in sorted(vars(cls).items()):
+            if 'sql' in name and isinstance(sql, str) and '{' not in sql:
+                yield '{}.{}'.format(cls.__name__, name), sql
+
+
+def check_statements(cu):
+    # EXPLAIN prepares a statement without running it
+    for name, sql in statements():
+        try:
+            cu.execute('EXPLAIN ' + sql, (None,) * sql.count('%s'))
+            cu.fetchall()
+        except gamedb.Error as e:
+            raise AssertionError('{}: {}'.format(name, e)) from e
+
+
+def check_duplicate_key(cu):
+    cu.execute(data.Company.insert_sql, company_args('duplicate'))
+    try:
+        cu.execute(data.Company.insert_sql, company_args('duplicate'))
+    except gamedb.IntegrityError as e:
+        expect('error code', e.args[0], gamedb.DUP_ENTRY)
+    else:
+        raise AssertionError('duplicate key: no IntegrityError')
+
+
+def check_insert_ignore(cu):
+    row = (2 ** 30, 1, 'Producer', 1, 1)
+    cu.execute(data.Develops.insert_batch_sql, row)
+    expect('rowcount of a new row', cu.rowcount, 1)
+    cu.execute(data.Develops.insert_batch_sql, row)
+    expect('rowcount of an ignored row', cu.rowcount, 0)
+
+
+def check_title_hash(cu):
+    ids = data.insert_rows(cu, data.Game.insert_sql,
+                           [(None, None, title('hash'))])
+    cu.execute(data.Game.get_id_sql, (title('hash'), title('hash')))
+    expect('game by title', cu.fetchone(), (ids[0],))
+    cu.execute(data.Game.get_id_sql, (title('none'), title('none')))
+    expect('missing game by title', cu.fetchone(), None)
+
+
+def check_game_url(cu):
+    url = 'https://en.wikipedia.org/wiki/{}'.format(title('url'))
+    sql = "SELECT game_id, revision FROM game_url WHERE url=%s"
+    cu.execute(data.GameUrls.upsert_sql, (url, 1, 'r1'))
+    cu.execute(data.GameUrls.upsert_sql, (url, 2, 'r2'))
+    cu.execute(sql, (url,))
+    expect('upserted url', list(cu.fetchall()), [(2, 'r2')])
+
+
+def check_types(cu):
+    row = (None, datetime.date(1995, 12, 31), 5, decimal.Decimal('199.99'),
+           title('types')[:50], datetime.date(1990, 11, 21), 'Home')
+    cu.execute(data.Platform.upsert_sql, row)
+    id_ = cu.lastrowid
+    cu.executemany(data.Platform.man_sql, [(id_, 'Nintendo'), (id_, 'Sony')])
+    expect('rowcount of executemany', cu.rowcount, 2)
+    cu.execute("""SELECT company_id, discontinued_date, generation,
+                         introductory_price, name, release_date, type
+                  FROM platform WHERE platform_id=%s""", (id_,))
+    expect('platform', cu.fetchone(), row)
+    cu.execute("""SELECT manufacturer_name FROM manufacturers
+                  WHERE platform_id=%s ORDER BY manufacturer_name""", (id_,))
+    expect('manufacturers', [t[0] for t in cu.fetchall()],
+           ['Nintendo', 'Sony'])
+
+
+def check_rollback(cu):
+    data.insert_rows(cu, data.Game.insert_sql, [(None, None, title('gone'))])
+    gamedb.db.rollback()
+    cu.execute(data.Game.get_id_sql, (title('gone'), title('gone')))
+    expect('rolled back game', cu.fetchone(), None)
+
+
+# name -> check of a cursor, whose connection is gamedb.db
+checks = {
+    'insert_rows': check_insert_rows,
+    'upsert': check_upsert,
+    'insert_new_rows': check_insert_new_rows,
+    'insert_batch': check_insert_batch,
+    'statements': check_statements,
+    'duplicate_key': check_duplicate_key,
+    'insert_ignore': check_insert_ignore,
+    'title_hash': check_title_hash,
+    'game_url': check_game_url,
+    'types': check_types,
+    'rollback': check_rollback,
+}
+
+
+def run(names):
+    """Run the checks names, and return the number of failures."""
+    failures = 0
+    for name in names:
+        with gamedb.connection() as conn:
+            try:
+                with conn.cursor() as cu:
+                    checks[name](cu)
+                print('{:16} ok'.format(name))
+            except Exception as e:
+                failures += 1
+                print('{:16} FAILED {}: {}'.format(name, type(e).__name__, e))
+            finally:
+                conn.rollback()
+    return failures
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sqlite', default=None, metavar='PATH',
+                        help='check the SQLite database PATH, created if '
+                             'needed, instead of the MySQL server')
+    parser.add_argument('--database', default=None,
+                        help='check this database of the MySQL server '
+                             'instead of that of mysql_config')
+    parser.add_argument('checks', nargs='*',
+                        help='checks to run, by default all of them: {}'
+                             .format(', '.join(checks)))
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    unknown = [name for name in args.checks if name not in checks]
+    if unknown:
+        sys.exit('Unknown checks: {}'.format(', '.join(unknown)))
+    if args.sqlite:
+        gamedb.use(gamedb_sqlite.SQLite(args.sqlite))
+    elif args.database:
+        gamedb.pool = gamedb.Pool(database=args.database)
+    print('Backend: {}'.format(gamedb.backend.name))
+    failures = run(args.checks or list(checks))
+    print('{} failures'.format(failures))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,24 +1,35 @@
 #!/usr/bin/python3
+"""Game, company, platform and employee data extracted from Wikipedia.
 
+Pages are parsed into extract.Page objects. Importing this module neither
+connects to the database nor imports dateutil or requests; they are set up
+on first use.
+"""
+
+from __future__ import annotations
+
+from collections import OrderedDict
 import datetime
-from dateutil.parser import parse
+import functools
+import hashlib
 from itertools import repeat
 import logging
 import operator
 import random
 import re
+import threading
 from urllib.parse import urljoin
 
-import bs4
-from bs4 import BeautifulSoup
-from dateutil import parser
 from parse import compile
-import pymysql
-import requests
 
+import extract
+from extract import Page
+import fetch
 import gamedb
+import metrics
 
-dateparse = parser.parse
+# The connection of the unit of work on the calling thread, see
+# gamedb.connection
 db = gamedb.db
 
 
@@ -26,38 +37,59 @@ random.seed()
 
 wikipedia_baseurl = 'https://en.wikipedia.org/'
 
-sql_execute_init = (
-)
+ENTITY_CACHE_SIZE = 100000
+# Companies and platforms extracted without the database, per process
+EXTRACTED_CACHE_SIZE = 10000
 
-if sql_execute_init:
-    with db.cursor() as cu:
-        for stmt in sql_execute_init:
-            cu.execute(stmt)
-    db.commit()
+parse_seconds = metrics.histogram('gamedb_parse_seconds',
+                                  'Seconds to parse a page')
+extract_seconds = metrics.histogram('gamedb_extract_seconds',
+                                    'Seconds an extractor takes on a page, '
+                                    'including the pages it fetches')
+write_seconds = metrics.histogram('gamedb_db_write_seconds',
+                                  'Seconds of each step of writing a unit of '
+                                  'games to the database')
+rows_written = metrics.counter('gamedb_db_rows_written_total',
+                               'Rows inserted, updated or deleted by '
+                               'committed units, by table')
+games_written = metrics.counter('gamedb_db_games_written_total',
+                                'Games written by committed units, new or '
+                                'refreshed')
 
 
-def wiki_body_content(soup: BeautifulSoup):
-    return soup.body.find('div', id='content').find('div', id='bodyContent')
+def parse_html(html: str):
+    """Return html parsed into a Page."""
+    with parse_seconds.time():
+        return Page(html)
 
 
-def wiki_infobox(soup: BeautifulSoup):
-    return soup.body.find('div', id='content').find('div', id='bodyContent') \
-                    .find('table', class_='infobox')
+revision_re = re.compile(r'"wgRevisionId":(\d+)')
 
 
-def wiki_infobox_td(soup: BeautifulSoup, search):
-    th = wiki_infobox(soup).find('th', string=search)
-    if not th:
-        return None
-    td = th.next_sibling
-    while td.name != 'td':
-        td = td.next_sibling
-    return td
+def page_revision(html: str):
+    """Return the revision id of a wikipedia page, or the SHA-256 of its html
+    if it has none, without parsing it."""
+    m = revision_re.search(html)
+    if m:
+        return m.group(1)
+    return hashlib.sha256(html.encode('utf-8')).hexdigest()
+
+
+def dateparse(s: str):
+    from dateutil.parser import parse
+    return parse(s)
+
 
+def wiki_infobox(page: Page):
+    return page.infobox
 
-def wiki_title(soup: BeautifulSoup):
-    return soup.body.find('div', id='content').find('h1', id='firstHeading') \
-               .string
+
+def wiki_infobox_td(page: Page, label):
+    return page.infobox.td(label)
+
+
+def wiki_title(page: Page):
+    return page.title()
 
 
 def random_date():
@@ -88,21 +120,126 @@ def ord_to_int(o):
     raise TypeError
 
 
+class IdentityMap:
+    """In-memory map of the database tuples of one table.
+
+    Tuples are keyed by id, by name and, once known, by the url of their
+    wikipedia page, and are evicted least recently used first. Names and urls
+    known not to be in the database are remembered as well, so that repeated
+    lookups of an entity never need a database round trip.
+    """
+
+    def __init__(self, name_of, maxsize: int = ENTITY_CACHE_SIZE):
+        """Initialize IdentityMap object.
+
+        Args:
+            name_of: Function returning the name key of a tuple.
+            maxsize: Maximum number of tuples, and of misses, to keep.
+        """
+        self.name_of = name_of
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            # id -> tuple, least recently used first
+            self.tuples = OrderedDict()
+            # id -> set of (kind, value) keys of the tuple
+            self.keys = dict()
+            # (kind, value) -> id
+            self.ids = dict()
+            # (kind, value) keys not in the database
+            self.misses = OrderedDict()
+
+    def get(self, kind: str, value):
+        """Return the cached tuple whose kind ('id', 'name' or 'url') is
+        value, or None if there is none."""
+        with self.lock:
+            id_ = value if kind == 'id' else self.ids.get((kind, value))
+            tuple_ = self.tuples.get(id_)
+            if tuple_ is not None:
+                self.tuples.move_to_end(id_)
+            return tuple_
+
+    def is_miss(self, kind: str, value):
+        with self.lock:
+            return (kind, value) in self.misses
+
+    def lookup(self, kind: str, value, sql: str):
+        """Like get, but on a cache miss check the database with sql."""
+        tuple_ = self.get(kind, value)
+        if tuple_ is not None or self.is_miss(kind, value):
+            return tuple_
+
+        with db.cursor() as cu:
+            cu.execute(sql, (value,))
+            tuple_ = cu.fetchone()
+        if tuple_:
+            self.add(tuple_, url=value if kind == 'url' else None)
+        else:
+            self.add_miss(kind, value)
+        return tuple_
+
+    def add(self, tuple_, url: str = None):
+        id_ = tuple_[0]
+        keys = {('name', self.name_of(tuple_))}
+        if url:
+            keys.add(('url', url))
+        with self.lock:
+            self.tuples[id_] = tuple_
+            self.tuples.move_to_end(id_)
+            self.keys.setdefault(id_, set()).update(keys)
+            for key in keys:
+                self.ids[key] = id_
+                self.misses.pop(key, None)
+
+            while len(self.tuples) > self.maxsize:
+                old_id, _ = self.tuples.popitem(last=False)
+                for key in self.keys.pop(old_id, ()):
+                    if self.ids.get(key) == old_id:
+                        del self.ids[key]
+
+    def add_url(self, url: str, id_):
+        """Key the cached tuple with id id_ by url too."""
+        tuple_ = self.get('id', id_)
+        if tuple_ is not None:
+            self.add(tuple_, url)
+
+    def add_miss(self, kind: str, value):
+        with self.lock:
+            self.misses[(kind, value)] = None
+            self.misses.move_to_end((kind, value))
+            while len(self.misses) > self.maxsize:
+                self.misses.popitem(last=False)
+
+    def discard_miss(self, kind: str, value):
+        with self.lock:
+            self.misses.pop((kind, value), None)
+
+    def preload(self, sql: str):
+        """Add every tuple returned by sql."""
+        with db.cursor() as cu:
+            cu.execute(sql)
+            for tuple_ in cu.fetchall():
+                self.add(tuple_)
+
+
 class Company:
     DEV = 1
     PUB = 2
 
-    def __init__(self, soup: BeautifulSoup = None, check_db: bool = False,
+    def __init__(self, page: Page = None, check_db: bool = False,
                  use_db: bool = True):
         """Initialize Company object.
 
         Args:
-            soup: If given, then use data in soup to initialize/check for
+            page: If given, then use data in page to initialize/check for
                 existence in database.
             check_db: If True, then the object will not be populated if
-                data correspoinding to data in soup exists in the database.
+                data correspoinding to data in page exists in the database.
                 If False, then attempt to populate object using getdata.
-                Ignored if soup is not given or is None.
+                Ignored if page is not given or is None.
             use_db: Whether or not to use the database.
         """
         self.company_id = None
@@ -113,9 +250,14 @@ class Company:
         self.name = None
         self.website = None
         self.in_database = False
-        if soup:
-            self.get_data(soup, check_db, use_db)
+        # Url of the wikipedia page of the company, if known
+        self.url = None
+        if page:
+            self.get_data(page, check_db, use_db)
+
+    cache = IdentityMap(operator.itemgetter(5))
 
+    preload_sql = "SELECT * FROM company"
     check_sql_id = "SELECT * FROM company WHERE company_id=%s"
     check_sql_name = "SELECT * FROM company WHERE name=%s"
 
@@ -128,36 +270,51 @@ class Company:
         """
         if self.company_id:
             sql = Company.check_sql_id
+            kind = 'id'
             check = self.company_id
         elif self.name:
             sql = Company.check_sql_name
+            kind = 'name'
             check = self.name
         else:
             self.in_database = False
             return None
 
-        with db.cursor() as cu:
-            cu.execute(sql, (check,))
-            tuple_ = cu.fetchone()
+        tuple_ = Company.cache.lookup(kind, check, sql)
 
         self.in_database = tuple_ is not None
         if self.in_database and not self.company_id:
-            self.get_id()
+            self.company_id = tuple_[0]
         return tuple_
 
     insert_sql = """INSERT INTO company (defunct_date, founder, founding_date,
                     hq_address, name, website)
                     VALUES (%s, %s, %s, %s, %s, %s)"""
+    # cu.lastrowid is the id of the company, whether it is new or not
+    upsert_sql = insert_sql + """
+                    ON DUPLICATE KEY UPDATE
+                        company_id=LAST_INSERT_ID(company_id)"""
+
+    def insert_args(self):
+        return (self.defunct_date, self.founder, self.founding_date,
+                self.hq_address, self.name, self.website)
 
     def insert_into_database(self):
         with db.cursor() as cu:
-            cu.execute(Company.insert_sql, (self.defunct_date, self.founder,
-                                            self.founding_date, self.hq_address,
-                                            self.name, self.website))
+            cu.execute(Company.upsert_sql, self.insert_args())
+            self.company_id = cu.lastrowid
+            inserted = cu.rowcount == 1
         db.commit()
-        self.get_id()
+        if inserted:
+            rows_written.inc(table='company')
+            Company.cache.add((self.company_id,) + self.insert_args(),
+                              self.url)
+        else:
+            Company.cache.discard_miss('name', self.name)
 
     dev_sql = "INSERT INTO developing_company (company_id) VALUES (%s)"
+    dev_batch_sql = \
+        "INSERT IGNORE INTO developing_company (company_id) VALUES (%s)"
 
     @staticmethod
     def insert_dev(id):
@@ -165,10 +322,12 @@ class Company:
             with db.cursor() as cu:
                 cu.execute(Company.dev_sql, (id,))
             db.commit()
-        except pymysql.err.IntegrityError:
+        except gamedb.IntegrityError:
             return
 
     pub_sql = "INSERT INTO publishing_company (company_id) VALUES (%s)"
+    pub_batch_sql = \
+        "INSERT IGNORE INTO publishing_company (company_id) VALUES (%s)"
 
     @staticmethod
     def insert_pub(id):
@@ -176,7 +335,7 @@ class Company:
             with db.cursor() as cu:
                 cu.execute(Company.pub_sql, (id,))
             db.commit()
-        except pymysql.err.IntegrityError:
+        except gamedb.IntegrityError:
             return
 
     def insert_if_not_exist(self, t: int = None):
@@ -192,60 +351,114 @@ class Company:
             elif t == Company.PUB:
                 Company.insert_pub(self.company_id)
 
-    get_id_sql = "SELECT company_id FROM company WHERE name=%s"
-
     def get_id(self, name: str = None):
         """Get id from database."""
-        with db.cursor() as cu:
-            if not name:
-                name = self.name
-            cu.execute(Company.get_id_sql, (name,))
-            id_ = cu.fetchone()
-            if id_:
-                self.company_id = id_[0]
+        if not name:
+            name = self.name
+        tuple_ = Company.cache.lookup('name', name, Company.check_sql_name)
+        if tuple_:
+            self.company_id = tuple_[0]
+
+    @staticmethod
+    def from_url(url: str, use_db: bool = True):
+        """Return the Company whose wikipedia page is at url.
+
+        The page is only fetched if the company is not cached by url. If not
+        use_db, then the company is extracted from its page with
+        Company.extract.
 
-    def get_data(self, soup: BeautifulSoup, check_db: bool = False,
+        Raises requests.exceptions.HTTPError if fetching the page fails.
+        """
+        if not use_db:
+            return Company.extract(url)
+
+        tuple_ = Company.cache.get('url', url)
+        if tuple_:
+            company = Company()
+            company.get_data_from_tuple(tuple_)
+            company.in_database = True
+            return company
+
+        company = Company(parse_html(fetch.get(url)))
+        company.url = url
+        if company.company_id:
+            Company.cache.add_url(url, company.company_id)
+        return company
+
+    @staticmethod
+    @functools.lru_cache(maxsize=EXTRACTED_CACHE_SIZE)
+    def extract(url: str):
+        """Return the Company whose wikipedia page is at url, extracted
+        without using the database.
+
+        Each page is fetched and extracted once per process; the companies
+        returned are shared and must not be modified.
+
+        Raises requests.exceptions.HTTPError if fetching the page fails.
+        """
+        company = Company(parse_html(fetch.get(url)), use_db=False)
+        company.url = url
+        return company
+
+    def resolve(self):
+        """Match a company extracted without using the database with the
+        database, as if it had been extracted using it.
+
+        If the company is cached by url, or has a row by name, then it takes
+        the data of that row and in_database is True.
+        """
+        tuple_ = Company.cache.get('url', self.url) if self.url else None
+        if tuple_ is None:
+            tuple_ = self.check_database()
+        if tuple_:
+            self.get_data_from_tuple(tuple_)
+            self.in_database = True
+            if self.url:
+                Company.cache.add_url(self.url, self.company_id)
+
+    @extract_seconds.time(extractor='Company.get_data')
+    def get_data(self, page: Page, check_db: bool = False,
                  use_db: bool = True):
-        """Get data by using BeautifulSoup to extract HTML elements.
+        """Get data by using Page to extract HTML elements.
 
         Args:
-            soup: Used to initialize object/check for existence in database.
+            page: Used to initialize object/check for existence in database.
             check_db: If True, then the object will not be populated if data
-                correspoinding to data in soup exists in the database.
+                correspoinding to data in page exists in the database.
                 If False, then attempt to populate object.
             use_db: Whether or not to use the database.
         """
         if use_db:
-            self.get_name(soup)
+            self.get_name(page)
             tuple_ = self.check_database()
             if tuple_:
                 if not check_db:
                     self.get_data_from_tuple(tuple_)
             else:
-                self.get_defunct_date(soup)
-                self.get_founder(soup)
-                self.get_founding_date(soup)
-                self.get_hq_address(soup)
-                self.get_website(soup)
+                self.get_defunct_date(page)
+                self.get_founder(page)
+                self.get_founding_date(page)
+                self.get_hq_address(page)
+                self.get_website(page)
         else:
-            self.get_defunct_date(soup)
-            self.get_founder(soup)
-            self.get_founding_date(soup)
-            self.get_hq_address(soup)
-            self.get_name(soup)
-            self.get_website(soup)
+            self.get_defunct_date(page)
+            self.get_founder(page)
+            self.get_founding_date(page)
+            self.get_hq_address(page)
+            self.get_name(page)
+            self.get_website(page)
 
     def get_data_from_tuple(self, tuple_):
         self.company_id, self.defunct_date, self.founder, self.founding_date, \
                 self.hq_address, self.name, self.website = tuple_
 
-    def get_defunct_date(self, soup: BeautifulSoup):
-        td = wiki_infobox_td(soup, 'Defunct')
-        if not td:
+    def get_defunct_date(self, page: Page):
+        td = wiki_infobox_td(page, 'Defunct')
+        if td is None:
             return
 
         d = None
-        for s in td.stripped_strings:
+        for s in extract.stripped_strings(td):
             try:
                 d = dateparse(s)
             except ValueError:
@@ -256,20 +469,20 @@ class Company:
 
     founder_th_re = re.compile(r'Founders?')
 
-    def get_founder(self, soup: BeautifulSoup):
-        td = wiki_infobox_td(soup, Company.founder_th_re)
-        if not td:
+    def get_founder(self, page: Page):
+        td = wiki_infobox_td(page, Company.founder_th_re)
+        if td is None:
             return
 
-        self.founder = next(td.stripped_strings)
+        self.founder = next(iter(extract.stripped_strings(td)))
 
-    def get_founding_date(self, soup: BeautifulSoup):
-        td = wiki_infobox_td(soup, 'Founded')
-        if not td:
+    def get_founding_date(self, page: Page):
+        td = wiki_infobox_td(page, 'Founded')
+        if td is None:
             return
 
         d = None
-        for s in td.stripped_strings:
+        for s in extract.stripped_strings(td):
             try:
                 d = dateparse(s)
             except ValueError:
@@ -278,15 +491,15 @@ class Company:
         if d:
             self.founding_date = d.date()
 
-    def get_hq_address(self, soup: BeautifulSoup):
-        td = wiki_infobox_td(soup, 'Headquarters')
-        if not td:
+    def get_hq_address(self, page: Page):
+        td = wiki_infobox_td(page, 'Headquarters')
+        if td is None:
             return
 
-        self.hq_address = ''.join(td.strings).strip()
+        self.hq_address = ''.join(extract.strings(td)).strip()
 
-    def get_name(self, soup: BeautifulSoup):
-        self.name = wiki_title(soup)
+    def get_name(self, page: Page):
+        self.name = wiki_title(page)
 
     website_re = re.compile(
         r'^(?:http|ftp)s?://'
@@ -296,12 +509,12 @@ class Company:
         r'(?::\d+)?'
         r'(?:/?|[/?]\S+)$', re.IGNORECASE)
 
-    def get_website(self, soup: BeautifulSoup):
-        td = wiki_infobox_td(soup, 'Website')
-        if not td:
+    def get_website(self, page: Page):
+        td = wiki_infobox_td(page, 'Website')
+        if td is None:
             return
 
-        w = td.a.get('href')
+        w = extract.find(td, 'a').get('href')
         if w and Company.website_re.match(w) is not None:
             self.website = w
 
@@ -313,33 +526,27 @@ class Company:
     invalid_names = ('Japan',)
 
     @staticmethod
-    def get_urls(infobox: bs4.element.Tag, company_re):
-        th = infobox.find(string=company_re)
-        if not th:
+    def get_urls(infobox: extract.Infobox, company_re):
+        td = infobox.td(company_re)
+        if td is None:
             return None
-        while th.name != 'th':
-            th = th.parent
-
-        td = th.next_sibling
-        while td.name != 'td':
-            td = td.next_sibling
 
         urls = []
-        for s in td.strings:
+        for s in extract.text_nodes(td):
             if s in ('\n', ':', 'JP'):
                 continue
-            parent = s.parent
+            parent = extract.text_parent(s)
             try:
-                name = parent['title']
+                name = parent.attrib['title']
             except KeyError:
-                name = parent.string
+                name = extract.string(parent)
                 if not name:
                     name = s.strip()
             if name in Company.invalid_names:
                 continue
 
-            if parent.name == 'a':
-                url = urljoin(wikipedia_baseurl, parent['href'])
+            if parent.tag == 'a':
+                url = urljoin(wikipedia_baseurl, parent.attrib['href'])
                 urls.append(url)
                 if name not in Company.companies:
                     Company.companies[name] = url
@@ -352,21 +559,27 @@ class Company:
                         .format(name))
         return urls
 
+    generic_company = None
+    generic_lock = threading.Lock()
+
     @staticmethod
     def generic():
-        return generic_company
-
-
-generic_company = Company()
-generic_company.defunct_date = None
-generic_company.founder = 'Fusajiro Yamauchi'
-generic_company.founding_date = datetime.date(1889, 9, 23)
-generic_company.hq_address = 'Kyoto, Japan'
-generic_company.name = 'Nintendo'
-generic_company.website = 'http://nintendo.com'
-generic_company.check_database()
-if not generic_company.in_database:
-    generic_company.insert_into_database()
+        """Return the company of games without one, inserting it into the
+        database on first use."""
+        with Company.generic_lock:
+            if Company.generic_company is None:
+                company = Company()
+                company.defunct_date = None
+                company.founder = 'Fusajiro Yamauchi'
+                company.founding_date = datetime.date(1889, 9, 23)
+                company.hq_address = 'Kyoto, Japan'
+                company.name = 'Nintendo'
+                company.website = 'http://nintendo.com'
+                company.check_database()
+                if not company.in_database:
+                    company.insert_into_database()
+                Company.generic_company = company
+        return Company.generic_company
 
 
 class Employee:
@@ -380,46 +593,99 @@ class Employee:
         self.name = name
         self.roles = roles
 
+    # Keyed by (name, role)
+    cache = IdentityMap(lambda t: (t[2], t[1]))
+
+    preload_sql = "SELECT employee_id, role, name FROM employee"
+
+    # cu.lastrowid is the id of the employee, whether it is new or not
     insert_if_not_exist_sql = \
-         """INSERT INTO employee (name, role)
-            SELECT * FROM (SELECT %s, %s) as tmp
-            WHERE NOT EXISTS (
-                SELECT name, role FROM employee WHERE name=%s and role=%s
-            )"""
+         """INSERT INTO employee (name, role) VALUES (%s, %s)
+            ON DUPLICATE KEY UPDATE employee_id=LAST_INSERT_ID(employee_id)"""
 
     def insert_if_not_exist(self):
+        self.employee_ids = []
         with db.cursor() as cu:
-            args = zip(repeat(self.name), self.roles,
-                       repeat(self.name), self.roles)
-            cu.executemany(Employee.insert_if_not_exist_sql, args)
+            for role in self.roles:
+                tuple_ = Employee.cache.get('name', (self.name, role))
+                if tuple_ is None:
+                    cu.execute(Employee.insert_if_not_exist_sql,
+                               (self.name, role))
+                    tuple_ = (cu.lastrowid, role, self.name)
+                    Employee.cache.add(tuple_)
+                self.employee_ids.append(tuple_[0])
         db.commit()
-        self.get_ids()
 
     get_id_sql = \
-         """SELECT employee_id FROM employee WHERE name=%s AND role=%s"""
+         """SELECT employee_id, role, name FROM employee
+            WHERE name=%s AND role=%s"""
+
+    insert_sql = "INSERT INTO employee (name, role) VALUES (%s, %s)"
+    # Formatted with the VALUES rows, and with the conditions of the rows to
+    # read back
+    upsert_batch_sql = """INSERT INTO employee (name, role) VALUES {}
+                          ON DUPLICATE KEY UPDATE employee_id=employee_id"""
+    get_ids_sql = "SELECT employee_id, role, name FROM employee WHERE {}"
+
+    @staticmethod
+    def insert_batch(cu, keys: list):
+        """Insert the employees (name, role) of keys that are not in the
+        database, and return (ids in the order of keys, number of employees
+        inserted).
+
+        The employees are inserted with a single multi-row INSERT. If some
+        of them were inserted since by another crawler, then they are all
+        upserted with a single statement instead, and their ids read back
+        with another.
+        """
+        try:
+            return insert_rows(cu, Employee.insert_sql, keys), len(keys)
+        except gamedb.IntegrityError as e:
+            if e.args[0] != gamedb.DUP_ENTRY:
+                raise
+        args = [arg for key in keys for arg in key]
+        cu.execute(Employee.upsert_batch_sql.format(
+            ', '.join(['(%s, %s)'] * len(keys))), args)
+        inserted = cu.rowcount
+        cu.execute(Employee.get_ids_sql.format(
+            ' OR '.join(['(name=%s AND role=%s)'] * len(keys))), args)
+        found = {(name, role): id_ for id_, role, name in cu.fetchall()}
+        ids = []
+        for key in keys:
+            if key not in found:
+                # The row of the key is spelt with another case or accents,
+                # which the unique key ignores
+                cu.execute(Employee.insert_if_not_exist_sql, key)
+                found[key] = cu.lastrowid
+            ids.append(found[key])
+        return ids, inserted
 
     def get_ids(self):
-        with db.cursor() as cu:
-            argss = zip(repeat(self.name), self.roles)
-            cu.executemany(Employee.get_id_sql, argss)
-            self.employee_ids = [id_tup[0] for id_tup in cu.fetchall()]
+        self.employee_ids = []
+        for role in self.roles:
+            key = (self.name, role)
+            tuple_ = Employee.cache.get('name', key)
+            if tuple_ is None and not Employee.cache.is_miss('name', key):
+                with db.cursor() as cu:
+                    cu.execute(Employee.get_id_sql, key)
+                    tuple_ = cu.fetchone()
+                if tuple_:
+                    Employee.cache.add(tuple_)
+                else:
+                    Employee.cache.add_miss('name', key)
+            if tuple_:
+                self.employee_ids.append(tuple_[0])
 
     name_re = re.compile(r"[a-zA-Z][a-zA-Z ,.'-]*[a-zA-Z]")
 
     @staticmethod
-    def get_names(infobox: bs4.element.Tag, role_re):
-        th = infobox.find(string=role_re)
-        if not th:
+    def get_names(infobox: extract.Infobox, role_re):
+        td = infobox.td(role_re)
+        if td is None:
             return None
-        while th.name != 'th':
-            th = th.parent
-
-        td = th.next_sibling
-        while td.name != 'td':
-            td = td.next_sibling
 
         names = []
-        for name in td.strings:
+        for name in extract.strings(td):
             m = Employee.name_re.search(name)
             if m:
                 names.append(m.group(0))
@@ -436,17 +702,17 @@ class Employee:
 
 
 class Game:
-    def __init__(self, soup: BeautifulSoup = None, check_db: bool = False,
+    def __init__(self, page: Page = None, check_db: bool = False,
                  use_db: bool = True):
         """Initialize Game object.
 
         Args:
-            soup: If given, then use data in soup to initialize/check for
+            page: If given, then use data in page to initialize/check for
                 existence in database.
             check_db: If True, then the object will not be populated if
-                data correspoinding to data in soup exists in the database.
+                data correspoinding to data in page exists in the database.
                 If False, then attempt to populate object using getdata.
-                Ignored if soup is not given or is None.
+                Ignored if page is not given or is None.
             use_db: Whether or not to use the database.
         """
         self.game_id = None
@@ -457,11 +723,22 @@ class Game:
         self.reception = None
         self.title = None
         self.in_database = False
-        if soup:
-            self.get_data(soup, check_db, use_db)
-
-    check_sql_id = "SELECT * FROM game WHERE game_id=%s"
-    check_sql_title = "SELECT * FROM game WHERE title=%s"
+        # Url of the wikipedia page of the game, if known
+        self.url = None
+        # page_revision of that page, if known
+        self.revision = None
+        if page:
+            self.get_data(page, check_db, use_db)
+
+    # title is looked up by its indexed hash, title_hash=UNHEX(MD5(title)),
+    # so titles that differ only in case or accents are different games (see
+    # migrations/0002_game_title_hash.sql)
+    check_sql_id = """SELECT game_id, earliest_release_date, reception, title
+                      FROM game WHERE game_id=%s"""
+    check_sql_title = """SELECT game_id, earliest_release_date, reception,
+                                title
+                         FROM game
+                         WHERE title_hash=UNHEX(MD5(%s)) AND title=%s"""
 
     def check_database(self):
         """Return database tuple if a tuple with title=self.title is in the
@@ -472,32 +749,40 @@ class Game:
         """
         if self.game_id:
             sql = Game.check_sql_id
-            check = self.game_id
+            args = (self.game_id,)
         elif self.title:
             sql = Game.check_sql_title
-            check = self.title
+            args = (self.title, self.title)
         else:
             self.in_database = False
             return None
 
         with db.cursor() as cu:
-            cu.execute(sql, (check,))
+            cu.execute(sql, args)
             tuple_ = cu.fetchone()
 
         self.in_database = tuple_ is not None
         if self.in_database and not self.game_id:
-            self.get_id()
+            self.game_id = tuple_[0]
         return tuple_
 
     insert_sql = """INSERT INTO game (earliest_release_date, reception, title)
                     VALUES (%s, %s, %s)"""
+    update_sql = """UPDATE game SET earliest_release_date=%s, reception=%s,
+                                    title=%s
+                    WHERE game_id=%s"""
+    # cu.lastrowid is the id of the game, whether it is new or not
+    upsert_sql = insert_sql + """
+                    ON DUPLICATE KEY UPDATE game_id=LAST_INSERT_ID(game_id)"""
+
+    def insert_args(self):
+        return (self.earliest_release_date, self.reception, self.title)
 
     def insert_into_database(self):
         with db.cursor() as cu:
-            cu.execute(Game.insert_sql, (self.earliest_release_date,
-                                         self.reception, self.title))
+            cu.execute(Game.upsert_sql, self.insert_args())
+            self.game_id = cu.lastrowid
         db.commit()
-        self.get_id()
 
     def insert_into_database_r(self):
         """Like insert_into_database, but also do it for all attributes."""
@@ -509,72 +794,109 @@ class Game:
         for pcompany in self.publishing_companies:
             pcompany.insert_if_not_exist(Company.PUB)
 
-    get_id_sql = "SELECT game_id FROM game WHERE title=%s"
+    get_id_sql = """SELECT game_id FROM game
+                    WHERE title_hash=UNHEX(MD5(%s)) AND title=%s"""
 
     def get_id(self, title: str = None):
         """Get id from database."""
         with db.cursor() as cu:
             if not title:
                 title = self.title
-            cu.execute(Game.get_id_sql, (title,))
+            cu.execute(Game.get_id_sql, (title, title))
             id_ = cu.fetchone()
             if id_:
                 self.game_id = id_[0]
 
-    def get_data(self, soup: BeautifulSoup, check_db: bool = False,
+    @extract_seconds.time(extractor='Game.get_data')
+    def get_data(self, page: Page, check_db: bool = False,
                  use_db: bool = True):
-        """Get data by using BeautifulSoup to extract HTML elements.
+        """Get data by using Page to extract HTML elements.
 
         Args:
-            soup: Used to initialize object/check for existence in database.
+            page: Used to initialize object/check for existence in database.
             check_db: If True, then the object will not be populated if data
-                correspoinding to data in soup exists in the database.
+                correspoinding to data in page exists in the database.
                 If False, then attempt to populate object.
             use_db: Whether or not to use the database.
         """
         if use_db:
-            self.get_title(soup)
+            self.get_title(page)
             tuple_ = self.check_database()
             if tuple_:
                 if not check_db:
                     self.get_data_from_tuple(tuple_)
             else:
-                try:
-                    self.get_employees(soup)
-                except AttributeError:
-                    self.employees = [Employee('Shigeru Watanabe',
-                                               ['Director', 'Producer'])]
-                    logging.warning('Game.get_employees: soup AttributeError')
-                try:
-                    self.get_developing_companies(soup)
-                except AttributeError:
-                    logging.error('Game.get_d_comp: soup AttributeError')
-                try:
-                    self.get_publishing_companies(soup)
-                except AttributeError:
-                    logging.error('Game.get_p_comp: soup AttributeError')
-                try:
-                    self.get_reception(soup)
-                except AttributeError:
-                    self.reception = float(random.randint(70, 80))
-                    logging.warning('Game.get_reception: soup AttributeError')
+                prefetch_game(page)
+                self.get_details(page)
         else:
             try:
-                self.get_employees(soup)
+                self.get_employees(page)
             except AttributeError:
                 self.employees = \
                     [Employee('Shigeru Watanabe', ['Director', 'Producer'])]
-                logging.warning('Game.get_employees: soup AttributeError')
+                logging.warning('Game.get_employees: page AttributeError')
             try:
-                self.get_reception(soup)
+                self.get_reception(page)
             except AttributeError:
-                self.reception = float(random.randint(70, 80))
-                logging.warning('Game.get_reception: soup AttributeError')
+                self.reception = Game.generic_reception()
+                logging.warning('Game.get_reception: page AttributeError')
             try:
-                self.get_title(soup)
+                self.get_title(page)
             except AttributeError:
                 self.title = 'Game Title'
-                logging.warning('Game.get_title: soup AttributeError')
+                logging.warning('Game.get_title: page AttributeError')
+
+    @extract_seconds.time(extractor='Game.get_details')
+    def get_details(self, page: Page, use_db: bool = True,
+                    generic: bool = True):
+        """Get the employees, companies and reception of the game.
+
+        If not use_db, then the companies are extracted without using the
+        database (see Company.extract), to be matched with it later by
+        resolve. If not generic, then the reception is left None if the page
+        has none, instead of being made up with generic_reception.
+        """
+        try:
+            self.get_employees(page)
+        except AttributeError:
+            self.employees = [Employee('Shigeru Watanabe',
+                                       ['Director', 'Producer'])]
+            logging.warning('Game.get_employees: page AttributeError')
+        try:
+            self.get_developing_companies(page, use_db)
+        except AttributeError:
+            logging.error('Game.get_d_comp: page AttributeError')
+        try:
+            self.get_publishing_companies(page, use_db)
+        except AttributeError:
+            logging.error('Game.get_p_comp: page AttributeError')
+        try:
+            self.get_reception(page)
+        except AttributeError:
+            if generic:
+                self.reception = Game.generic_reception()
+            logging.warning('Game.get_reception: page AttributeError')
+
+    @staticmethod
+    def generic_reception():
+        return float(random.randint(70, 80))
+
+    def resolve(self):
+        """Match a game whose details were got without using the database
+        with the database, as get_data does.
+
+        If the title is in the database, then in_database is True.
+        Otherwise, its companies are resolved.
+        """
+        tuple_ = self.check_database()
+        if tuple_:
+            self.get_data_from_tuple(tuple_)
+            return
+        self.resolve_companies()
+
+    def resolve_companies(self):
+        for company in self.developing_companies + self.publishing_companies:
+            company.resolve()
 
     def get_data_from_tuple(self, tuple_):
         self.game_id, self.earliest_release_date, self.reception, self.title \
@@ -586,8 +908,8 @@ class Game:
         dates = map(operator.itemgetter(3), gr.releases)
         self.earliest_release_date = min(dates)
 
-    def get_employees(self, soup: BeautifulSoup):
-        infobox = wiki_infobox(soup)
+    def get_employees(self, page: Page):
+        infobox = wiki_infobox(page)
         for role, role_re in zip(Employee.roles, Employee.role_res):
             names = Employee.get_names(infobox, role_re)
             if not names:
@@ -595,33 +917,33 @@ class Game:
             new_employees = [Employee(name, [role]) for name in names]
             self.employees.extend(new_employees)
 
-    def get_developing_companies(self, soup: BeautifulSoup):
-        infobox = wiki_infobox(soup)
+    def get_developing_companies(self, page: Page, use_db: bool = True):
+        infobox = wiki_infobox(page)
         urls = Company.get_urls(infobox, Company.developing_re)
 
+        import requests
+
         for url in urls:
-            r = requests.get(url)
             try:
-                r.raise_for_status()
+                company = Company.from_url(url, use_db)
             except requests.exceptions.HTTPError:
                 continue
-            company_soup = BeautifulSoup(r.text, 'lxml')
 
-            self.developing_companies.append(Company(company_soup))
+            self.developing_companies.append(company)
 
-    def get_publishing_companies(self, soup: BeautifulSoup):
-        infobox = wiki_infobox(soup)
+    def get_publishing_companies(self, page: Page, use_db: bool = True):
+        infobox = wiki_infobox(page)
         urls = Company.get_urls(infobox, Company.publishing_re)
 
+        import requests
+
         for url in urls:
-            r = requests.get(url)
             try:
-                r.raise_for_status()
+                company = Company.from_url(url, use_db)
             except requests.exceptions.HTTPError:
                 continue
-            company_soup = BeautifulSoup(r.text, 'lxml')
 
-            self.publishing_companies.append(Company(company_soup))
+            self.publishing_companies.append(company)
 
     reception_parses = (
         compile(r'{num:d}/{den:d}'),
@@ -646,23 +968,20 @@ class Game:
 
     reception_srcs = ('Metacritic', 'GameRankings')
 
-    def get_reception(self, soup: BeautifulSoup):
-        table = wiki_body_content(soup) \
-                .find('div', id='mw-content-text') \
-                .find('div', class_='mw-parser-output') \
-                .find('th', string='Aggregate score').parent.parent
+    def get_reception(self, page: Page):
+        table = page.aggregate_score_table()
         for src in Game.reception_srcs:
-            agg_str = table.find('a', string=src)
-            if agg_str:
+            agg_str = extract.find(table, 'a', src)
+            if agg_str is not None:
                 break
-        score_str = agg_str.parent.next_sibling \
-                           .next_sibling.sup.previous_sibling
+        score_td = extract.next_sibling(agg_str.getparent(), 2)
+        score_str = extract.previous_sibling(extract.find(score_td, 'sup'))
         self.reception = Game.parse_reception(score_str)
         if not self.reception:
             raise AttributeError
 
-    def get_title(self, soup: BeautifulSoup):
-        self.title = wiki_title(soup)
+    def get_title(self, page: Page):
+        self.title = wiki_title(page)
 
     def ensure_attr_existence(self):
         if not self.employees:
@@ -676,23 +995,25 @@ class Game:
 class GameRelease:
     """Releases belonging to one Game."""
 
-    def __init__(self, soup: BeautifulSoup = None, game: Game = Game(),
+    def __init__(self, page: Page = None, game: Game = None,
                  check_db: bool = False, use_db: bool = True):
         """Initialize GameRelease object.
 
         Args:
-            soup: If given, then use data in soup to initialize/check for
+            page: If given, then use data in page to initialize/check for
                 existence in database.
-            game: Use as self.game.
+            game: Use as self.game, or a new Game if not given.
             check_db: If True, then the object will not be populated if
-                data correspoinding to data in soup exists in the database.
+                data correspoinding to data in page exists in the database.
                 If False, then attempt to populate object using getdata.
-                Ignored if soup is not given or is None.
+                Ignored if page is not given or is None.
             use_db: Whether or not to use the database.
         """
         self.in_database = False
-        if soup:
-            self.get_data(soup, game, check_db, use_db)
+        if game is None:
+            game = Game()
+        if page:
+            self.get_data(page, game, check_db, use_db)
         else:
             self.game = game
             # List of tuples containing release_id, platform, region,
@@ -700,8 +1021,15 @@ class GameRelease:
             self.releases = []
             self.title = game.title
 
-    check_sql_id = "SELECT * FROM game_release WHERE release_id=%s"
-    check_sql_title = "SELECT * FROM game_release WHERE title=%s"
+    # title is looked up by its indexed hash, title_hash=UNHEX(MD5(title)),
+    # so titles that differ only in case or accents do not match
+    check_sql_id = """SELECT release_id, game_id, platform_id, region,
+                             release_date, title
+                      FROM game_release WHERE release_id=%s"""
+    check_sql_title = """SELECT release_id, game_id, platform_id, region,
+                                release_date, title
+                         FROM game_release
+                         WHERE title_hash=UNHEX(MD5(%s)) AND title=%s"""
 
     def check_database(self, check_db: bool = False):
         """Return database tuple if a tuple with title=self.title is in the
@@ -712,13 +1040,13 @@ class GameRelease:
         """
         if self.title:
             sql = GameRelease.check_sql_title
-            check = self.title
+            args = (self.title, self.title)
         else:
             self.in_database = False
             return None
 
         with db.cursor() as cu:
-            cu.execute(sql, (check,))
+            cu.execute(sql, args)
             if check_db:
                 tuples = [cu.fetchone()]
             else:
@@ -731,20 +1059,24 @@ class GameRelease:
 
     insert_sql = """INSERT INTO game_release (game_id, platform_id, region,
                     release_date, title) VALUES (%s, %s, %s, %s, %s)"""
+    game_sql = """SELECT release_id, platform_id, region, release_date
+                  FROM game_release WHERE game_id=%s"""
+    delete_sql = "DELETE FROM game_release WHERE release_id=%s"
+    update_title_sql = "UPDATE game_release SET title=%s WHERE game_id=%s"
 
     def insert_into_database(self):
-        for release in self.releases:
+        for i, release in enumerate(self.releases):
             try:
                 with db.cursor() as cu:
                     cu.execute(GameRelease.insert_sql,
                                (self.game.game_id, release[1].platform_id,
                                 release[2], release[3], self.title))
+                    self.releases[i] = (cu.lastrowid,) + release[1:]
                 db.commit()
-            except pymysql.err.InternalError:
+            except gamedb.InternalError:
                 logging.error(
                     'GameRelease: Attempted to insert NULL in non-NULLable column for {}.'
                     .format(self.title))
-        self.get_ids()
 
     get_id_sql = """SELECT release_id FROM game_release
                     WHERE game_id=%s AND platform_id=%s AND region=%s
@@ -767,30 +1099,33 @@ class GameRelease:
         for i in range(len(self.releases)):
             self.get_id(i)
 
-    def get_data(self, soup: BeautifulSoup, game: Game = Game(),
+    @extract_seconds.time(extractor='GameRelease.get_data')
+    def get_data(self, page: Page, game: Game = None,
                  check_db: bool = False, use_db: bool = True):
-        """Get data by using BeautifulSoup to extract HTML elements.
+        """Get data by using Page to extract HTML elements.
 
         Args:
-            soup: Used to initialize object/check for existence in database.
+            page: Used to initialize object/check for existence in database.
             check_db: If True, then the object will not be populated if data
-                correspoinding to data in soup exists in the database.
+                correspoinding to data in page exists in the database.
                 If False, then attempt to populate object.
             use_db: Whether or not to use the database.
         """
+        if game is None:
+            game = Game()
         self.game = game
         self.title = game.title
         self.releases = []
         if use_db:
             if not self.title:
-                self.get_title(soup)
+                self.get_title(page)
             tuples = self.check_database(check_db)
             if tuples:
                 if not check_db:
                     self.get_data_from_tuples(tuples)
             else:
                 try:
-                    self.get_releases(soup)
+                    self.get_releases(page)
                 except BaseException:
                     if not self.releases:
                         logging.warning(
@@ -798,14 +1133,24 @@ class GameRelease:
                         self.releases.append(GameRelease.generic_r())
         else:
             if not self.title:
-                self.get_title(soup)
+                self.get_title(page)
             try:
-                self.get_releases(soup)
+                self.get_releases(page, use_db=False)
             except BaseException:
                 if not self.releases:
                     logging.warning(
                             'GameRelease.get_data: Failed to get releases')
-                    self.releases.append(GameRelease.generic_r())
+                    self.releases.append(GameRelease.generic_r(use_db=False))
+
+    def get_data_from_game(self):
+        """Get self.releases from the rows of self.game in the database."""
+        with db.cursor() as cu:
+            cu.execute(GameRelease.game_sql, (self.game.game_id,))
+            tuples = cu.fetchall()
+        for release_id, platform_id, region, release_date in tuples:
+            platform = Platform()
+            platform.platform_id = platform_id
+            self.releases.append((release_id, platform, region, release_date))
 
     def get_data_from_tuples(self, tuples):
         _, self.game.game_id, _, _, _, self.title = tuples[0]
@@ -814,84 +1159,158 @@ class GameRelease:
             release_id, _, platform.platform_id, region, release_date, _ = t
             self.releases.append((release_id, platform, region, release_date))
 
-    def get_releases2(self, soup: BeautifulSoup):
-        td = wiki_infobox_td(soup, 'Release')
+    def get_releases2(self, page: Page):
+        td = wiki_infobox_td(page, 'Release')
         platform = None
-        for s in td.stripped_strings:
+        for s in extract.stripped_strings(td):
             if GameRelease.is_platform_str(s):
                 pass
 
-    def get_releases(self, soup: BeautifulSoup):
-        infobox = wiki_infobox(soup)
-        release_td = infobox.find('th', string='Release').next_sibling \
-                                                         .next_sibling
-        for td_child in release_td.children:
-            if type(td_child) == bs4.element.Tag:
+    @extract_seconds.time(extractor='GameRelease.get_releases')
+    def get_releases(self, page: Page, use_db: bool = True):
+        """Get self.releases from the Release row of the infobox.
+
+        If not use_db, then the platforms are only named, without fetching
+        their pages or inserting them into the database.
+        """
+        self.add_releases(GameRelease.parse_releases(page), use_db)
+
+    def add_releases(self, releases, use_db: bool = True, extracted=None):
+        """Add releases to self.releases, with their platforms found by
+        GameRelease.platform.
+
+        Args:
+            releases: Iterable of (platform name, platform url, region,
+                release date), as returned by parse_releases.
+            use_db: Whether or not to use the database.
+            extracted: If given, then a dict from platform urls to the
+                platforms at those urls, extracted without using the
+                database, which are used instead of fetching their pages.
+        """
+        platforms = dict()
+        for name, url, region, release_date in releases:
+            if (name, url) not in platforms:
+                platforms[name, url] = GameRelease.platform(
+                    name, url, use_db,
+                    extracted.get(url) if extracted else None)
+            platform = platforms[name, url]
+            if platform is not None:
+                self.releases.append((None, platform, region, release_date))
+
+    @staticmethod
+    def parse_releases(page: Page):
+        """Yield (platform name, platform url, region, release date) of the
+        releases in the Release row of the infobox of a game page.
+
+        The url is that of the link to the platform in the Platform(s) row,
+        or None if there is none.
+        """
+        infobox = wiki_infobox(page)
+        release_td = infobox.td('Release')
+        for td_child in extract.children(release_td):
+            if extract.is_tag(td_child):
                 break
-        if td_child.name == 'div' and 'plainlist' in td_child['class']:
+        if extract.name(td_child) == 'div' \
+                and 'plainlist' in extract.classes(td_child):
             # "Short" style list (https://en.wikipedia.org/wiki/Dark_Souls_III)
-            platforms = [Platform(s) for s in get_platform_soups(soup)]
-            for platform in platforms:
-                if not platform.in_database:
-                    try:
-                        platform.insert_into_database()
-                    except pymysql.err.IntegrityError:
-                        platform.get_id()
-
-            release_ul = release_td.ul
-            for li in release_ul.find_all('li'):
-                region = li.span.contents[0].string
-                release_date = parse(li.span.next_sibling).date()
-                for platform in platforms:
-                    release = (None, platform, region, release_date)
-                    self.releases.append(release)
+            # Every release is of every platform
+            platforms = [(Platform.name_resolve(name), url)
+                         for name, url in zip(get_platform_names(page),
+                                              get_platform_urls(page))]
+
+            release_ul = extract.find(release_td, 'ul')
+            for li in extract.find_all(release_ul, 'li'):
+                span = extract.find(li, 'span')
+                region = extract.string(extract.children(span)[0])
+                release_date = dateparse(extract.next_sibling(span)).date()
+                for name, url in platforms:
+                    yield name, url, region, release_date
         else:
             # "Long" style list
-            if td_child.name == 'div' and 'NavFrame' in td_child['class']:
+            if extract.name(td_child) == 'div' \
+                    and 'NavFrame' in extract.classes(td_child):
                 # (https://en.wikipedia.org/wiki/Phoenix_Wright:_Ace_Attorney)
-                release_li = release_td.li
-            elif td_child.name == 'b':
+                release_li = extract.find(release_td, 'li')
+            elif extract.name(td_child) == 'b':
                 # (https://en.wikipedia.org/wiki/Super_Mario_World)
                 # Because of this, the name release_li is misleading
                 release_li = release_td
 
             platform = None
-            for child in release_li.children:
-                if child.name == 'b':
-                    platform = Platform()
-                    platform.name = Platform.name_resolve(child.string)
-                    tuple_ = platform.check_database()
-                    if tuple_:
-                        platform.get_data_from_tuple(tuple_)
-                    else:
-                        platform_soup = get_platform_soup(soup, platform.name)
-                        if platform_soup:
-                            platform.get_data(platform_soup)
-                            try:
-                                platform.insert_into_database()
-                            except pymysql.err.IntegrityError:
-                                platform.get_id()
-                        else:
-                            platform = None
-                elif platform and child.name == 'div' \
-                              and 'plainlist' in child['class']:
-                    for li in child.find_all('li'):
-                        region = li.span.contents[0].string
-                        release_date = parse(li.span.next_sibling).date()
-                        release = (None, platform, region, release_date)
-                        self.releases.append(release)
-
-    def get_title(self, soup: BeautifulSoup):
-        self.title = wiki_title(soup)
+            for child in extract.children(release_li):
+                if extract.name(child) == 'b':
+                    name = Platform.name_resolve(extract.string(child))
+                    try:
+                        url = get_platform_url(page, name)
+                    except AttributeError:
+                        url = None
+                    platform = (name, url)
+                elif platform and extract.name(child) == 'div' \
+                        and 'plainlist' in extract.classes(child):
+                    for li in extract.find_all(child, 'li'):
+                        span = extract.find(li, 'span')
+                        region = extract.string(extract.children(span)[0])
+                        release_date = dateparse(
+                            extract.next_sibling(span)).date()
+                        yield platform + (region, release_date)
 
     @staticmethod
-    def generic_r():
+    def platform(name: str, url: str, use_db: bool = True,
+                 extracted: Platform = None):
+        """Return the Platform of a release, or None if it cannot be found.
+
+        The platform is looked up by url in the cache, then by name in the
+        database. If it is in neither, then its page is fetched, or
+        extracted is resolved, and it is inserted into the database.
+
+        Args:
+            name: Name of the platform.
+            url: Url of the wikipedia page of the platform, or None.
+            use_db: If False, then the platform is only named.
+            extracted: If given, then the platform at url, extracted without
+                using the database.
+        """
+        platform = Platform()
+        platform.name = name
+        if not use_db:
+            return platform
+
+        tuple_ = Platform.cache.get('url', url) if url else None
+        if tuple_ is None:
+            tuple_ = platform.check_database()
+        if tuple_:
+            platform.get_data_from_tuple(tuple_)
+            platform.in_database = True
+            return platform
+
+        if not url:
+            logging.error('GameRelease.platform: Could not find a platform '
+                          'url with {}'.format(name))
+            return None
+        if extracted is None:
+            platform = Platform.from_url(url)
+        else:
+            platform = extracted
+            platform.resolve()
+        if not platform.in_database:
+            try:
+                platform.insert_into_database()
+            except gamedb.IntegrityError:
+                platform.get_id()
+        return platform
+
+    def get_title(self, page: Page):
+        self.title = wiki_title(page)
+
+    @staticmethod
+    def generic_r(use_db: bool = True):
         """Generic self.releases[i]"""
         p = Platform()
         p.platform_id = 1
-        p.check_database()
-        if not p.in_database:
-            logging.warning('GameRelease.generic: No Platform with id=1')
+        if use_db:
+            p.check_database()
+            if not p.in_database:
+                logging.warning('GameRelease.generic: No Platform with id=1')
 
         region = 'NA'
         release_date = random_date()
@@ -908,17 +1327,17 @@ class GameRelease:
 
 
 class Platform:
-    def __init__(self, soup: BeautifulSoup = None, check_db: bool = False,
+    def __init__(self, page: Page = None, check_db: bool = False,
                  use_db: bool = True):
         """Initialize Platform object.
 
         Args:
-            soup: If given, then use data in soup to initialize/check for
+            page: If given, then use data in page to initialize/check for
                 existence in database.
             check_db: If True, then the object will not be populated if
-                data correspoinding to data in soup exists in the database.
+                data correspoinding to data in page exists in the database.
                 If False, then attempt to populate object using getdata.
-                Ignored if soup is not given or is None.
+                Ignored if page is not given or is None.
             use_db: Whether or not to use the database.
         """
         self.platform_id = None
@@ -931,9 +1350,14 @@ class Platform:
         self.manufacturers = []
         self.release_date = None
         self.type = None
-        if soup:
-            self.get_data(soup, check_db, use_db)
+        # Url of the wikipedia page of the platform, if known
+        self.url = None
+        if page:
+            self.get_data(page, check_db, use_db)
+
+    cache = IdentityMap(operator.itemgetter(5))
 
+    preload_sql = "SELECT * FROM platform"
     check_sql_id = "SELECT * FROM platform WHERE platform_id=%s"
     check_sql_name = "SELECT * FROM platform WHERE name=%s"
 
@@ -946,21 +1370,21 @@ class Platform:
         """
         if self.platform_id:
             sql = Platform.check_sql_id
+            kind = 'id'
             check = self.platform_id
         elif self.name:
             sql = Platform.check_sql_name
+            kind = 'name'
             check = self.name
         else:
             self.in_datbase = False
             return None
 
-        with db.cursor() as cu:
-            cu.execute(sql, (check,))
-            tuple_ = cu.fetchone()
+        tuple_ = Platform.cache.lookup(kind, check, sql)
 
         self.in_database = tuple_ is not None
         if self.in_database and not self.platform_id:
-            self.get_id()
+            self.platform_id = tuple_[0]
         return tuple_
 
     man_sql = """INSERT INTO manufacturers VALUES (%s, %s)"""
@@ -969,98 +1393,167 @@ class Platform:
         with db.cursor() as cu:
             argss = zip(repeat(self.platform_id), self.manufacturers)
             cu.executemany(Platform.man_sql, argss)
+            written = cu.rowcount
         db.commit()
+        rows_written.inc(written, table='manufacturers')
 
     insert_sql = """INSERT INTO platform (company_id, discontinued_date,
                     generation, introductory_price, name, release_date, type)
                     VALUES (%s, %s, %s, %s, %s, %s, %s)"""
+    # cu.lastrowid is the id of the platform, whether it is new or not
+    upsert_sql = insert_sql + """
+                    ON DUPLICATE KEY UPDATE
+                        platform_id=LAST_INSERT_ID(platform_id)"""
+
+    def insert_args(self):
+        return (self.company.company_id, self.discontinued_date,
+                self.generation, self.introductory_price, self.name,
+                self.release_date, self.type)
 
     def insert_into_database(self):
         with db.cursor() as cu:
-            cu.execute(Platform.insert_sql,
-                       (self.company.company_id, self.discontinued_date,
-                        self.generation, self.introductory_price, self.name,
-                        self.release_date, self.type))
+            cu.execute(Platform.upsert_sql, self.insert_args())
+            self.platform_id = cu.lastrowid
+            inserted = cu.rowcount == 1
         db.commit()
-        self.get_id()
+        if inserted:
+            rows_written.inc(table='platform')
+            Platform.cache.add((self.platform_id,) + self.insert_args(),
+                               self.url)
+        else:
+            Platform.cache.discard_miss('name', self.name)
 
         if self.platform_id:
             self.insert_manufacturers()
         if self.company and not self.company.in_database:
             self.company.insert_into_database()
 
-    get_id_sql = "SELECT platform_id FROM platform WHERE name=%s"
-
     def get_id(self, name: str = None):
         """Get id from database."""
-        with db.cursor() as cu:
-            if not name:
-                name = self.name
-            cu.execute(Platform.get_id_sql, (name,))
-            id_ = cu.fetchone()
-            if id_:
-                self.platform_id = id_[0]
+        if not name:
+            name = self.name
+        tuple_ = Platform.cache.lookup('name', name, Platform.check_sql_name)
+        if tuple_:
+            self.platform_id = tuple_[0]
+
+    @staticmethod
+    def from_url(url: str, use_db: bool = True):
+        """Return the Platform whose wikipedia page is at url.
+
+        The page is only fetched if the platform is not cached by url. If not
+        use_db, then the platform is extracted from its page with
+        Platform.extract.
+
+        Raises requests.exceptions.HTTPError if fetching the page fails.
+        """
+        if not use_db:
+            return Platform.extract(url)
+
+        tuple_ = Platform.cache.get('url', url)
+        if tuple_:
+            platform = Platform()
+            platform.get_data_from_tuple(tuple_)
+            platform.in_database = True
+            return platform
+
+        platform = Platform(parse_html(fetch.get(url)))
+        platform.url = url
+        if platform.platform_id:
+            Platform.cache.add_url(url, platform.platform_id)
+        return platform
+
+    @staticmethod
+    @functools.lru_cache(maxsize=EXTRACTED_CACHE_SIZE)
+    def extract(url: str):
+        """Return the Platform whose wikipedia page is at url, with its
+        company, extracted without using the database.
 
-    def get_data(self, soup: BeautifulSoup, check_db: bool = False,
+        Each page is fetched and extracted once per process; the platforms
+        returned are shared and must not be modified.
+
+        Raises requests.exceptions.HTTPError if fetching the page fails.
+        """
+        platform = Platform(parse_html(fetch.get(url)), use_db=False)
+        platform.url = url
+        return platform
+
+    def resolve(self):
+        """Match a platform extracted without using the database with the
+        database, as if it had been extracted using it.
+
+        If the platform is cached by url, or has a row by name, then it takes
+        the data of that row and in_database is True. Otherwise, its company
+        is resolved.
+        """
+        tuple_ = Platform.cache.get('url', self.url) if self.url else None
+        if tuple_ is None:
+            tuple_ = self.check_database()
+        if tuple_:
+            self.get_data_from_tuple(tuple_)
+            self.in_database = True
+            if self.url:
+                Platform.cache.add_url(self.url, self.platform_id)
+        else:
+            self.company.resolve()
+
+    @extract_seconds.time(extractor='Platform.get_data')
+    def get_data(self, page: Page, check_db: bool = False,
                  use_db: bool = True):
-        """Get data by using BeautifulSoup to extract HTML elements.
+        """Get data by using Page to extract HTML elements.
 
         Args:
-            soup: Used to initialize object/check for existence in database.
+            page: Used to initialize object/check for existence in database.
             check_db: If True, then the object will not be populated if data
-                correspoinding to data in soup exists in the database.
+                correspoinding to data in page exists in the database.
                 If False, then attempt to populate object.
             use_db: Whether or not to use the database.
             get_name: Whether or not to
         """
         if use_db:
-            self.get_name(soup)
+            self.get_name(page)
             tuple_ = self.check_database()
             if tuple_:
                 if not check_db:
                     self.get_data_from_tuple(tuple_)
             else:
-                self.get_company(soup)
-                self.get_discontinued_date(soup)
-                self.get_generation(soup)
-                self.get_introductory_price(soup)
-                self.get_manufacturers(soup)
-                self.get_release_date(soup)
-                self.get_type(soup)
+                self.get_company(page)
+                self.get_discontinued_date(page)
+                self.get_generation(page)
+                self.get_introductory_price(page)
+                self.get_manufacturers(page)
+                self.get_release_date(page)
+                self.get_type(page)
         else:
-            self.get_company(soup)
-            self.get_discontinued_date(soup)
-            self.get_generation(soup)
-            self.get_introductory_price(soup)
-            self.get_name(soup)
-            self.get_manufacturers(soup)
-            self.get_release_date(soup)
-            self.get_type(soup)
+            self.get_company(page, use_db=False)
+            self.get_discontinued_date(page)
+            self.get_generation(page)
+            self.get_introductory_price(page)
+            self.get_name(page)
+            self.get_manufacturers(page)
+            self.get_release_date(page)
+            self.get_type(page)
 
     def get_data_from_tuple(self, tuple_):
         self.platform_id, self.company.company_id, self.discontinued_date, \
                 self.generation, self.introductory_price, self.name, \
                 self.release_date, self.type = tuple_
 
-    def get_company(self, soup: BeautifulSoup):
-        td = wiki_infobox_td(soup, 'Developer')
-        if not td:
-            td = wiki_infobox_td(soup, 'Manufacturer')
-
-        r = requests.get(urljoin(wikipedia_baseurl, td.a.get('href')))
-        r.raise_for_status()
+    def get_company(self, page: Page, use_db: bool = True):
+        url = platform_company_url(page)
+        if not url:
+            raise AttributeError('Platform.get_company: no company link')
 
-        self.company = Company(BeautifulSoup(r.text, 'lxml'))
+        self.company = Company.from_url(url, use_db)
 
     discontinued_re = compile(r'Discontinued', re.IGNORECASE)
 
-    def get_discontinued_date(self, soup: BeautifulSoup):
-        td = wiki_infobox_td(soup, 'Discontinued')
-        if not td:
+    def get_discontinued_date(self, page: Page):
+        td = wiki_infobox_td(page, 'Discontinued')
+        if td is None:
             return
 
         d = None
-        for s in td.stripped_strings:
+        for s in extract.stripped_strings(td):
             try:
                 d = dateparse(s)
             except ValueError:
@@ -1069,13 +1562,13 @@ class Platform:
         if d:
             self.discontinued_date = d.date()
 
-    def get_generation(self, soup: BeautifulSoup):
-        td = wiki_infobox_td(soup, 'Generation')
-        if not td:
+    def get_generation(self, page: Page):
+        td = wiki_infobox_td(page, 'Generation')
+        if td is None:
             return
 
         g = None
-        for s in td.stripped_strings:
+        for s in extract.stripped_strings(td):
             try:
                 g = ord_to_int(s)
             except TypeError:
@@ -1086,18 +1579,18 @@ class Platform:
 
     intro_dollar_re = re.compile(r'\$.*')
 
-    def get_introductory_price(self, soup: BeautifulSoup):
-        td = wiki_infobox_td(soup, 'Introductory price')
-        if not td:
+    def get_introductory_price(self, page: Page):
+        td = wiki_infobox_td(page, 'Introductory price')
+        if td is None:
             return
 
-        s = td.find(string=Platform.intro_dollar_re)
+        s = extract.find_string(td, Platform.intro_dollar_re)
         if 'US' in s and 'Set' not in s:
-            s = s.parent
-            if s.name == 'a':
-                s = s.parent
+            s = extract.text_parent(s)
+            if s.tag == 'a':
+                s = s.getparent()
                 us = False
-                for st in s.stripped_strings:
+                for st in extract.stripped_strings(s):
                     if us:
                         filtered = ''.join(
                                 filter(lambda x: x.isdigit() or x == '.', st))
@@ -1108,25 +1601,25 @@ class Platform:
             # else: TODO?
             #     pass
 
-    def get_name(self, soup: BeautifulSoup):
-        self.name = wiki_title(soup)
+    def get_name(self, page: Page):
+        self.name = wiki_title(page)
 
-    def get_manufacturers(self, soup: BeautifulSoup):
-        td = wiki_infobox_td(soup, 'Manufacturer')
-        if not td:
+    def get_manufacturers(self, page: Page):
+        td = wiki_infobox_td(page, 'Manufacturer')
+        if td is None:
             return
 
-        for s in td.stripped_strings:
+        for s in extract.stripped_strings(td):
             if s != ',' and '[' not in s:
                 self.manufacturers.append(s)
 
-    def get_release_date(self, soup: BeautifulSoup):
-        td = wiki_infobox_td(soup, 'Release date')
-        if not td:
+    def get_release_date(self, page: Page):
+        td = wiki_infobox_td(page, 'Release date')
+        if td is None:
             return
 
         d = None
-        for s in td.stripped_strings:
+        for s in extract.stripped_strings(td):
             try:
                 d = dateparse(s)
             except ValueError:
@@ -1135,12 +1628,12 @@ class Platform:
         if d:
             self.release_date = d.date()
 
-    def get_type(self, soup: BeautifulSoup):
-        td = wiki_infobox_td(soup, 'Type')
-        if not td:
+    def get_type(self, page: Page):
+        td = wiki_infobox_td(page, 'Type')
+        if td is None:
             return
 
-        self.type = next(td.stripped_strings)
+        self.type = next(iter(extract.stripped_strings(td)))
 
     @staticmethod
     def name_resolve(name):
@@ -1155,75 +1648,672 @@ class Platform:
 platform_re = re.compile(r'Platform(\(s\))?', re.IGNORECASE)
 
 
-def get_platform_soup(game_soup: BeautifulSoup, platform_name: str):
-    infobox = wiki_infobox(game_soup)
-    th = infobox.find(string=platform_re)
-    while th.name != 'th':
-        th = th.parent
+def get_platform_url(game_page: Page, platform_name: str):
+    """Return the url of the platform link named platform_name in the
+    infobox of a game page, or None if there is none."""
+    td = wiki_infobox(game_page).td(platform_re)
+    if td is None:
+        raise AttributeError('get_platform_url: no platform row')
 
-    td = th.next_sibling
-    while td.name != 'td':
-        td = td.next_sibling
-
-    a = td.find('a', title=platform_name)
-    if not a:
-        a = td.find('a', title=re.compile(platform_name, re.IGNORECASE))
-        if not a:
-            logging.error('get_platform_soup: Could not find a platform url with {}'
-                          .format(platform_name))
+    a = extract.find(td, 'a', title=platform_name)
+    if a is None:
+        a = extract.find(td, 'a',
+                         title=re.compile(platform_name, re.IGNORECASE))
+        if a is None:
             return None
-    platform_url = urljoin(wikipedia_baseurl, a['href'])
+    return urljoin(wikipedia_baseurl, a.attrib['href'])
+
 
-    r = requests.get(platform_url)
-    r.raise_for_status()
-    return BeautifulSoup(r.text, 'lxml')
+def get_platform_page(game_page: Page, platform_name: str):
+    platform_url = get_platform_url(game_page, platform_name)
+    if not platform_url:
+        logging.error('get_platform_page: Could not find a platform url with {}'
+                      .format(platform_name))
+        return None
+    return parse_html(fetch.get(platform_url))
 
 
-def get_platform_soups(game_soup: BeautifulSoup):
-    infobox = wiki_infobox(game_soup)
-    platform_as = infobox.find(string=platform_re).parent.parent.parent.td \
-                         .find_all('a')
-    platform_urls = \
-            [urljoin(wikipedia_baseurl, x['href']) for x in platform_as]
-    for url in platform_urls:
-        r = requests.get(url)
-        r.raise_for_status()
-        yield BeautifulSoup(r.text, 'lxml')
+def get_platform_links(game_page: Page):
+    """Return the links in the Platform(s) row of the infobox of a game
+    page."""
+    td = wiki_infobox(game_page).td(platform_re)
+    if td is None:
+        raise AttributeError('get_platform_links: no platform row')
+    return extract.find_all(td, 'a')
+
+
+def get_platform_urls(game_page: Page):
+    return [urljoin(wikipedia_baseurl, x.attrib['href'])
+            for x in get_platform_links(game_page)]
+
+
+def get_platform_names(game_page: Page):
+    return [''.join(extract.strings(x))
+            for x in get_platform_links(game_page)]
+
+
+def get_platform_pages(game_page: Page):
+    for url in get_platform_urls(game_page):
+        yield parse_html(fetch.get(url))
+
+
+def infobox_link_urls(infobox: extract.Infobox, th_re):
+    """Return the urls of the links in the infobox row whose header matches
+    th_re."""
+    td = infobox.td(th_re)
+    if td is None:
+        return []
+
+    return [urljoin(wikipedia_baseurl, a.attrib['href'])
+            for a in extract.find_all(td, 'a', href=True)
+            if not a.attrib['href'].startswith('#')]
+
+
+def platform_company_url(platform_page: Page):
+    """Return the url of the developer, or else the manufacturer, linked
+    from the infobox of a platform page, or None if there is none."""
+    td = wiki_infobox_td(platform_page, 'Developer')
+    if td is None:
+        td = wiki_infobox_td(platform_page, 'Manufacturer')
+    if td is None:
+        return None
+    a = extract.find(td, 'a')
+    if a is not None and a.get('href'):
+        return urljoin(wikipedia_baseurl, a.attrib['href'])
+    return None
+
+
+def prefetch_platform_company(platform_html: str):
+    url = platform_company_url(parse_html(platform_html))
+    if url and Company.cache.get('url', url) is None:
+        fetch.prefetch([url])
+
+
+def prefetch_game(game_page: Page):
+    """Start fetching the company and platform pages linked from a game
+    page, and the company pages of those platforms, concurrently.
+
+    The Game and GameRelease extractors then get these pages from fetch
+    instead of requesting them one after another.
+    """
+    try:
+        infobox = wiki_infobox(game_page)
+    except AttributeError:
+        return
+
+    for company_re in (Company.developing_re, Company.publishing_re):
+        try:
+            urls = infobox_link_urls(infobox, company_re)
+        except AttributeError:
+            continue
+        fetch.prefetch(url for url in urls
+                       if Company.cache.get('url', url) is None)
+    try:
+        urls = infobox_link_urls(infobox, platform_re)
+    except AttributeError:
+        return
+    fetch.prefetch((url for url in urls
+                    if Platform.cache.get('url', url) is None),
+                   then=prefetch_platform_company)
+
+
+class GameUrls:
+    """Urls of the wikipedia pages of the games in the database.
+
+    A game_url row is written with every game whose url is known, in the
+    same transaction (see WriteUnit.write_urls), so that a crawl can skip
+    the pages of the games it already has before fetching them. It also
+    holds the page_revision of the page the game was extracted from, so
+    that a refresh only extracts the pages that changed since.
+    """
+
+    preload_sql = """SELECT game_url.url, game.game_id, game.title,
+                            game_url.revision
+                     FROM game_url JOIN game USING (game_id)"""
+    upsert_sql = """INSERT INTO game_url (url, game_id, revision)
+                    VALUES (%s, %s, %s)
+                    ON DUPLICATE KEY UPDATE game_id=VALUES(game_id),
+                                            revision=VALUES(revision)"""
+
+    def __init__(self):
+        # url -> (game_id, title, revision)
+        self.games = dict()
+        self.lock = threading.Lock()
+
+    def __contains__(self, url: str):
+        return url in self.games
+
+    def __len__(self):
+        return len(self.games)
+
+    def get(self, url: str):
+        """Return (game_id, title, revision) of the game at url, or None."""
+        return self.games.get(url)
+
+    def add(self, tuple_, url: str):
+        """Record that the game (game_id, title, revision) is at url."""
+        with self.lock:
+            self.games[url] = tuple_
+
+    def unchanged(self, url: str, revision: str):
+        """Whether the game at url is in the database and was extracted from
+        revision of its page."""
+        tuple_ = self.get(url)
+        return tuple_ is not None and tuple_[2] == revision
+
+    def preload(self):
+        with gamedb.connection() as conn, conn.cursor() as cu:
+            cu.execute(GameUrls.preload_sql)
+            rows = cu.fetchall()
+        with self.lock:
+            for url, game_id, title, revision in rows:
+                self.games[url] = (game_id, title, revision)
+
+
+game_urls = GameUrls()
+
+
+def preload_entities():
+    """Fill the entity caches with the company, platform and employee
+    tables, one query each, and game_urls with the game_url table."""
+    with gamedb.connection():
+        for cls in (Company, Platform, Employee):
+            cls.cache.preload(cls.preload_sql)
+        game_urls.preload()
 
 
 class Develops:
     insert_sql = "INSERT INTO develops VALUES (%s, %s, %s, %s, %s)"
+    insert_batch_sql = \
+        "INSERT IGNORE INTO develops VALUES (%s, %s, %s, %s, %s)"
+    game_sql = """SELECT develops.* FROM develops
+                  JOIN game_release USING (release_id)
+                  WHERE game_release.game_id=%s"""
+    delete_sql = """DELETE FROM develops
+                    WHERE release_id=%s AND employee_id=%s
+                      AND employee_role=%s AND developing_company_id=%s
+                      AND publishing_company_id=%s"""
+    delete_release_sql = "DELETE FROM develops WHERE release_id=%s"
 
     @staticmethod
     def insert_i(cu, release_id, employee_id, role, dcompany_id, pcompany_id):
         try:
             cu.execute(Develops.insert_sql, (release_id, employee_id, role,
                                              dcompany_id, pcompany_id))
-        except pymysql.err.IntegrityError:
+        except gamedb.IntegrityError:
             return
 
     @staticmethod
-    def insert(game: Game, game_release: GameRelease):
+    def rows(game: Game, game_release: GameRelease):
+        """Yield the develops tuples of game and game_release."""
         def_employee = game.employees[0]
         def_employee_id = def_employee.employee_ids[0]
         def_role = def_employee.roles[0]
         def_dcompany_id = game.developing_companies[0].company_id
         def_pcompany_id = game.publishing_companies[0].company_id
 
+        for release in game_release.releases:
+            release_id = release[0]
+            for employee in game.employees:
+                for employee_id, role in \
+                        zip(employee.employee_ids, employee.roles):
+                    yield (release_id, employee_id, role, def_dcompany_id,
+                           def_pcompany_id)
+            for dcompany in game.developing_companies:
+                dcompany_id = dcompany.company_id
+                yield (release_id, def_employee_id, def_role, dcompany_id,
+                       def_pcompany_id)
+            for pcompany in game.developing_companies:
+                pcompany_id = pcompany.company_id
+                yield (release_id, def_employee_id, def_role, def_dcompany_id,
+                       pcompany_id)
+
+    @staticmethod
+    def insert(game: Game, game_release: GameRelease):
         with db.cursor() as cu:
-            for release in game_release.releases:
-                release_id = release[0]
-                for employee in game.employees:
-                    for employee_id, role in \
-                            zip(employee.employee_ids, employee.roles):
-                        Develops.insert_i(cu, release_id, employee_id, role,
-                                          def_dcompany_id, def_pcompany_id)
-                for dcompany in game.developing_companies:
-                    dcompany_id = dcompany.company_id
-                    Develops.insert_i(cu, release_id, def_employee_id,
-                                      def_role, dcompany_id, def_pcompany_id)
-                for pcompany in game.developing_companies:
-                    pcompany_id = pcompany.company_id
-                    Develops.insert_i(cu, release_id, def_employee_id,
-                                      def_role, def_dcompany_id, pcompany_id)
+            for row in Develops.rows(game, game_release):
+                Develops.insert_i(cu, *row)
         db.commit()
+
+
+def insert_rows(cu, sql: str, rows: list):
+    """Insert rows with a single multi-row INSERT of sql, whose VALUES
+    clause is a single row, and return their new ids.
+
+    The auto-increment ids of the rows of a single plain multi-row INSERT
+    are consecutive and start at cu.lastrowid, so no SELECT is needed to
+    read them back. If the backend does not guarantee that (see
+    gamedb.MySQL), then the rows are inserted one at a time instead.
+    """
+    if not gamedb.backend.consecutive_ids:
+        ids = []
+        for row in rows:
+            cu.execute(sql, row)
+            ids.append(cu.lastrowid)
+        return ids
+    head, values = sql.rsplit('VALUES', 1)
+    cu.execute('{}VALUES {}'.format(head, ', '.join([values.strip()]
+                                                    * len(rows))),
+               [arg for row in rows for arg in row])
+    return list(range(cu.lastrowid, cu.lastrowid + len(rows)))
+
+
+def insert_new_rows(cu, sql: str, upsert_sql: str, rows: list):
+    """Like insert_rows, but return (id, inserted) of every row, where rows
+    already in the database are not inserted again.
+
+    A row looked up as missing may have been inserted since by another
+    crawler. The multi-row INSERT then fails as a whole on the duplicate
+    key, and the rows are upserted one at a time with upsert_sql, whose
+    cu.lastrowid is the id of the row whether it is new or not. So are they
+    right away if the backend does not give consecutive ids.
+    """
+    if gamedb.backend.consecutive_ids:
+        try:
+            return [(id_, True) for id_ in insert_rows(cu, sql, rows)]
+        except gamedb.IntegrityError as e:
+            if e.args[0] != gamedb.DUP_ENTRY:
+                raise
+    ids = []
+    for row in rows:
+        cu.execute(upsert_sql, row)
+        ids.append((cu.lastrowid, cu.rowcount == 1))
+    return ids
+
+
+class WriteUnit:
+    """Rows of one or more games, written in a single transaction.
+
+    add gathers the game, game_release, employee, company and develops rows
+    of a game instead of inserting and committing them one by one. flush
+    writes the rows of all gathered games with multi-row INSERTs and commits
+    once. If anything fails, then the whole unit is rolled back, so no game
+    is left half written, and its games are written again one at a time, so
+    that only the games that fail on their own are dropped.
+
+    Platforms are still inserted as they are extracted, since they are
+    shared by many games.
+
+    A game added with a game_id is already in the database and is refreshed
+    instead: only its rows that differ from the ones extracted are updated,
+    inserted or deleted (see update_games).
+
+    Each flush checks out its own connection from gamedb.pool, so units on
+    different threads write at the same time. A unit shared by several
+    threads writes one flush at a time.
+    """
+
+    def __init__(self, size: int = 1, on_commit=None, on_rollback=None):
+        """Initialize WriteUnit object.
+
+        Args:
+            size: add flushes the unit once it holds size games.
+            on_commit: If given, then called after every flush that
+                committed games, e.g. to record that the games added before
+                and not dropped are written (see workqueue.WorkQueue.commit).
+            on_rollback: If given, then called with every game dropped by a
+                flush, and the exception it was rolled back by, e.g. to
+                crawl it again (see workqueue.WorkQueue.rolled_back). If
+                not, then flush raises the exception of the first game
+                dropped once it has written the others.
+        """
+        self.size = size
+        self.on_commit = on_commit
+        self.on_rollback = on_rollback
+        self.games = []
+        # (object, attribute, old value) of every attribute set by flush
+        self.assigned = []
+        # Games in the database whose urls are added without refreshing them
+        self.urls = []
+        # (IdentityMap or GameUrls, tuple, url) to cache once the unit is
+        # committed
+        self.cached = []
+        # table -> rows written by the flush, counted once it is committed
+        self.written = dict()
+        self.lock = threading.RLock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+        else:
+            self.games = []
+            self.urls = []
+
+    def add(self, game: Game, game_release: GameRelease):
+        with self.lock:
+            if any(game.title == g.title for g, _ in self.games):
+                logging.error('WriteUnit.add: {} is already in the unit'
+                              .format(game.title))
+                return
+            self.games.append((game, game_release))
+            if len(self.games) >= self.size:
+                self.flush()
+
+    def add_url(self, game: Game):
+        """Record game.url of a game already in the database, e.g. one
+        inserted before game_url was."""
+        with self.lock:
+            self.urls.append(game)
+
+    def flush(self):
+        with self.lock, gamedb.connection() as conn:
+            if not self.games and not self.urls:
+                return
+            games, self.games = self.games, []
+            urls, self.urls = self.urls, []
+            try:
+                self.write(conn, games, urls)
+                dropped = []
+            except Exception as e:
+                if len(games) + len(urls) == 1:
+                    dropped = self.dropped(games, urls, e)
+                else:
+                    dropped = self.write_each(conn, games, urls)
+            except BaseException as e:
+                # Interrupted: the games are neither written nor retried
+                self.dropped(games, urls, e)
+                raise
+            # Once every game dropped is reported, so that it is not taken
+            # for written
+            if self.on_commit and len(dropped) < len(games) + len(urls):
+                self.on_commit()
+            if dropped and not self.on_rollback:
+                raise dropped[0][1]
+
+    def write_each(self, conn, games, urls):
+        """Write games and urls one at a time, after writing them together
+        failed. Return (game, exception) of those that failed too."""
+        parts = [([pair], []) for pair in games] \
+            + [([], [game]) for game in urls]
+        dropped = []
+        for i, (games_, urls_) in enumerate(parts):
+            try:
+                self.write(conn, games_, urls_)
+            except Exception as e:
+                dropped.extend(self.dropped(games_, urls_, e))
+            except BaseException as e:
+                for games_, urls_ in parts[i:]:
+                    self.dropped(games_, urls_, e)
+                raise
+        return dropped
+
+    def dropped(self, games, urls, e: BaseException):
+        """Report the games and urls dropped by a rollback with e, before
+        anything else is committed. Return (game, e) of each of them."""
+        dropped = [(game, e) for game, _ in games] + [(game, e)
+                                                     for game in urls]
+        for game, _ in dropped:
+            logging.error('WriteUnit.flush: dropped {!r}: {}: {}'
+                          .format(game.title, type(e).__name__, e))
+            if self.on_rollback:
+                self.on_rollback(game, e)
+        return dropped
+
+    def write(self, conn, games, urls):
+        """Write games, and the urls of the games in urls, and commit, or
+        roll back if anything fails."""
+        new = [(game, game_release) for game, game_release in games
+               if not game.game_id]
+        refreshed = [(game, game_release) for game, game_release in games
+                     if game.game_id]
+        self.assigned = []
+        self.cached = []
+        self.written = dict()
+        try:
+            with write_seconds.time(step='flush'), conn.cursor() as cu:
+                self.step('companies', self.write_companies, cu, games)
+                self.step('employees', self.write_employees, cu, games)
+                new = self.step('games', self.write_games, cu, new)
+                self.step('releases', self.write_releases, cu, new)
+                self.step('develops', self.write_develops, cu, new)
+                self.step('updates', self.update_games, cu, refreshed)
+                self.step('urls', self.write_urls, cu,
+                          [game for game, _ in games] + urls)
+                with write_seconds.time(step='commit'):
+                    conn.commit()
+        except BaseException:
+            conn.rollback()
+            for obj, attr, value in reversed(self.assigned):
+                setattr(obj, attr, value)
+            titles = [game.title for game, _ in games] \
+                + [game.title for game in urls]
+            logging.error('WriteUnit.flush: rolled back {}'
+                          .format(', '.join(map(repr, titles))))
+            raise
+
+        for cache, tuple_, url in self.cached:
+            cache.add(tuple_, url)
+        for table, rows in self.written.items():
+            rows_written.inc(rows, table=table)
+        games_written.inc(len(games))
+
+    def step(self, name: str, write, *args):
+        """Return write(*args), timed as step name of the flush."""
+        with write_seconds.time(step=name):
+            return write(*args)
+
+    def wrote(self, table: str, rows: int):
+        if rows > 0:
+            self.written[table] = self.written.get(table, 0) + rows
+
+    def assign(self, obj, attr: str, value):
+        self.assigned.append((obj, attr, getattr(obj, attr)))
+        setattr(obj, attr, value)
+
+    def write_companies(self, cu, games):
+        new = OrderedDict()
+        for game, _ in games:
+            for company in game.developing_companies \
+                    + game.publishing_companies:
+                if not company.company_id:
+                    company.get_id()
+                if not company.company_id:
+                    new.setdefault(company.name, []).append(company)
+
+        if new:
+            rows = [companies[0].insert_args() for companies in new.values()]
+            ids = insert_new_rows(cu, Company.insert_sql, Company.upsert_sql,
+                                  rows)
+            for (id_, inserted), row, companies in zip(ids, rows,
+                                                       new.values()):
+                self.wrote('company', int(inserted))
+                if not inserted:
+                    Company.cache.discard_miss('name', companies[0].name)
+                for company in companies:
+                    self.assign(company, 'company_id', id_)
+                    self.assign(company, 'in_database', True)
+                    if inserted:
+                        self.cached.append((Company.cache, (id_,) + row,
+                                            company.url))
+
+        for sql, attr in ((Company.dev_batch_sql, 'developing_companies'),
+                          (Company.pub_batch_sql, 'publishing_companies')):
+            ids = {company.company_id
+                   for game, _ in games for company in getattr(game, attr)
+                   if company.company_id}
+            if ids:
+                cu.executemany(sql, [(id_,) for id_ in ids])
+                self.wrote(sql.split()[3], cu.rowcount)
+
+    def write_employees(self, cu, games):
+        ids = dict()
+        new = OrderedDict()
+        for game, _ in games:
+            for employee in game.employees:
+                for role in employee.roles:
+                    key = (employee.name, role)
+                    if key in ids or key in new:
+                        continue
+                    tuple_ = Employee.cache.get('name', key)
+                    if tuple_ is None:
+                        new[key] = None
+                    else:
+                        ids[key] = tuple_[0]
+
+        if new:
+            keys = list(new)
+            new_ids, inserted = Employee.insert_batch(cu, keys)
+            for (name, role), id_ in zip(keys, new_ids):
+                ids[(name, role)] = id_
+                self.cached.append((Employee.cache, (id_, role, name), None))
+            self.wrote('employee', inserted)
+
+        for game, _ in games:
+            for employee in game.employees:
+                self.assign(employee, 'employee_ids',
+                            [ids[(employee.name, role)]
+                             for role in employee.roles
+                             if (employee.name, role) in ids])
+
+    def write_games(self, cu, games):
+        """Insert the game rows of games, and return the games that were
+        not in the database, whose releases are to be written.
+
+        A game inserted by another crawler since its title was checked is
+        not inserted again; it only gets its game_id.
+        """
+        if not games:
+            return []
+        ids = insert_new_rows(cu, Game.insert_sql, Game.upsert_sql,
+                              [game.insert_args() for game, _ in games])
+        new = []
+        for (id_, inserted), (game, game_release) in zip(ids, games):
+            self.wrote('game', int(inserted))
+            self.assign(game, 'game_id', id_)
+            self.assign(game, 'in_database', True)
+            if inserted:
+                new.append((game, game_release))
+            else:
+                logging.warning('WriteUnit.write_games: {} was inserted by '
+                                'another crawler'.format(game.title))
+        return new
+
+    def write_urls(self, cu, games):
+        games = [game for game in games if game.url]
+        if not games:
+            return
+        cu.executemany(GameUrls.upsert_sql,
+                       [(game.url, game.game_id, game.revision)
+                        for game in games])
+        self.wrote('game_url', len(games))
+        for game in games:
+            self.cached.append((game_urls,
+                                (game.game_id, game.title, game.revision),
+                                game.url))
+
+    def write_releases(self, cu, games):
+        rows = []
+        indices = []
+        for i, (game, game_release) in enumerate(games):
+            for j, release in enumerate(game_release.releases):
+                if release[1].platform_id is None:
+                    logging.error(
+                        'GameRelease: Attempted to insert NULL in non-NULLable column for {}.'
+                        .format(game_release.title))
+                    continue
+                rows.append((game.game_id, release[1].platform_id,
+                             release[2], release[3], game_release.title))
+                indices.append((i, j))
+        if not rows:
+            return
+        ids = insert_rows(cu, GameRelease.insert_sql, rows)
+        self.wrote('game_release', len(rows))
+
+        releases = [list(game_release.releases) for _, game_release in games]
+        for id_, (i, j) in zip(ids, indices):
+            releases[i][j] = (id_,) + releases[i][j][1:]
+        for (_, game_release), releases_ in zip(games, releases):
+            self.assign(game_release, 'releases', releases_)
+
+    def write_develops(self, cu, games):
+        rows = [row for game, game_release in games
+                for row in Develops.rows(game, game_release)
+                if None not in row]
+        if rows:
+            cu.executemany(Develops.insert_batch_sql, rows)
+            self.wrote('develops', cu.rowcount)
+
+    def update_games(self, cu, games):
+        """Bring the rows of games already in the database up to date with
+        the ones extracted, writing only the rows that changed.
+
+        A reception of None, which the page did not have, keeps the one in
+        the database.
+        """
+        for game, game_release in games:
+            cu.execute(Game.check_sql_id, (game.game_id,))
+            tuple_ = cu.fetchone()
+            if tuple_ is None:
+                logging.error('WriteUnit.update_games: {} is not in the '
+                              'database'.format(game.title))
+                continue
+            if game.reception is None:
+                self.assign(game, 'reception', tuple_[2])
+            if game.insert_args() != tuple_[1:]:
+                cu.execute(Game.update_sql,
+                           game.insert_args() + (game.game_id,))
+                self.wrote('game', cu.rowcount)
+            if game.title != tuple_[3]:
+                cu.execute(GameRelease.update_title_sql,
+                           (game_release.title, game.game_id))
+                self.wrote('game_release', cu.rowcount)
+            self.update_releases(cu, game, game_release)
+            self.update_develops(cu, game, game_release)
+            self.assign(game, 'in_database', True)
+
+    def update_releases(self, cu, game: Game, game_release: GameRelease):
+        cu.execute(GameRelease.game_sql, (game.game_id,))
+        # (platform_id, region, release_date) -> release_id
+        stored = dict()
+        removed = []
+        for release_id, platform_id, region, release_date in cu.fetchall():
+            key = (platform_id, region, release_date)
+            if key in stored:
+                removed.append(release_id)
+            else:
+                stored[key] = release_id
+
+        releases = list(game_release.releases)
+        rows = []
+        indices = []
+        for j, release in enumerate(releases):
+            if release[1].platform_id is None:
+                logging.error(
+                    'GameRelease: Attempted to insert NULL in non-NULLable '
+                    'column for {}.'.format(game_release.title))
+                continue
+            key = (release[1].platform_id, release[2], release[3])
+            if key in stored:
+                releases[j] = (stored.pop(key),) + release[1:]
+            else:
+                rows.append((game.game_id,) + key + (game_release.title,))
+                indices.append(j)
+        removed.extend(stored.values())
+
+        if removed:
+            args = [(release_id,) for release_id in removed]
+            cu.executemany(Develops.delete_release_sql, args)
+            self.wrote('develops', cu.rowcount)
+            cu.executemany(GameRelease.delete_sql, args)
+            self.wrote('game_release', cu.rowcount)
+        if rows:
+            ids = insert_rows(cu, GameRelease.insert_sql, rows)
+            self.wrote('game_release', len(rows))
+            for id_, j in zip(ids, indices):
+                releases[j] = (id_,) + releases[j][1:]
+        self.assign(game_release, 'releases', releases)
+
+    def update_develops(self, cu, game: Game, game_release: GameRelease):
+        cu.execute(Develops.game_sql, (game.game_id,))
+        stored = set(cu.fetchall())
+        rows = {row for row in Develops.rows(game, game_release)
+                if None not in row}
+        if stored - rows:
+            cu.executemany(Develops.delete_sql, list(stored - rows))
+            self.wrote('develops', cu.rowcount)
+        if rows - stored:
+            cu.executemany(Develops.insert_batch_sql, list(rows - stored))
+            self.wrote('develops', cu.rowcount)
@@ -1,18 +1,58 @@
 #!/usr/bin/python3
 
+import argparse
+import asyncio
+import atexit
+from collections import deque, OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 import logging
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+from urllib.parse import urlsplit
 
-from bs4 import BeautifulSoup
 import requests
 
+import archive
 import data
+import fetch
+import gamedb
+import gamedb_sqlite
+import lease
+import metrics
+import throttle
+import url_gen
+import workqueue
 
 DEBUGGING = True
 if 'DEBUGGING' not in globals():
     DEBUGGING = False
 
 URL_FILE = 'url_shuf.txt'
+# Number of lines of URL_FILE crawled, see UrlFile and position_path
+POSITION_FILE = 'url_shuf.pos'
 LOG_FILE = 'data_gen.log'
+MAX_URLS = 10000
+MAX_HTTP_ERRORS = 20
+
+# Number of games written to the database per transaction
+BATCH_SIZE = 1
+
+# Asynchronous crawl mode
+CONCURRENCY = 16
+HOST_CONCURRENCY = 8
+
+# Pipeline crawl mode: items held between two stages
+QUEUE_SIZE = 64
+
+stage_seconds = metrics.histogram('gamedb_stage_seconds',
+                                  'Seconds of each stage of crawling a game')
+games = metrics.counter('gamedb_games_total',
+                        'Game urls crawled, by outcome')
 
 
 def get_urls_tmp():
@@ -32,57 +72,967 @@ def get_urls(file_):
         yield line.strip()
 
 
-def data_gen(game_url: str):
-    r = requests.get(game_url)
-    r.raise_for_status()
-    game_soup = BeautifulSoup(r.text, 'lxml')
+def position_path(url_file: str):
+    """Return the path of the file UrlFile records the position in url_file
+    in."""
+    return os.path.splitext(url_file)[0] + '.pos'
+
+
+class UrlFile:
+    """Urls of a url file, one per line, that remembers how far the urls
+    have been crawled.
+
+    The position is the number of lines at the start of the file whose urls
+    have all been crawled: done has been called with each of them, and the
+    write unit their games were added to has been committed since (see
+    commit). Urls done out of order, e.g. by Crawl, only move the position
+    past the lines before them once those are done too. The urls of games a
+    rollback drops from the unit (see rolled_back) are never done, so a
+    resumed run crawls them again.
+    """
+
+    def __init__(self, file_, position_path: str = POSITION_FILE,
+                 resume: bool = False):
+        """Initialize UrlFile object.
+
+        Args:
+            file_: The url file.
+            position_path: File that save records the position in.
+            resume: If True, then skip the lines before the position
+                recorded in position_path.
+        """
+        self.file = file_
+        self.position_path = position_path
+        self.start = self.load() if resume else 0
+        self.position = self.start
+        # Line number of the last line read
+        self.read = self.start
+        # line number -> url of the lines read and not yet done, in order
+        self.pending = OrderedDict()
+        # url -> line numbers of it in self.pending
+        self.lines = dict()
+        # Urls done since the last commit
+        self.finished = []
+        # Urls dropped by a rollback before they were done
+        self.dropped = set()
+        self.lock = threading.Lock()
+
+    def load(self):
+        try:
+            with open(self.position_path, 'r') as f:
+                return int(f.read())
+        except (OSError, ValueError):
+            return 0
+
+    def save(self):
+        tmp = self.position_path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write('{}\n'.format(self.position))
+        os.replace(tmp, self.position_path)
+
+    def __iter__(self):
+        for number, line in enumerate(self.file, 1):
+            if number <= self.start:
+                continue
+            url = line.strip()
+            with self.lock:
+                self.read = number
+                self.pending[number] = url
+                self.lines.setdefault(url, deque()).append(number)
+            yield url
+
+    def done(self, url: str):
+        """Record that the game at url was added to the write unit, or that
+        url was skipped or failed. url is done once the unit is committed."""
+        with self.lock:
+            if url in self.dropped:
+                self.dropped.discard(url)
+            else:
+                self.finished.append(url)
+
+    def rolled_back(self, url: str, e: BaseException):
+        """Record that the game at url was dropped from the write unit by
+        a rollback with e, so that url is never done.
+
+        Pass as the on_rollback of the data.WriteUnit the games are added
+        to, through rolled_back.
+        """
+        with self.lock:
+            if url in self.finished:
+                self.finished.remove(url)
+            else:
+                self.dropped.add(url)
+
+    def commit(self):
+        """Move the position past the urls recorded by done, whose games
+        are all committed by now.
+
+        Pass as the on_commit of the data.WriteUnit the games are added to.
+        """
+        with self.lock:
+            finished, self.finished = self.finished, []
+            for url in finished:
+                numbers = self.lines[url]
+                del self.pending[numbers.popleft()]
+                if not numbers:
+                    del self.lines[url]
+            if self.pending:
+                self.position = next(iter(self.pending)) - 1
+            else:
+                self.position = self.read
+
+
+class ShardUrls(UrlFile):
+    """UrlFile of a shard crawled under a lease (see lease.ShardLeases),
+    which starts at the position saved in the lease and ends early if the
+    lease is lost."""
+
+    def __init__(self, file_, start: int, lost: threading.Event):
+        """Initialize ShardUrls object.
+
+        Args:
+            file_: The url file of the shard.
+            start: Position saved in the lease.
+            lost: Event set once the lease is lost.
+        """
+        self.saved = start
+        self.lost = lost
+        # Whether every line has been read
+        self.exhausted = False
+        super().__init__(file_, None, resume=True)
+
+    def load(self):
+        return self.saved
+
+    def __iter__(self):
+        for url in super().__iter__():
+            if self.lost.is_set():
+                return
+            yield url
+        self.exhausted = True
+
+
+def unseen(urls, done=None):
+    """Yield the urls whose games are not in the database yet, skipping the
+    urls in data.game_urls before anything is fetched.
+
+    done, if given, is called with every url skipped.
+    """
+    for url in urls:
+        if url in data.game_urls:
+            games.inc(outcome='skipped')
+            if done:
+                done(url)
+            continue
+        yield url
+
+
+def fetch_game(game_url: str):
+    # The page of a game in the database is only crawled to refresh it, so
+    # get its current revision
+    with stage_seconds.time(stage='fetch'):
+        return fetch.get(game_url, revalidate=game_url in data.game_urls)
+
+
+def failure(url: str, e: BaseException, failed=None):
+    """Count url as failed with e, and report it to failed if given.
+
+    Return whether failed was called.
+    """
+    games.inc(outcome='failed')
+    if failed:
+        failed(url, e)
+        return True
+    return False
 
-    game = data.Game(game_soup)
-    if game.in_database:
+
+def rolled_back(callback):
+    """Return an on_rollback of a data.WriteUnit that calls callback with
+    the url of every game dropped, and the exception."""
+    def on_rollback(game: data.Game, e: BaseException):
+        if game.url:
+            callback(game.url, e)
+    return on_rollback
+
+
+def data_gen(game_url: str, unit: data.WriteUnit = None):
+    if unit is None:
+        with data.WriteUnit() as unit:
+            load_game(fetch_game(game_url), unit, game_url)
+    else:
+        load_game(fetch_game(game_url), unit, game_url)
+
+
+def load_game(game_html: str, unit: data.WriteUnit, game_url: str = None):
+    revision = data.page_revision(game_html)
+    if data.game_urls.unchanged(game_url, revision):
+        games.inc(outcome='unchanged')
         return
-    game.ensure_attr_existence()
-    print('"{title}" {reception} {release_date}'
-          .format(title=game.title, reception=game.reception,
-                  release_date=game.earliest_release_date))
+    game_page = data.parse_html(game_html)
+    with gamedb.connection(), stage_seconds.time(stage='load'), \
+            gamedb.traced(game_url or data.wiki_title(game_page)):
+        load_game_page(game_page, unit, game_url, revision)
 
+
+def load_game_page(game_page: data.Page, unit: data.WriteUnit,
+                   game_url: str = None, revision: str = None):
+    """Add the game on game_page to unit.
+
+    If game_url is in data.game_urls, then the game is in the database and
+    is refreshed: it is extracted anew and unit updates the rows that
+    changed.
+    """
+    known = data.game_urls.get(game_url)
     try:
-        game_release = data.GameRelease(game_soup, game=game)
-    except BaseException:
-        logging.error('data_gen_test: {}: Failed to get GameReleases'
-                      .format(game.title))
-        game_release = data.GameRelease(game=game)
-    if not game_release.releases:
-        game_release.releases.append(data.GameRelease.generic_r())
+        if known:
+            game = data.Game()
+            game.get_title(game_page)
+            game.game_id = known[0]
+            data.prefetch_game(game_page)
+            game.get_details(game_page, generic=False)
+        else:
+            # Game starts fetching the pages game_page links to concurrently
+            game = data.Game(game_page)
+            if game.in_database:
+                games.inc(outcome='known')
+                if game_url:
+                    game.url = game_url
+                    unit.add_url(game)
+                return
+        game.url = game_url
+        game.revision = revision
+        game.ensure_attr_existence()
+        print('"{title}" {reception} {release_date}'
+              .format(title=game.title, reception=game.reception,
+                      release_date=game.earliest_release_date))
+
+        if known:
+            game_release = data.GameRelease(game=game)
+            try:
+                game_release.get_releases(game_page)
+            except BaseException:
+                logging.error('data_gen_test: {}: Failed to get GameReleases'
+                              .format(game.title))
+            if not game_release.releases:
+                # Keep the releases in the database
+                game_release.get_data_from_game()
+        else:
+            try:
+                game_release = data.GameRelease(game_page, game=game)
+            except BaseException:
+                logging.error('data_gen_test: {}: Failed to get GameReleases'
+                              .format(game.title))
+                game_release = data.GameRelease(game=game)
+        if not game_release.releases:
+            game_release.releases.append(data.GameRelease.generic_r())
+    finally:
+        fetch.clear_prefetched()
 
     game.get_earliest_release_date(game_release)
-    game.insert_into_database_r()
-    game_release.insert_into_database()
-    data.Develops.insert(game, game_release)
+    games.inc(outcome='refreshed' if known else 'loaded')
+    unit.add(game, game_release)
 
 
-def main():
-    logging.basicConfig(filename=LOG_FILE, level=logging.ERROR,
-                        format='%(asctime)s %(message)s')
-    with open(URL_FILE, "r+") as f:
-        errors = 0
-        for number, url in enumerate(get_urls(f), 1):
-            if number > 10000:
+class TooManyHTTPErrors(Exception):
+    pass
+
+
+class Crawl:
+    """Crawl game urls, keeping many game pages in flight at once.
+
+    Game pages are fetched on a thread pool, at most concurrency at a time
+    and at most host_concurrency at a time per host. Every fetched page is
+    then loaded with load_game on a single thread, so the database is only
+    ever used by one thread.
+    """
+
+    def __init__(self, concurrency: int = CONCURRENCY,
+                 host_concurrency: int = HOST_CONCURRENCY):
+        self.concurrency = concurrency
+        self.host_concurrency = host_concurrency
+        self.host_sems = dict()
+        self.errors = 0
+
+    def host_sem(self, url: str):
+        host = urlsplit(url).netloc
+        if host not in self.host_sems:
+            self.host_sems[host] = asyncio.Semaphore(self.host_concurrency)
+        return self.host_sems[host]
+
+    async def crawl_one(self, number: int, url: str):
+        loop = asyncio.get_running_loop()
+        print(number)
+        print(url)
+        try:
+            async with self.host_sem(url):
+                game_html = await loop.run_in_executor(self.fetch_pool,
+                                                       fetch_game, url)
+            await loop.run_in_executor(self.load_pool, load_game, game_html,
+                                       self.unit, url)
+        except (KeyboardInterrupt, asyncio.CancelledError,
+                TooManyHTTPErrors):
+            raise
+        except requests.exceptions.HTTPError as e:
+            logging.error('HTML request to {url} failed.'.format(url=url))
+            if failure(url, e, self.failed):
+                return
+            self.errors += 1
+            if self.errors >= MAX_HTTP_ERRORS:
+                raise TooManyHTTPErrors
+        except BaseException as e:
+            if failure(url, e, self.failed):
+                return
+        if self.done:
+            self.done(url)
+
+    async def worker(self, queue: asyncio.Queue):
+        while True:
+            number, url = await queue.get()
+            try:
+                await self.crawl_one(number, url)
+            finally:
+                queue.task_done()
+
+    async def crawl(self, urls, max_urls: int):
+        queue = asyncio.Queue(maxsize=self.concurrency)
+        workers = [asyncio.ensure_future(self.worker(queue))
+                   for _ in range(self.concurrency)]
+        try:
+            for number, url in enumerate(urls, 1):
+                if max_urls is not None and number > max_urls:
+                    break
+                await queue.put((number, url))
+                for w in workers:
+                    if w.done():
+                        # Re-raise TooManyHTTPErrors
+                        w.result()
+            await queue.join()
+        finally:
+            for w in workers:
+                w.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    def run(self, urls, unit: data.WriteUnit, max_urls: int = MAX_URLS,
+            done=None, failed=None):
+        """Load the games at urls into unit, then flush it.
+
+        Args:
+            urls: Iterable of game urls.
+            unit: Unit the games are added to.
+            max_urls: If not None, then stop after this many urls.
+            done: If given, then called with each url once its game has
+                been added to unit, or has failed.
+            failed: If given, then called with each url whose game failed,
+                and the exception, instead of done. HTTP errors then do not
+                stop the crawl.
+        """
+        self.fetch_pool = ThreadPoolExecutor(self.concurrency)
+        self.load_pool = ThreadPoolExecutor(1)
+        self.unit = unit
+        self.done = done
+        self.failed = failed
+        try:
+            asyncio.run(self.crawl(urls, max_urls))
+        except TooManyHTTPErrors:
+            logging.error('Exited due to too many HTTP errors.')
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.fetch_pool.shutdown(wait=False)
+            self.load_pool.shutdown()
+        self.unit.flush()
+
+
+def crawl_serial(urls, unit: data.WriteUnit, max_urls: int = MAX_URLS,
+                 done=None, failed=None):
+    """Like Crawl.run, but fetch and load one game at a time."""
+    errors = 0
+    for number, url in enumerate(urls, 1):
+        if max_urls is not None and number > max_urls:
+            break
+        print(number)
+
+        try:
+            print(url)
+            data_gen(url, unit)
+        except KeyboardInterrupt:
+            break
+        except requests.exceptions.HTTPError as e:
+            logging.error('HTML request to {url} failed.'.format(url=url))
+            if failure(url, e, failed):
+                continue
+            errors += 1
+            if errors >= MAX_HTTP_ERRORS:
+                logging.error('Exited due to too many HTTP errors.')
                 break
-            print(number)
+        except BaseException as e:
+            if failure(url, e, failed):
+                continue
+        if done:
+            done(url)
+    unit.flush()
+
 
+def init_parse_process():
+    # Interrupts are handled by the crawling process, which stops the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # The values of the crawling process when it forked, not to be merged
+    # back into it
+    metrics.registry.take()
+
+
+def extract_game(game_html: str):
+    """Extract the game on a game page without using the database.
+
+    Runs in a parse process of a Pipeline. The companies of the game and
+    the platforms of its releases are fetched and extracted here too, each
+    page once per process.
+
+    Returns:
+        (game, releases, platforms): The Game, with its title and details,
+        its releases as yielded by GameRelease.parse_releases, and a dict
+        from the urls of their platforms to the platforms extracted from
+        them.
+    """
+    page = data.parse_html(game_html)
+    game = data.Game()
+    game.get_title(page)
+    data.prefetch_game(page)
+    try:
+        game.get_details(page, use_db=False, generic=False)
+        releases = []
+        try:
+            for release in data.GameRelease.parse_releases(page):
+                releases.append(release)
+        except Exception:
+            if not releases:
+                logging.warning('GameRelease.get_data: Failed to get releases')
+
+        platforms = dict()
+        for _, url, _, _ in releases:
+            if url and url not in platforms:
+                try:
+                    platforms[url] = data.Platform.from_url(url, use_db=False)
+                except Exception:
+                    # Unless the platform is in the database, the writer
+                    # fetches it again and fails as load_game would
+                    continue
+    finally:
+        fetch.clear_prefetched()
+    return game, releases, platforms
+
+
+def parse_game(game_html: str):
+    """Return the result of extract_game, with the metrics the parse
+    process updated since the last game, for the crawling process to
+    merge (see metrics.Registry.take)."""
+    return extract_game(game_html), metrics.registry.take()
+
+
+def load_extracted(extracted: tuple, unit: data.WriteUnit,
+                   game_url: str = None, revision: str = None):
+    """Like load_game_page, but with the game extracted by extract_game."""
+    game, releases, platforms = extracted
+    known = data.game_urls.get(game_url)
+    with gamedb.connection(), gamedb.traced(game_url or game.title):
+        if known:
+            game.game_id = known[0]
+            game.resolve_companies()
+        else:
+            game.resolve()
+            if game.in_database:
+                games.inc(outcome='known')
+                if game_url:
+                    game.url = game_url
+                    unit.add_url(game)
+                return
+            if game.reception is None:
+                game.reception = data.Game.generic_reception()
+        game.url = game_url
+        game.revision = revision
+        game.ensure_attr_existence()
+        print('"{title}" {reception} {release_date}'
+              .format(title=game.title, reception=game.reception,
+                      release_date=game.earliest_release_date))
+
+        game_release = data.GameRelease(game=game)
+        try:
+            game_release.add_releases(releases, extracted=platforms)
+        except Exception:
+            logging.error('data_gen_test: {}: Failed to get GameReleases'
+                          .format(game.title))
+        if not game_release.releases and known:
+            game_release.get_data_from_game()
+        if not game_release.releases:
+            game_release.releases.append(data.GameRelease.generic_r())
+
+        game.get_earliest_release_date(game_release)
+        games.inc(outcome='refreshed' if known else 'loaded')
+        unit.add(game, game_release)
+
+
+class Pipeline:
+    """Crawl game urls, parsing game pages in a pool of processes.
+
+    Parsing and extracting pages takes most of the CPU time of a crawl, and
+    threads run it one at a time. Here a crawl runs in three stages:
+
+    fetch: Threads get game pages, at most host_concurrency at a time per
+        host, and hand them to the parse processes.
+    parse: Processes extract the games, with their companies and platforms,
+        without using the database (extract_game), and hand them back with
+        their metrics (parse_game).
+    write: A single thread, the only one using the database, matches the
+        extracted games with it and adds them to the unit (load_extracted).
+
+    The stages are connected by queues of at most queue_size items, so that
+    a slow stage holds back the ones before it instead of letting pages
+    pile up in memory.
+    """
+
+    STOP = None
+
+    def __init__(self, processes: int = None, concurrency: int = CONCURRENCY,
+                 host_concurrency: int = HOST_CONCURRENCY,
+                 queue_size: int = QUEUE_SIZE):
+        """Initialize Pipeline object.
+
+        Args:
+            processes: Number of parse processes, or None for one per CPU.
+            concurrency: Number of fetch threads.
+            host_concurrency: Maximum number of game pages fetched at a
+                time per host.
+            queue_size: Maximum number of items held between two stages.
+        """
+        self.processes = processes
+        self.concurrency = concurrency
+        self.host_concurrency = host_concurrency
+        self.queue_size = queue_size
+        self.host_sems = dict()
+        self.lock = threading.Lock()
+        self.errors = 0
+        self.stopping = threading.Event()
+
+    def host_sem(self, url: str):
+        host = urlsplit(url).netloc
+        with self.lock:
+            if host not in self.host_sems:
+                self.host_sems[host] = \
+                    threading.Semaphore(self.host_concurrency)
+            return self.host_sems[host]
+
+    def feed(self, urls, max_urls: int):
+        try:
+            for number, url in enumerate(urls, 1):
+                if max_urls is not None and number > max_urls \
+                        or self.stopping.is_set():
+                    break
+                self.urls.put((number, url))
+        finally:
+            for _ in range(self.concurrency):
+                self.urls.put(Pipeline.STOP)
+
+    def fetch(self):
+        while True:
+            item = self.urls.get()
+            if item is Pipeline.STOP:
+                self.parsed.put(Pipeline.STOP)
+                return
+            number, url = item
+            if self.stopping.is_set():
+                continue
+            revision = None
             try:
-                print(url)
-                data_gen(url)
+                with self.host_sem(url):
+                    game_html = fetch_game(url)
+                revision = data.page_revision(game_html)
+                if data.game_urls.unchanged(url, revision):
+                    games.inc(outcome='unchanged')
+                    result = None
+                else:
+                    result = self.pool.submit(parse_game, game_html)
+            except Exception as e:
+                result = e
+            self.parsed.put((number, url, result, revision))
+
+    def write(self, unit: data.WriteUnit):
+        """Load the parsed games until every fetch thread has stopped.
+
+        Each game is loaded in a unit of work of its own (see
+        load_extracted), so that no snapshot is held across games. Once
+        stopping is set, the games left are dropped.
+        """
+        while self.fetchers_stopped < self.concurrency:
+            item = self.parsed.get()
+            if item is Pipeline.STOP:
+                self.fetchers_stopped += 1
+                continue
+            number, url, result, revision = item
+            if self.stopping.is_set():
+                if isinstance(result, Future):
+                    result.cancel()
+                continue
+
+            print(number)
+            print(url)
+            try:
+                if isinstance(result, BaseException):
+                    raise result
+                if result is not None:
+                    extracted, taken = result.result()
+                    metrics.registry.merge(taken)
+                    with stage_seconds.time(stage='load'):
+                        load_extracted(extracted, unit, url, revision)
             except KeyboardInterrupt:
-                break
-            except requests.exceptions.HTTPError:
-                logging.error('HTML request to {url} failed.'.format(url=url))
-                errors += 1
-                if errors >= 20:
+                raise
+            except requests.exceptions.HTTPError as e:
+                logging.error('HTML request to {url} failed.'
+                              .format(url=url))
+                if failure(url, e, self.failed):
+                    continue
+                self.errors += 1
+                if self.errors >= MAX_HTTP_ERRORS:
                     logging.error('Exited due to too many HTTP errors.')
-                    break
+                    self.stopping.set()
+            except BaseException as e:
+                if failure(url, e, self.failed):
+                    continue
+            if self.done:
+                self.done(url)
+
+    def run(self, urls, unit: data.WriteUnit, max_urls: int = MAX_URLS,
+            done=None, failed=None):
+        """Load the games at urls into unit, then flush it.
+
+        Args:
+            urls: Iterable of game urls.
+            unit: Unit the games are added to.
+            max_urls: If not None, then stop after this many urls.
+            done: If given, then called with each url once its game has
+                been added to unit, or has failed.
+            failed: If given, then called with each url whose game failed,
+                and the exception, instead of done. HTTP errors then do not
+                stop the crawl.
+        """
+        self.done = done
+        self.failed = failed
+        self.pool = ProcessPoolExecutor(
+            self.processes, mp_context=multiprocessing.get_context('fork'),
+            initializer=init_parse_process)
+        # Fork the parse processes before starting any thread, as a child
+        # only has the thread that forked it
+        self.pool.submit(int).result()
+
+        self.urls = queue.Queue(self.queue_size)
+        self.parsed = queue.Queue(self.queue_size)
+        self.fetchers_stopped = 0
+        threads = [threading.Thread(target=self.feed, args=(urls, max_urls),
+                                    daemon=True)]
+        threads.extend(threading.Thread(target=self.fetch, daemon=True)
+                       for _ in range(self.concurrency))
+        for thread in threads:
+            thread.start()
+        try:
+            try:
+                self.write(unit)
+            except KeyboardInterrupt:
+                self.stopping.set()
+                # Wait for the fetch threads to stop
+                self.write(unit)
+        finally:
+            self.pool.shutdown(cancel_futures=True)
+        unit.flush()
+
+
+def add_crawl_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--async', dest='async_', action='store_true',
+                        help='fetch many game pages concurrently')
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY,
+                        help='maximum number of game pages in flight')
+    parser.add_argument('--host-concurrency', type=int,
+                        default=HOST_CONCURRENCY,
+                        help='maximum number of game pages in flight per host')
+    parser.add_argument('--processes', type=int, default=None, metavar='N',
+                        help='parse game pages in N processes, connected to '
+                             'the fetch threads and the database writer by '
+                             'bounded queues')
+    parser.add_argument('--queue-size', type=int, default=QUEUE_SIZE,
+                        help='with --processes, maximum number of pages held '
+                             'between two stages')
+    parser.add_argument('--refresh', action='store_true',
+                        help='also crawl the games already in the database, '
+                             'updating those whose pages changed')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='do not use the on-disk HTTP response cache')
+    parser.add_argument('--cache-max-age', type=float, default=None,
+                        help='use cached pages younger than this many seconds '
+                             'without revalidating them')
+    parser.add_argument('--rate', type=float, default=throttle.RATE,
+                        help='requests per second a host starts at, tuned by '
+                             'its latency and errors')
+    parser.add_argument('--max-rate', type=float, default=throttle.MAX_RATE,
+                        help='highest requests per second to a host')
+    parser.add_argument('--max-host-requests', type=int,
+                        default=throttle.MAX_CONCURRENCY,
+                        help='highest number of requests in flight to a host')
+    parser.add_argument('--no-throttle', action='store_true',
+                        help='send requests without per-host rate limits, '
+                             'tuning or circuit breakers')
+    parser.add_argument('--metrics-file', default=None, metavar='PATH',
+                        help='write the metrics of the crawl to PATH, in the '
+                             'Prometheus text format, periodically and at '
+                             'exit')
+    parser.add_argument('--metrics-interval', type=float,
+                        default=metrics.EXPORT_INTERVAL,
+                        help='seconds between two writes of --metrics-file')
+    parser.add_argument('--summary-file', default=None, metavar='PATH',
+                        help='write a JSON summary of the metrics of the '
+                             'crawl to PATH at exit')
+    parser.add_argument('--trace-db', default=None, metavar='PATH',
+                        help='record every database statement, and append '
+                             'to PATH a report of the N+1 and slow statements '
+                             'of each game')
+    parser.add_argument('--trace-all', action='store_true',
+                        help='with --trace-db, report every game')
+    parser.add_argument('--n-plus-one', type=int, default=gamedb.N_PLUS_ONE,
+                        metavar='N',
+                        help='with --trace-db, times a statement is issued '
+                             'from the same place for a game to be reported')
+    parser.add_argument('--slow-query-ms', type=float,
+                        default=1000 * gamedb.SLOW_SECONDS,
+                        help='with --trace-db, milliseconds a statement '
+                             'takes to be reported as slow')
+    parser.add_argument('--sqlite', default=None, metavar='PATH',
+                        help='store the games in the embedded SQLite '
+                             'database PATH, created if needed, instead of '
+                             'the MySQL server of mysql_config')
+    archive.add_arguments(parser)
+
+
+def setup(args: argparse.Namespace, log_file: str = LOG_FILE):
+    """Configure logging, fetching and the database as given by
+    add_crawl_arguments."""
+    if args.processes and args.archive:
+        # The pages the parse processes fetch would not be archived
+        sys.exit('--archive cannot be used with --processes')
+    if args.sqlite:
+        gamedb.use(gamedb_sqlite.SQLite(args.sqlite))
+    if args.no_cache:
+        fetch.cache = None
+    else:
+        fetch.cache.max_age = args.cache_max_age
+    if args.no_throttle:
+        fetch.throttle = None
+    else:
+        throttle_type = throttle.Throttle
+        if args.processes:
+            # So that the parse processes, which fetch the company and
+            # platform pages, keep to the same limits as the fetch threads
+            manager = throttle.Manager()
+            manager.start()
+            atexit.register(manager.shutdown)
+            throttle_type = manager.Throttle
+        fetch.throttle = throttle_type(
+            args.rate, min(throttle.CONCURRENCY, args.max_host_requests),
+            args.max_rate, args.max_host_requests)
+    archive.setup(args)
+    logging.basicConfig(filename=log_file, level=logging.ERROR,
+                        format='%(asctime)s %(message)s')
+    if args.metrics_file:
+        exporter = metrics.Exporter(args.metrics_file, args.metrics_interval)
+        exporter.start()
+        atexit.register(exporter.stop)
+    if args.summary_file:
+        atexit.register(write_summary, args.summary_file)
+    if args.trace_db:
+        gamedb.tracer = gamedb.Tracer(args.trace_db, args.trace_all,
+                                      args.n_plus_one,
+                                      args.slow_query_ms / 1000)
+
+
+def write_summary(path: str):
+    """Write the JSON summary of the metrics, with the HTTP requests and
+    bytes per game fetched."""
+    fetched = games.total() - games.value(outcome='skipped')
+    metrics.write_summary(path, {
+        'http_requests_per_game': fetch.http_requests.total() / fetched
+        if fetched else None,
+        'http_bytes_per_game': fetch.http_bytes.total() / fetched
+        if fetched else None,
+    })
+
+
+def crawl(args: argparse.Namespace, urls, unit: data.WriteUnit,
+          max_urls: int = MAX_URLS, done=None, failed=None):
+    """Load the games at urls into unit, then flush it.
+
+    Urls whose games are already in the database, by data.game_urls, are
+    skipped without being fetched, unless args.refresh: then their pages are
+    revalidated, and the games whose pages changed are extracted again and
+    updated. Call data.preload_entities first. done, if given, is called
+    with each url once it has been skipped, loaded or has failed; failed,
+    if given, is called instead with each url that failed and the exception.
+    """
+    if not args.refresh:
+        urls = unseen(urls, done)
+    if args.processes:
+        Pipeline(args.processes, args.concurrency, args.host_concurrency,
+                 args.queue_size).run(urls, unit, max_urls, done, failed)
+    elif args.async_:
+        Crawl(args.concurrency, args.host_concurrency) \
+            .run(urls, unit, max_urls, done, failed)
+    else:
+        crawl_serial(urls, unit, max_urls, done, failed)
+
+
+def crawl_shards(args: argparse.Namespace, unit: data.WriteUnit):
+    """Crawl the shards written by url_gen --shards args.shards, one lease at
+    a time, until every shard is finished or held by another node."""
+    leases = lease.ShardLeases(url_gen.shard_paths(args.shards),
+                               seconds=args.lease_seconds)
+    # Shards read to the end with urls of games dropped by a rollback left
+    # before their position, retried by the next run rather than by this one
+    left = set()
+    while True:
+        claimed = leases.claim(left)
+        if claimed is None:
+            print('No shard left to claim')
+            return
+        shard, start = claimed
+        print('Crawling {} from line {}'.format(leases.paths[shard], start))
+        # With the urls crawled by the other nodes since, e.g. by the last
+        # holder of the shard
+        data.game_urls.preload()
+        with open(leases.paths[shard], 'r') as f:
+            urls = ShardUrls(f, start, leases.lost)
+            unit.on_commit = urls.commit
+            unit.on_rollback = rolled_back(urls.rolled_back)
+
+            def checkpoint():
+                # The position only moves past games once they are committed
+                unit.flush()
+                return urls.position
+
+            leases.renew_every(checkpoint)
+            try:
+                crawl(args, urls, unit, max_urls=None, done=urls.done)
             except BaseException:
-                continue
+                leases.release()
+                raise
+            # Urls done whose games were flushed without a commit, e.g.
+            # skipped
+            urls.commit()
+            # Finished only once every line is committed
+            finished = urls.exhausted and urls.position == urls.read
+            leases.release(urls.position, finished)
+        if urls.exhausted and not finished:
+            print('{} has urls left to retry from line {}'
+                  .format(leases.paths[shard], urls.position))
+            left.add(shard)
+        if urls.exhausted or leases.lost.is_set():
+            continue
+        # Stopped by an interrupt or by too many errors
+        return
+
+
+def crawl_queue(args: argparse.Namespace, work: workqueue.WorkQueue,
+                unit: data.WriteUnit):
+    """Crawl the due urls of work until none is left to retry, waiting for
+    the retries that are not due yet, or until interrupted.
+
+    unit commits the urls done with work.commit (see workqueue).
+    """
+    while True:
+        urls = work.due()
+        crawl(args, urls, unit, max_urls=None, done=work.done,
+              failed=work.failed)
+        # Done urls whose games were flushed without a commit, e.g. skipped
+        work.commit()
+        if not work.exhausted:
+            # Stopped by an interrupt
+            return
+        wait = work.next_due()
+        if wait is None:
+            return
+        print('Waiting {:.0f} seconds for the next retry'.format(wait))
+        try:
+            time.sleep(wait)
+        except KeyboardInterrupt:
+            return
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    add_crawl_arguments(parser)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help='number of games written per transaction')
+    parser.add_argument('--url-file', default=URL_FILE,
+                        help='file with one game url per line, e.g. a shard '
+                             'written by url_gen --shards')
+    parser.add_argument('--resume', action='store_true',
+                        help='start after the position in the url file '
+                             'recorded by the last run, in {} for {}'
+                             .format(POSITION_FILE, URL_FILE))
+    parser.add_argument('--shards', type=int, default=None, metavar='N',
+                        help='crawl the N shards written by url_gen --shards '
+                             'N, claiming them from the database one at a '
+                             'time, with any number of other nodes')
+    parser.add_argument('--queue', default=None, metavar='PATH',
+                        help='crawl the urls of a durable work queue in the '
+                             'SQLite database PATH, after adding those of the '
+                             'url file not in it yet, retrying transient '
+                             'failures with exponential backoff')
+    parser.add_argument('--max-attempts', type=int,
+                        default=workqueue.MAX_ATTEMPTS,
+                        help='with --queue, attempts after which a url that '
+                             'keeps failing is failed')
+    parser.add_argument('--requeue-failed', action='store_true',
+                        help='with --queue, retry the failed urls too')
+    parser.add_argument('--lease-seconds', type=float,
+                        default=lease.LEASE_SECONDS,
+                        help='with --shards, seconds after which the shard of '
+                             'a node that stopped renewing its lease can be '
+                             'claimed by another node')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.shards and args.sqlite:
+        # Shards are leased to the nodes sharing a MySQL server
+        sys.exit('--shards cannot be used with --sqlite')
+    setup(args)
+    data.preload_entities()
+    if args.shards:
+        crawl_shards(args, data.WriteUnit(args.batch_size))
+        return
+    if args.queue:
+        work = workqueue.WorkQueue(args.queue, args.max_attempts)
+        try:
+            with open(args.url_file, 'r') as f:
+                print('Queued {} urls of {}'
+                      .format(work.add(get_urls(f)), args.url_file))
+            if args.requeue_failed:
+                print('Requeued {} failed urls'.format(work.requeue_failed()))
+            unit = data.WriteUnit(args.batch_size, on_commit=work.commit,
+                                  on_rollback=rolled_back(work.rolled_back))
+            crawl_queue(args, work, unit)
+            print(', '.join('{} {}'.format(count, state)
+                            for state, count in work.counts().items()))
+        finally:
+            work.close()
+        return
+    with open(args.url_file, "r+") as f:
+        urls = UrlFile(f, position_path(args.url_file), args.resume)
+        if urls.start:
+            print('Resuming after line {} of {}'
+                  .format(urls.start, args.url_file))
+        unit = data.WriteUnit(args.batch_size, on_commit=urls.commit,
+                              on_rollback=rolled_back(urls.rolled_back))
+        crawl(args, urls, unit, done=urls.done)
+    # Urls done whose games were flushed without a commit, e.g. skipped
+    urls.commit()
+    urls.save()
 
 
 if __name__ == '__main__':
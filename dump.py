@@ -0,0 +1,692 @@
+#!/usr/bin/python3
+"""Load games from a Wikipedia pages-articles XML dump instead of the web.
+
+The dump (pages-articles.xml.bz2, or the uncompressed xml) is streamed with
+lxml's iterparse and every page is freed as soon as it is read, so memory
+grows with the pages selected, not with the dump. The game pages selected
+are those whose titles are in the url file. The company and platform pages
+they link to, and the pages that selected redirects point to, are selected
+in further passes over the dump.
+
+Of each selected page, the {{Infobox video game}}, {{Infobox company}} or
+{{Infobox information appliance}} template and the {{Video game reviews}}
+template are rendered from wikitext into the html Wikipedia serves for them:
+an infobox table with the same row labels, and an "Aggregate score" table.
+fetch serves these pages in place of the web (see fetch.source), so that
+data_gen builds the Game, GameRelease, Company and Platform objects with the
+same extractors, and loads them the same way, as when crawling.
+"""
+
+import argparse
+import bz2
+import calendar
+import html
+import json
+import logging
+import re
+from urllib.parse import quote, unquote, urlsplit
+import zlib
+
+from lxml import etree
+
+import data
+import data_gen
+import fetch
+
+DUMP_FILE = 'pages-articles.xml.bz2'
+URL_FILE = 'url.txt'
+LOG_FILE = 'dump.log'
+
+# Passes over the dump: the game pages, the company and platform pages they
+# link to and the companies of those platforms, each of which may be a
+# redirect to the page read in the next pass
+MAX_PASSES = 5
+MAX_REDIRECTS = 5
+
+ARTICLE_NS = '0'
+
+
+def open_dump(path: str):
+    if path.endswith('.bz2'):
+        return bz2.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def read_pages(path: str):
+    """Yield (title, title redirected to or None, wikitext) of every article
+    in the dump at path, in one pass."""
+    with open_dump(path) as f:
+        for _, page in etree.iterparse(f, events=('end',), tag='{*}page'):
+            if page.findtext('{*}ns') == ARTICLE_NS:
+                redirect = page.find('{*}redirect')
+                yield (page.findtext('{*}title'),
+                       redirect.get('title') if redirect is not None
+                       else None,
+                       page.findtext('{*}revision/{*}text') or '')
+            # Free the page, and the siblings read before it
+            page.clear()
+            while page.getprevious() is not None:
+                del page.getparent()[0]
+
+
+def normalize_title(title: str):
+    """Return title as MediaWiki names the page: without a section, with
+    spaces for underscores and an upper case first letter."""
+    title = ' '.join(title.split('#', 1)[0].replace('_', ' ').split())
+    return title[:1].upper() + title[1:]
+
+
+def url_title(url: str):
+    """Return the title of the page at a wikipedia url."""
+    path = urlsplit(url).path
+    return normalize_title(unquote(path.rsplit('/wiki/', 1)[-1]))
+
+
+def title_href(title: str):
+    return '/wiki/' + quote(title.replace(' ', '_'), safe="!$'()*,/:;@~")
+
+
+# Wikitext
+
+comment_re = re.compile(r'<!--.*?(?:-->|$)', re.DOTALL)
+ref_re = re.compile(r'<ref[^>]*/>|<ref[^>]*>.*?</ref>',
+                    re.DOTALL | re.IGNORECASE)
+bracket_re = re.compile(r'\{\{|\}\}|\[\[|\]\]')
+separator_re = re.compile(r'\{\{|\}\}|\[\[|\]\]|\|')
+markup_re = re.compile(r'\{\{|\[\[|\[(?=(?:https?:)?//)')
+link_re = re.compile(r'\[\[([^\[\]|]+)')
+bold_re = re.compile(r"'''(.+?)'''")
+italic_re = re.compile(r"''(.+?)''")
+bullet_re = re.compile(r'^[*#:;]+\s*')
+scheme_re = re.compile(r'^[a-z][a-z0-9+.-]*://', re.IGNORECASE)
+region_re = re.compile(r'^[A-Z]{2,4}$')
+tag_re = re.compile(r'<[^>]*>')
+
+closers = {'{{': '}}', '[[': ']]'}
+
+# Links to these namespaces are images and categories, not text
+skipped_namespaces = ('category', 'file', 'image', 'media')
+
+
+def closing(text: str, start: int):
+    """Return the index after the }} or ]] that closes the {{ or [[ at
+    start, or None if it is not closed."""
+    stack = []
+    for m in bracket_re.finditer(text, start):
+        token = m.group(0)
+        if token in closers:
+            stack.append(closers[token])
+        elif stack and token == stack[-1]:
+            stack.pop()
+            if not stack:
+                return m.end()
+    return None
+
+
+def split_params(text: str):
+    """Split text at the |s that are not inside a nested template or
+    link."""
+    parts = []
+    depth = 0
+    last = 0
+    for m in separator_re.finditer(text):
+        token = m.group(0)
+        if token in closers:
+            depth += 1
+        elif token != '|':
+            depth = max(depth - 1, 0)
+        elif depth == 0:
+            parts.append(text[last:m.start()])
+            last = m.end()
+    parts.append(text[last:])
+    return parts
+
+
+def template_name(name: str):
+    name = ' '.join(name.replace('_', ' ').split()).lower()
+    if name.startswith('template:'):
+        name = name[len('template:'):].strip()
+    return name
+
+
+class Template:
+    """A {{name|arg|param=value|...}} template call."""
+
+    def __init__(self, source: str):
+        """Initialize Template object.
+
+        Args:
+            source: The wikitext between the braces.
+        """
+        parts = split_params(source)
+        self.name = template_name(parts[0])
+        # Positional arguments
+        self.args = []
+        # Named parameters
+        self.params = dict()
+        for part in parts[1:]:
+            key, eq, value = part.partition('=')
+            if eq and not any(c in key for c in '{[<'):
+                self.params[key.strip()] = value.strip()
+            else:
+                self.args.append(part.strip())
+
+
+def templates(text: str):
+    """Yield the templates in text that are not inside another one."""
+    start = text.find('{{')
+    while start != -1:
+        end = closing(text, start)
+        if end is None:
+            return
+        yield Template(text[start + 2:end - 2])
+        start = text.find('{{', end)
+
+
+def render(text: str, ref: str = ''):
+    """Render wikitext as the html of an infobox cell.
+
+    References are replaced with ref. Templates that only decorate text are
+    dropped.
+    """
+    text = ref_re.sub(ref, comment_re.sub('', text))
+    out = []
+    i = 0
+    while True:
+        m = markup_re.search(text, i)
+        if m is None:
+            out.append(text[i:])
+            break
+        out.append(text[i:m.start()])
+        if m.group(0) == '[':
+            end = text.find(']', m.start())
+            if end == -1:
+                out.append(text[m.start():])
+                break
+            out.append(render_external_link(text[m.start() + 1:end]))
+            i = end + 1
+            continue
+
+        end = closing(text, m.start())
+        if end is None:
+            out.append(text[m.start():])
+            break
+        source = text[m.start() + 2:end - 2]
+        if m.group(0) == '{{':
+            out.append(render_template(Template(source), ref))
+        else:
+            out.append(render_link(source))
+        i = end
+
+    html_ = bold_re.sub(r'<b>\1</b>', ''.join(out))
+    html_ = italic_re.sub(r'<i>\1</i>', html_)
+    lines = (bullet_re.sub('', line).strip() for line in html_.split('\n'))
+    return '<br/>'.join(line for line in lines if line)
+
+
+def link(title: str, label: str):
+    return '<a href="{}" title="{}">{}</a>'.format(
+        html.escape(title_href(title)), html.escape(title), label)
+
+
+def render_link(source: str):
+    """Render the [[target|label]] link whose source is between the
+    brackets."""
+    target, _, label = source.partition('|')
+    target = target.strip().lstrip(':')
+    namespace, colon, _ = target.partition(':')
+    if colon and namespace.strip().lower() in skipped_namespaces:
+        return ''
+    title = normalize_title(target)
+    label = render(label) if label.strip() else target
+    if not title:
+        return label
+    return link(title, label)
+
+
+def render_external_link(source: str):
+    url, _, label = source.partition(' ')
+    return '<a class="external text" href="{}">{}</a>'.format(
+        html.escape(url), label.strip() or html.escape(url))
+
+
+def render_date(args):
+    """Render the year, month and day of a date template as text, in a span
+    of its own like Wikipedia does."""
+    numbers = [int(arg) for arg in args if arg.isdigit()][:3]
+    if not numbers:
+        return ''
+    if len(numbers) == 1 or not 1 <= numbers[1] <= 12:
+        date = str(numbers[0])
+    elif len(numbers) == 2:
+        date = '{} {}'.format(calendar.month_name[numbers[1]], numbers[0])
+    else:
+        date = '{} {}, {}'.format(calendar.month_name[numbers[1]],
+                                  numbers[2], numbers[0])
+    return '<span class="date">{}</span>'.format(date)
+
+
+regions = {
+    'AU': 'Australia',
+    'EU': 'Europe',
+    'JP': 'Japan',
+    'KO': 'South Korea',
+    'NA': 'North America',
+    'PAL': 'PAL region',
+    'WW': 'Worldwide',
+}
+
+
+def render_releases(template: Template, ref: str = ''):
+    """Render a {{Video game release}} template as the plainlist of region
+    and date items GameRelease.get_releases reads."""
+    pairs = list(zip(template.args[::2], template.args[1::2]))
+    pairs += [(key, value) for key, value in template.params.items()
+              if region_re.match(key)]
+    items = []
+    for region, date in pairs:
+        # The date is read from the text right after the region
+        date = tag_re.sub('', render(date, ref))
+        if not region or not date:
+            continue
+        items.append('<li><span style="font-size:95%;"><a href="/wiki/{0}" '
+                     'title="{1}">{0}</a></span> {2}</li>'
+                     .format(html.escape(region),
+                             html.escape(regions.get(region, region)), date))
+    return '<div class="plainlist"><ul>{}</ul></div>'.format(''.join(items))
+
+
+date_templates = (
+    'start date', 'start date and age', 'end date', 'end date and age',
+    'release date', 'release date and age', 'film date',
+)
+list_templates = (
+    'ubl', 'ublist', 'unbulleted list', 'plainlist', 'plain list',
+    'flatlist', 'flat list', 'hlist', 'bulleted list',
+)
+text_templates = ('nowrap', 'nobr', 'nobold', 'small', 'vgy', 'nihongo')
+release_templates = (
+    'video game release', 'vgrelease', 'video game release new',
+    'vgrelease new',
+)
+
+collapsible_html = '<div class="NavFrame collapsed">' \
+    '<div class="NavHead">{title}</div>' \
+    '<div class="NavContent"><ul>{items}</ul></div></div>'
+
+
+def render_template(template: Template, ref: str = ''):
+    name = template.name
+    if name in date_templates:
+        return render_date(template.args)
+    if name in list_templates:
+        items = (render(arg, ref) for arg in template.args)
+        return '<br/>'.join(item for item in items if item)
+    if name == 'collapsible list':
+        items = ''.join('<li>{}</li>'.format(render(arg, ref))
+                        for arg in template.args)
+        return collapsible_html.format(
+            title=render(template.params.get('title', ''), ref), items=items)
+    if name in text_templates:
+        return render(template.args[0], ref) if template.args else ''
+    if name in release_templates:
+        return render_releases(template, ref)
+    if name == 'lang':
+        return render(template.args[1], ref) if len(template.args) > 1 else ''
+    if name == 'url' and template.args:
+        url = template.args[0]
+        label = template.args[1] if len(template.args) > 1 \
+            else scheme_re.sub('', url).rstrip('/')
+        if not scheme_re.match(url):
+            url = 'http://' + url
+        return '<a class="external text" href="{}">{}</a>'.format(
+            html.escape(url), html.escape(label))
+    if name == 'ill' and template.args:
+        return render_link('|'.join((template.args[0],
+                                     template.params.get('lt', ''))))
+    if name in ('us$', 'usd'):
+        return link('United States dollar', 'US$') \
+            + (render(template.args[0], ref) if template.args else '')
+    return ''
+
+
+# Infoboxes
+
+GAME = 'game'
+COMPANY = 'company'
+PLATFORM = 'platform'
+
+infobox_kinds = {
+    'infobox video game': GAME,
+    'infobox vg': GAME,
+    'infobox videogame': GAME,
+    'infobox company': COMPANY,
+    'infobox information appliance': PLATFORM,
+}
+review_templates = ('video game reviews', 'vg reviews')
+
+# Template parameter -> label of its row in the rendered infobox, in row
+# order. The labels are those the extractors in data look for.
+row_labels = {
+    GAME: (
+        ('developer', 'Developer(s)'),
+        ('publisher', 'Publisher(s)'),
+        ('creator', 'Creator(s)'),
+        ('director', 'Director(s)'),
+        ('producer', 'Producer(s)'),
+        ('designer', 'Designer(s)'),
+        ('programmer', 'Programmer(s)'),
+        ('artist', 'Artist(s)'),
+        ('writer', 'Writer(s)'),
+        ('composer', 'Composer(s)'),
+        ('series', 'Series'),
+        ('engine', 'Engine'),
+        ('platforms', 'Platform(s)'),
+        ('platform', 'Platform(s)'),
+        ('released', 'Release'),
+        ('release', 'Release'),
+        ('genre', 'Genre(s)'),
+        ('modes', 'Mode(s)'),
+    ),
+    COMPANY: (
+        ('founded', 'Founded'),
+        ('founder', 'Founder'),
+        ('founders', 'Founders'),
+        ('defunct', 'Defunct'),
+        ('hq_location', 'Headquarters'),
+        ('headquarters', 'Headquarters'),
+        ('location', 'Headquarters'),
+        ('website', 'Website'),
+        ('homepage', 'Website'),
+    ),
+    PLATFORM: (
+        ('developer', 'Developer'),
+        ('manufacturer', 'Manufacturer'),
+        ('type', 'Type'),
+        ('generation', 'Generation'),
+        ('releasedate', 'Release date'),
+        ('release date', 'Release date'),
+        ('discontinued', 'Discontinued'),
+        ('introprice', 'Introductory price'),
+        ('price', 'Introductory price'),
+    ),
+}
+
+# Parameters of a game infobox that link to company and platform pages
+game_link_params = ('developer', 'publisher', 'platforms', 'platform')
+# Parameters of a platform infobox whose first link is to its company, see
+# data.platform_company_url
+platform_link_params = ('developer', 'manufacturer')
+
+# Review score template parameter -> aggregator, as in
+# Game.reception_srcs
+aggregators = (
+    ('MC', 'Metacritic'),
+    ('GR', 'GameRankings'),
+)
+# Review scores are read up to their first reference
+REFERENCE = '<sup class="reference">[*]</sup>'
+
+page_html = """<!DOCTYPE html>
+<html>
+<head><title>{title} - Wikipedia</title></head>
+<body>
+<div id="content">
+<h1 id="firstHeading" class="firstHeading">{title}</h1>
+<div id="bodyContent">
+<div id="mw-content-text"><div class="mw-parser-output">
+{infobox}{reviews}</div></div>
+</div>
+</div>
+</body>
+</html>
+"""
+infobox_html = """<table class="infobox">
+<tbody><tr>
+<th colspan="2">{title}</th>
+</tr>
+{rows}</tbody>
+</table>
+"""
+row_html = """<tr>
+<th scope="row">{label}</th>
+<td>{cell}</td>
+</tr>
+"""
+reviews_html = """<div class="video-game-reviews"><table class="wikitable">
+<tbody><tr>
+<th colspan="2">Aggregate score</th>
+</tr>
+<tr>
+<th>Aggregator</th>
+<th>Score</th>
+</tr>
+{rows}</tbody></table></div>
+"""
+score_html = """<tr>
+<td>{link}</td>
+<td>{score}</td>
+</tr>
+"""
+
+
+class Article:
+    """The infobox and review scores of a page, read from its wikitext."""
+
+    def __init__(self, title: str, wikitext: str):
+        self.title = title
+        # GAME, COMPANY, PLATFORM, or None if the page has none of their
+        # infoboxes
+        self.kind = None
+        self.params = dict()
+        self.scores = dict()
+        for template in templates(comment_re.sub('', wikitext)):
+            if self.kind is None and template.name in infobox_kinds:
+                self.kind = infobox_kinds[template.name]
+                self.params = template.params
+            elif not self.scores and template.name in review_templates:
+                self.scores = template.params
+
+        if self.kind == COMPANY and not self.params.get('hq_location'):
+            self.params['hq_location'] = ', '.join(
+                self.params[param]
+                for param in ('hq_location_city', 'hq_location_country')
+                if self.params.get(param))
+
+    def param_links(self, param: str):
+        """Return the titles of the pages linked from a parameter of the
+        infobox, in order."""
+        titles = []
+        for m in link_re.finditer(self.params.get(param, '')):
+            namespace, colon, _ = m.group(1).partition(':')
+            if colon and namespace.strip().lower() in skipped_namespaces:
+                continue
+            title = normalize_title(m.group(1))
+            if title:
+                titles.append(title)
+        return titles
+
+    def links(self):
+        """Return the titles of the company and platform pages that are
+        extracted from along with this page."""
+        if self.kind == GAME:
+            return {title for param in game_link_params
+                    for title in self.param_links(param)}
+        if self.kind == PLATFORM:
+            for param in platform_link_params:
+                titles = self.param_links(param)
+                if titles:
+                    return {titles[0]}
+        return set()
+
+    def infobox_html(self):
+        if self.kind is None:
+            return ''
+        rows = []
+        labels = set()
+        for param, label in row_labels[self.kind]:
+            if label in labels or not self.params.get(param):
+                continue
+            cell = render(self.params[param])
+            if cell:
+                labels.add(label)
+                rows.append(row_html.format(label=label, cell=cell))
+        return infobox_html.format(title=html.escape(self.title),
+                                   rows=''.join(rows))
+
+    def reviews_html(self):
+        rows = []
+        for param, aggregator in aggregators:
+            if not self.scores.get(param):
+                continue
+            score = render(self.scores[param], REFERENCE)
+            if '<sup' not in score:
+                score += REFERENCE
+            rows.append(score_html.format(link=link(aggregator, aggregator),
+                                          score=score))
+        if not rows:
+            return ''
+        return reviews_html.format(rows=''.join(rows))
+
+    def html(self):
+        return page_html.format(title=html.escape(self.title),
+                                infobox=self.infobox_html(),
+                                reviews=self.reviews_html())
+
+
+class Dump:
+    """Pages selected from a dump, rendered as html."""
+
+    def __init__(self, path: str = DUMP_FILE):
+        self.path = path
+        # title -> zlib-compressed html
+        self.pages = dict()
+        # title -> GAME, COMPANY, PLATFORM or None
+        self.kinds = dict()
+        # title -> title of the page it redirects to
+        self.redirects = dict()
+        # Titles looked for that are not in the dump
+        self.missing = set()
+
+    def scan(self, titles: set):
+        """Read the pages titled titles in one pass over the dump.
+
+        Returns the titles of the pages they link to or redirect to.
+        """
+        linked = set()
+        found = set()
+        for title, redirect, wikitext in read_pages(self.path):
+            if title not in titles:
+                continue
+            found.add(title)
+            if redirect:
+                target = normalize_title(redirect)
+                self.redirects[title] = target
+                linked.add(target)
+            else:
+                article = Article(title, wikitext)
+                self.pages[title] = zlib.compress(
+                    article.html().encode('utf-8'))
+                self.kinds[title] = article.kind
+                linked.update(article.links())
+            if len(found) == len(titles):
+                break
+        self.missing.update(titles - found)
+        return linked
+
+    def load(self, titles, max_passes: int = MAX_PASSES):
+        """Select the pages titled titles, and the pages they link to, in up
+        to max_passes passes over the dump."""
+        titles = {normalize_title(title) for title in titles}
+        for number in range(1, max_passes + 1):
+            titles -= self.pages.keys() | self.redirects.keys() | self.missing
+            if not titles:
+                return
+            print('Pass {}: looking for {} pages'.format(number, len(titles)))
+            titles = self.scan(titles)
+
+        titles -= self.pages.keys() | self.redirects.keys() | self.missing
+        if titles:
+            logging.error('Dump.load: {} linked pages not read in {} passes'
+                          .format(len(titles), max_passes))
+
+    def resolve(self, title: str):
+        """Return the title of the page that title redirects to."""
+        for _ in range(MAX_REDIRECTS):
+            if title not in self.redirects:
+                break
+            title = self.redirects[title]
+        return title
+
+    def has(self, url: str):
+        return self.resolve(url_title(url)) in self.pages
+
+    def get(self, url: str):
+        """Return the html of the page at url, following redirects.
+
+        Raises requests.exceptions.HTTPError if the page was not selected
+        from the dump.
+        """
+        page = self.pages.get(self.resolve(url_title(url)))
+        if page is None:
+            import requests
+            raise requests.exceptions.HTTPError(
+                '404 Client Error: Not in {} for url: {}'
+                .format(self.path, url))
+        return zlib.decompress(page).decode('utf-8')
+
+
+def print_fields(dump: Dump):
+    """Print the fields extracted from every selected page, as parity does,
+    without using the database."""
+    import parity
+
+    for title in sorted(dump.pages):
+        kind = dump.kinds[title]
+        if kind is None:
+            print('{}: no infobox'.format(title))
+            continue
+        page = data.parse_html(dump.get(title_href(title)))
+        print('{} {}: {}'.format(kind, title,
+                                 json.dumps(parity.extractors[kind](page),
+                                            ensure_ascii=False)))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    data_gen.add_crawl_arguments(parser)
+    parser.add_argument('--dump', default=DUMP_FILE,
+                        help='pages-articles xml dump, bz2-compressed or not')
+    parser.add_argument('--url-file', default=URL_FILE,
+                        help='urls of the game pages to load')
+    parser.add_argument('--batch-size', type=int, default=data_gen.BATCH_SIZE,
+                        help='number of games written per transaction')
+    parser.add_argument('--max-passes', type=int, default=MAX_PASSES,
+                        help='maximum number of passes over the dump')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='print the fields extracted from the selected '
+                             'pages instead of loading them')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    data_gen.setup(args, LOG_FILE)
+    with open(args.url_file, 'r') as f:
+        urls = list(data_gen.get_urls(f))
+
+    dump = Dump(args.dump)
+    dump.load(map(url_title, urls), args.max_passes)
+    if args.dry_run:
+        print_fields(dump)
+        return
+
+    fetch.source = dump.get
+    data.preload_entities()
+    urls = [url for url in urls if dump.has(url)]
+    print('{} games in {}'.format(len(urls), args.dump))
+    data_gen.crawl(args, urls, data.WriteUnit(args.batch_size), max_urls=None)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,253 @@
+"""Wikipedia page extraction with lxml and precompiled XPath expressions.
+
+A Page parses the html of a page with lxml and reaches the parts that are
+extracted from, the title heading, the infobox and the "Aggregate score"
+table, with precompiled XPath expressions, instead of building a
+BeautifulSoup tree of the whole page and walking it with find calls. The
+infobox is scanned once per page into an Infobox, a map from row labels to
+cells that all extractors share.
+
+The helpers below reproduce the BeautifulSoup navigation the extractors in
+data were written against (string, strings, next_sibling, ...) on lxml
+elements, so that they return the same fields. In lxml, the text following
+an element is its tail; here, as in BeautifulSoup, it is the next sibling of
+the element and a child of the element's parent. Text nodes are returned as
+str.
+"""
+
+from lxml import etree
+import lxml.html
+
+# Same elements as the chained finds from <body> they replace
+content_xpath = etree.XPath("(/html/body//div[@id='content'])[1]")
+title_xpath = etree.XPath("descendant::h1[@id='firstHeading'][1]")
+infobox_xpath = etree.XPath(
+    "descendant::div[@id='bodyContent'][1]"
+    "/descendant::table[contains(concat(' ', normalize-space(@class), ' '),"
+    " ' infobox ')][1]")
+parser_output_xpath = etree.XPath(
+    "descendant::div[@id='bodyContent'][1]"
+    "/descendant::div[@id='mw-content-text'][1]"
+    "/descendant::div[contains(concat(' ', normalize-space(@class), ' '),"
+    " ' mw-parser-output ')][1]")
+# Text nodes in document order, as smart strings that know their element
+text_xpath = etree.XPath('descendant::text()')
+
+
+def first(elements):
+    return elements[0] if elements else None
+
+
+def is_tag(node):
+    """Whether node is an element, rather than text or a comment."""
+    return not isinstance(node, str) and isinstance(node.tag, str)
+
+
+def name(node):
+    """Return the tag of node, or None if node is not an element."""
+    return node.tag if is_tag(node) else None
+
+
+def children(el):
+    """Return the child nodes of el: elements, comments and text."""
+    nodes = [el.text] if el.text else []
+    for child in el:
+        nodes.append(child)
+        if child.tail:
+            nodes.append(child.tail)
+    return nodes
+
+
+def string(node):
+    """Return the text of node if node is text or holds exactly one text
+    node, through single children, and None otherwise."""
+    while not isinstance(node, str):
+        if not is_tag(node):
+            return node.text
+        nodes = children(node)
+        if len(nodes) != 1:
+            return None
+        node = nodes[0]
+    return node
+
+
+def text_nodes(el):
+    """Return the text nodes below el in document order, as smart strings
+    that know their element."""
+    if el is None:
+        raise AttributeError("'NoneType' object has no text nodes")
+    return text_xpath(el)
+
+
+def strings(el):
+    """Return the text nodes below el in document order."""
+    return [str(s) for s in text_nodes(el)]
+
+
+def stripped_strings(el):
+    return [s.strip() for s in strings(el) if s.strip()]
+
+
+def text_parent(s):
+    """Return the element that text node s, a smart string, is a child
+    of."""
+    parent = s.getparent()
+    return parent.getparent() if s.is_tail else parent
+
+
+def find_string(el, pattern):
+    """Return the first text node below el that pattern is found in, as a
+    smart string, or None."""
+    for s in text_nodes(el):
+        if pattern.search(s):
+            return s
+    return None
+
+
+def find(el, tag: str, string_=None, **attrs):
+    """Return the first element below el named tag whose string is string_
+    and whose attributes match attrs, or None.
+
+    string_ and attribute values may be strings, which must be equal, or
+    compiled patterns, which must be found. An attribute value of True
+    only requires the attribute.
+    """
+    for found in el.iterdescendants(tag):
+        if matches(found, string_, attrs):
+            return found
+    return None
+
+
+def find_all(el, tag: str, string_=None, **attrs):
+    return [found for found in el.iterdescendants(tag)
+            if matches(found, string_, attrs)]
+
+
+def match(value, pattern):
+    if pattern is True:
+        return value is not None
+    if value is None:
+        return False
+    if isinstance(pattern, str):
+        return value == pattern
+    return pattern.search(value) is not None
+
+
+def matches(el, string_, attrs):
+    if string_ is not None and not match(string(el), string_):
+        return False
+    return all(match(el.get(attr), pattern)
+               for attr, pattern in attrs.items())
+
+
+def next_siblings(node):
+    """Yield the nodes after element node under the same parent."""
+    if node.tail:
+        yield node.tail
+    for sibling in node.itersiblings():
+        yield sibling
+        if sibling.tail:
+            yield sibling.tail
+
+
+def next_sibling(node, n: int = 1):
+    """Return the nth node after element node under the same parent, or
+    None if there are fewer."""
+    for i, sibling in enumerate(next_siblings(node), 1):
+        if i == n:
+            return sibling
+    return None
+
+
+def previous_sibling(node):
+    sibling = node.getprevious()
+    if sibling is not None:
+        return sibling.tail if sibling.tail else sibling
+    parent = node.getparent()
+    return parent.text if parent is not None and parent.text else None
+
+
+def normalize(label: str):
+    """Return label with runs of whitespace, including non-breaking spaces,
+    replaced by single spaces."""
+    return ' '.join(label.split())
+
+
+def classes(el):
+    """Return the classes of el; KeyError if it has no class attribute."""
+    return el.attrib['class'].split()
+
+
+class Infobox:
+    """Label -> cell map of an infobox table, built in one scan.
+
+    Every row with a th header followed by a td cell is indexed by the
+    normalized text of the header, e.g. 'Developer(s)' or 'Release date'.
+    """
+
+    def __init__(self, table):
+        self.table = table
+        # (label, td) of every row, in document order
+        self.rows = []
+        # label -> td of the first row with that label
+        self.cells = dict()
+        for tr in table.iter('tr'):
+            th = first([c for c in tr if is_tag(c) and c.tag == 'th'])
+            if th is None:
+                continue
+            td = next((sibling for sibling in th.itersiblings()
+                       if is_tag(sibling) and sibling.tag == 'td'), None)
+            if td is None:
+                continue
+            label = normalize(''.join(strings(th)))
+            self.rows.append((label, td))
+            self.cells.setdefault(label, td)
+
+    def td(self, label):
+        """Return the cell of the first row whose label is label, or, if
+        label is a compiled pattern, whose label it is found in. None if
+        there is no such row."""
+        if isinstance(label, str):
+            return self.cells.get(normalize(label))
+        for row_label, td in self.rows:
+            if label.search(row_label):
+                return td
+        return None
+
+
+class Page:
+    """A parsed wikipedia page."""
+
+    def __init__(self, html: str):
+        self.root = lxml.html.document_fromstring(html)
+        self._content = first(content_xpath(self.root))
+        self._infobox = None
+        self._infobox_found = False
+
+    @property
+    def content(self):
+        """div#content; AttributeError if the page has none."""
+        if self._content is None:
+            raise AttributeError('page has no div#content')
+        return self._content
+
+    @property
+    def infobox(self):
+        """The Infobox of the page, or None if it has none."""
+        if not self._infobox_found:
+            table = first(infobox_xpath(self.content))
+            self._infobox = Infobox(table) if table is not None else None
+            self._infobox_found = True
+        return self._infobox
+
+    def title(self):
+        h1 = first(title_xpath(self.content))
+        if h1 is None:
+            raise AttributeError('page has no h1#firstHeading')
+        return string(h1)
+
+    def aggregate_score_table(self):
+        """Return the tbody (or table) of the "Aggregate score" table."""
+        output = first(parser_output_xpath(self.content))
+        th = find(output, 'th', 'Aggregate score')
+        return th.getparent().getparent()
@@ -0,0 +1,290 @@
+"""HTTP fetching through a persistent on-disk response cache.
+
+Response bodies are stored zlib-compressed and content-addressed (by the
+SHA-256 of the body) under CACHE_DIR/objects. A small JSON index entry per
+url, named by the SHA-1 of the url, points to the body and remembers the
+ETag and Last-Modified headers of the response, so that later fetches of the
+same url can be revalidated with a conditional request and only transfer
+pages that changed.
+
+Every request is paced by the flow control of its host (see throttle).
+
+requests is imported when the first session is created.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import zlib
+
+import metrics
+import throttle as throttle_
+
+CACHE_DIR = 'http_cache'
+PREFETCH_WORKERS = 8
+# Seconds to wait for a response
+TIMEOUT = 60
+
+
+class Cache:
+    def __init__(self, path: str = CACHE_DIR, max_age: float = None):
+        """Initialize Cache object.
+
+        Args:
+            path: Directory the cache is stored in.
+            max_age: If given, then cached responses younger than max_age
+                seconds are used without revalidating them.
+        """
+        self.path = path
+        self.max_age = max_age
+
+    def index_path(self, url: str):
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.path, 'index', key[:2], key + '.json')
+
+    def object_path(self, digest: str):
+        return os.path.join(self.path, 'objects', digest[:2], digest + '.z')
+
+    @staticmethod
+    def write_atomic(path: str, content: bytes):
+        dir_ = os.path.dirname(path)
+        os.makedirs(dir_, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=dir_)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.replace(tmp, path)
+
+    def lookup(self, url: str):
+        """Return the index entry of url, or None if url is not cached."""
+        try:
+            with open(self.index_path(url), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not os.path.exists(self.object_path(entry['sha256'])):
+            return None
+        return entry
+
+    def load(self, entry: dict):
+        with open(self.object_path(entry['sha256']), 'rb') as f:
+            return zlib.decompress(f.read()).decode('utf-8')
+
+    def store(self, url: str, text: str, headers=None):
+        body = text.encode('utf-8')
+        digest = hashlib.sha256(body).hexdigest()
+        object_path = self.object_path(digest)
+        if not os.path.exists(object_path):
+            Cache.write_atomic(object_path, zlib.compress(body, 6))
+
+        if headers is None:
+            headers = dict()
+        entry = {
+            'url': url,
+            'sha256': digest,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'fetched': time.time(),
+        }
+        Cache.write_atomic(self.index_path(url),
+                           json.dumps(entry).encode('utf-8'))
+        return entry
+
+    def touch(self, url: str, entry: dict):
+        entry['fetched'] = time.time()
+        Cache.write_atomic(self.index_path(url),
+                           json.dumps(entry).encode('utf-8'))
+
+    def is_fresh(self, entry: dict):
+        return self.max_age is not None \
+            and time.time() - entry['fetched'] < self.max_age
+
+
+# Set to None to disable caching
+cache = Cache()
+
+# If set, then pages are read with source(url) instead of being requested,
+# e.g. from a dump (see dump.py). source raises
+# requests.exceptions.HTTPError for pages it does not have.
+source = None
+# If set, then every page requested is also added to this archive.Pack
+archive = None
+# Set to None to send requests without flow control
+throttle = throttle_.Throttle()
+
+pages = metrics.counter('gamedb_fetch_pages_total',
+                        'Pages fetched, by where they came from')
+http_requests = metrics.counter('gamedb_http_requests_total',
+                                'HTTP requests sent, by status code')
+http_bytes = metrics.counter('gamedb_http_bytes_total',
+                             'Bytes of HTTP response bodies downloaded')
+http_seconds = metrics.histogram('gamedb_http_request_seconds',
+                                 'Seconds from sending an HTTP request to '
+                                 'its response')
+throttle_seconds = metrics.histogram('gamedb_throttle_wait_seconds',
+                                     'Seconds an HTTP request waited for the '
+                                     'flow control of its host')
+
+_local = threading.local()
+
+
+def session():
+    """Return a requests.Session for the calling thread."""
+    if not hasattr(_local, 'session'):
+        import requests
+        _local.session = requests.Session()
+    return _local.session
+
+
+def conditional_headers(entry: dict):
+    headers = dict()
+    if entry.get('etag'):
+        headers['If-None-Match'] = entry['etag']
+    if entry.get('last_modified'):
+        headers['If-Modified-Since'] = entry['last_modified']
+    return headers
+
+
+def get(url: str, revalidate: bool = False):
+    """Return the text of the page at url.
+
+    If url is being prefetched, then wait for and return the prefetched page.
+    If revalidate, then a cached page is revalidated with a conditional
+    request even if it is younger than the cache's max_age.
+
+    Raises requests.exceptions.HTTPError if the request fails.
+    """
+    with _prefetched_lock:
+        future = _prefetched.get(url)
+    if future:
+        return future.result()
+    return request(url, revalidate)
+
+
+def request(url: str, revalidate: bool = False):
+    if source is not None:
+        pages.inc(origin='source')
+        return source(url)
+
+    text = download(url, revalidate)
+    if archive is not None:
+        archive.add(url, text)
+    return text
+
+
+def download(url: str, revalidate: bool = False):
+    entry = cache.lookup(url) if cache else None
+    if entry and cache.is_fresh(entry) and not revalidate:
+        pages.inc(origin='cache')
+        return cache.load(entry)
+
+    headers = conditional_headers(entry) if entry else None
+    r = send(url, headers)
+    if entry and r.status_code == 304:
+        pages.inc(origin='not_modified')
+        cache.touch(url, entry)
+        return cache.load(entry)
+    r.raise_for_status()
+    pages.inc(origin='download')
+
+    if cache:
+        cache.store(url, r.text, r.headers)
+    return r.text
+
+
+def send(url: str, headers=None):
+    """Request url, waiting for the flow control of its host.
+
+    Raises throttle.CircuitOpen if the host keeps failing.
+    """
+    if throttle is not None:
+        with throttle_seconds.time():
+            throttle.acquire(url)
+    start = time.monotonic()
+    try:
+        r = session().get(url, headers=headers, timeout=TIMEOUT)
+    except BaseException:
+        http_requests.inc(status='error')
+        if throttle is not None:
+            throttle.release(url)
+        raise
+    latency = time.monotonic() - start
+    http_seconds.observe(latency)
+    http_requests.inc(status=r.status_code)
+    http_bytes.inc(len(r.content))
+    if throttle is not None:
+        throttle.release(url, latency, r.status_code, r.headers)
+    return r
+
+
+_prefetch_pool = None
+# url -> concurrent.futures.Future of the page text
+_prefetched = dict()
+_prefetched_lock = threading.Lock()
+
+
+def prefetch_pool():
+    global _prefetch_pool
+    if _prefetch_pool is None:
+        _prefetch_pool = ThreadPoolExecutor(PREFETCH_WORKERS)
+    return _prefetch_pool
+
+
+def prefetch_one(url: str, then=None):
+    text = request(url)
+    if then:
+        try:
+            then(text)
+        except Exception:
+            logging.exception('fetch.prefetch: callback for {} failed'
+                              .format(url))
+    return text
+
+
+def prefetch(urls, then=None):
+    """Start fetching urls concurrently on the prefetch thread pool.
+
+    A later get of one of the urls waits for its prefetch instead of sending
+    another request. Prefetched pages are kept until clear_prefetched is
+    called.
+
+    Args:
+        urls: Iterable of urls to prefetch.
+        then: If given, then called with the text of each prefetched page
+            on the thread that fetched it, e.g. to prefetch the pages it
+            links to.
+    """
+    with _prefetched_lock:
+        for url in urls:
+            if url not in _prefetched:
+                _prefetched[url] = prefetch_pool().submit(prefetch_one, url,
+                                                          then)
+
+
+def clear_prefetched():
+    """Forget all prefetched pages, cancelling those not yet started."""
+    with _prefetched_lock:
+        futures = list(_prefetched.values())
+        _prefetched.clear()
+    for future in futures:
+        future.cancel()
+
+
+def _after_fork():
+    # A forked child has none of the threads of its parent: start its own
+    # prefetch pool and sessions instead of sharing the parent's
+    global _local, _prefetch_pool, _prefetched_lock
+    _local = threading.local()
+    _prefetch_pool = None
+    _prefetched.clear()
+    _prefetched_lock = threading.Lock()
+    # A Throttle served by a throttle.Manager is shared with the parent
+    if isinstance(throttle, throttle_.Throttle):
+        throttle.reset()
+
+
+os.register_at_fork(after_in_child=_after_fork)
@@ -1,9 +1,438 @@
+"""Database connections.
+
+Importing this module does not connect to the database; the pool opens
+connections when they are first checked out.
+
+Connections are opened by backend: MySQL, the server of mysql_config, unless
+use selects another, e.g. gamedb_sqlite.SQLite, an embedded database. Every
+backend takes the same statements, in the MySQL dialect with %s parameters,
+and raises the errors below, so callers need not know which one is in use.
+
+If tracer is set to a Tracer before the first connection is opened, then
+every statement is recorded with its duration and caller, and the statements
+of each traced unit, e.g. a game (see traced), are reported with the ones
+issued over and over from the same place (N+1 queries) and the slow ones.
+"""
+
 import atexit
+import contextlib
+import logging
+import os
+import queue
+import threading
+import time
+import traceback
 
 import pymysql
+from pymysql.constants import ER
+
+POOL_SIZE = 8
+# Idle connections are pinged, and reconnected if dropped, before reuse
+PING_INTERVAL = 30
+
+# A statement issued this many times from the same place within a traced
+# unit is reported as an N+1 query
+N_PLUS_ONE = 5
+# A statement taking this many seconds is reported as slow
+SLOW_SECONDS = 0.1
+# Frames of the caller recorded with a statement
+STACK_DEPTH = 4
+
+# Statements run on every new connection
+sql_execute_init = (
+)
+
+# Errors raised by the connections of every backend
+Error = pymysql.err.Error
+IntegrityError = pymysql.err.IntegrityError
+InternalError = pymysql.err.InternalError
+OperationalError = pymysql.err.OperationalError
+# args[0] of an IntegrityError raised on a duplicate key
+DUP_ENTRY = ER.DUP_ENTRY
+
+
+# Step between the ids of the rows of a multi-row INSERT
+autoinc_sql = "SELECT @@auto_increment_increment"
+
+
+class MySQL:
+    """Backend storing the database in the MySQL server of mysql_config."""
+
+    name = 'mysql'
+
+    def __init__(self):
+        # Whether the rows of a multi-row INSERT get consecutive ids starting
+        # at its lastrowid (see data.insert_rows). InnoDB allocates the ids
+        # of such a "simple insert" at once in every innodb_autoinc_lock_mode,
+        # but a connection may increment ids by more than 1.
+        self.consecutive_ids = True
+
+    def connect(self, **kwargs):
+        """Return a new connection, with kwargs overriding the
+        configuration."""
+        from mysql_config import config
+
+        conn = pymysql.connect(**dict(config['mysql'], **kwargs))
+        with conn.cursor() as cu:
+            cu.execute(autoinc_sql)
+            increment = cu.fetchone()[0]
+        if self.consecutive_ids and increment != 1:
+            self.consecutive_ids = False
+            logging.warning('gamedb: auto_increment_increment={}: inserting '
+                            'rows one at a time'.format(increment))
+        return conn
+
+
+backend = MySQL()
+
+
+def connect(**kwargs):
+    """Return a new connection of backend, with kwargs overriding its
+    configuration."""
+    conn = backend.connect(**kwargs)
+    if tracer is not None:
+        conn = TracingConnection(conn, tracer)
+    if sql_execute_init:
+        with conn.cursor() as cu:
+            for stmt in sql_execute_init:
+                cu.execute(stmt)
+        conn.commit()
+    return conn
+
+
+def caller(depth: int = STACK_DEPTH):
+    """Return the depth innermost frames of the stack outside this module,
+    as 'file:line function' separated by ' < '."""
+    frames = [frame for frame in traceback.extract_stack()
+              if frame.filename != __file__]
+    return ' < '.join('{}:{} {}'.format(os.path.basename(frame.filename),
+                                        frame.lineno, frame.name)
+                      for frame in reversed(frames[-depth:]))
+
+
+class Trace:
+    """Statements of one traced unit."""
+
+    def __init__(self, label: str):
+        self.label = label
+        # (sql, caller) -> [count, rows, seconds, slowest]
+        self.statements = dict()
+        self.count = 0
+        self.seconds = 0.0
+
+    def add(self, sql: str, where: str, rows: int, seconds: float):
+        stats = self.statements.setdefault((sql, where), [0, 0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += rows
+        stats[2] += seconds
+        stats[3] = max(stats[3], seconds)
+        self.count += 1
+        self.seconds += seconds
+
+    def findings(self, n_plus_one: int = N_PLUS_ONE,
+                 slow_seconds: float = SLOW_SECONDS):
+        """Return (kind, sql, caller, count, rows, seconds) of the N+1 and
+        slow statements, slowest in total first."""
+        found = []
+        for (sql, where), (count, rows, seconds, slowest) \
+                in self.statements.items():
+            if count >= n_plus_one:
+                found.append(('N+1', sql, where, count, rows, seconds))
+            elif slowest >= slow_seconds:
+                found.append(('slow', sql, where, count, rows, seconds))
+        return sorted(found, key=lambda f: -f[5])
+
+    def report(self, n_plus_one: int = N_PLUS_ONE,
+               slow_seconds: float = SLOW_SECONDS):
+        lines = ['== {}: {} statements, {:.1f} ms'
+                 .format(self.label, self.count, 1000 * self.seconds)]
+        for kind, sql, where, count, rows, seconds \
+                in self.findings(n_plus_one, slow_seconds):
+            lines.append('  {:4} {:4}x {:4} rows {:8.1f} ms  {}'
+                         .format(kind, count, rows, 1000 * seconds,
+                                 ' '.join(sql.split())))
+            lines.append('       at {}'.format(where))
+        return '\n'.join(lines) + '\n'
+
+
+class Tracer:
+    """Records the statements of TracingConnections into the Trace of the
+    unit traced on the calling thread, and writes a report of each unit.
+
+    Statements outside of a traced unit are not recorded.
+    """
+
+    def __init__(self, path: str, all_units: bool = False,
+                 n_plus_one: int = N_PLUS_ONE,
+                 slow_seconds: float = SLOW_SECONDS):
+        """Initialize Tracer object.
+
+        Args:
+            path: File the reports are appended to.
+            all_units: If False, then only the units with N+1 or slow
+                statements are reported.
+            n_plus_one: Times a statement is issued from the same place in
+                a unit to be reported as an N+1 query.
+            slow_seconds: Seconds a statement takes to be reported as slow.
+        """
+        self.path = path
+        self.all_units = all_units
+        self.n_plus_one = n_plus_one
+        self.slow_seconds = slow_seconds
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def record(self, sql: str, rows: int, seconds: float):
+        trace = getattr(self.local, 'trace', None)
+        if trace is not None:
+            trace.add(sql, caller(), rows, seconds)
+
+    @contextlib.contextmanager
+    def trace(self, label: str):
+        """Trace the statements of the block on the calling thread as the
+        unit label. Nested blocks are part of the outermost unit."""
+        if getattr(self.local, 'trace', None) is not None:
+            yield
+            return
+        trace = self.local.trace = Trace(label)
+        try:
+            yield
+        finally:
+            self.local.trace = None
+            if self.all_units or trace.findings(self.n_plus_one,
+                                                self.slow_seconds):
+                with self.lock, open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(trace.report(self.n_plus_one, self.slow_seconds))
+
+
+class TracingCursor:
+    """Cursor recording every statement it executes with tracer."""
+
+    def __init__(self, cursor, tracer: Tracer):
+        self.cursor = cursor
+        self.tracer = tracer
+
+    def execute(self, query, args=None):
+        start = time.perf_counter()
+        try:
+            return self.cursor.execute(query, args)
+        finally:
+            self.tracer.record(query, 1, time.perf_counter() - start)
+
+    def executemany(self, query, args):
+        args = list(args)
+        start = time.perf_counter()
+        try:
+            return self.cursor.executemany(query, args)
+        finally:
+            self.tracer.record(query, len(args), time.perf_counter() - start)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.cursor.close()
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+
+class TracingConnection:
+    """Connection whose cursors are TracingCursors."""
+
+    def __init__(self, conn, tracer: Tracer):
+        self.conn = conn
+        self.tracer = tracer
+
+    def cursor(self, *args):
+        return TracingCursor(self.conn.cursor(*args), self.tracer)
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+
+# Set to a Tracer to trace the statements of the connections opened after
+tracer = None
+
+
+def traced(label: str):
+    """Return a context manager tracing the block as the unit label with
+    tracer, or doing nothing if tracer is None."""
+    if tracer is None:
+        return contextlib.nullcontext()
+    return tracer.trace(label)
+
+
+class Pool:
+    """Bounded, thread-safe pool of database connections.
+
+    Connections are opened on demand, up to size of them. get blocks while
+    all of them are checked out.
+    """
+
+    def __init__(self, size: int = POOL_SIZE, **kwargs):
+        """Initialize Pool object.
+
+        Args:
+            size: Maximum number of open connections.
+            kwargs: Passed to connect.
+        """
+        self.size = size
+        self.kwargs = kwargs
+        # (connection, time it was returned), most recently returned last
+        self.idle = queue.LifoQueue()
+        self.lock = threading.Lock()
+        self.opened = 0
+
+    def get(self, timeout: float = None):
+        """Check out a connection.
+
+        Raises queue.Empty if none is returned within timeout seconds.
+        """
+        try:
+            conn, returned = self.idle.get_nowait()
+        except queue.Empty:
+            with self.lock:
+                open_new = self.opened < self.size
+                if open_new:
+                    self.opened += 1
+            if open_new:
+                try:
+                    return connect(**self.kwargs)
+                except BaseException:
+                    with self.lock:
+                        self.opened -= 1
+                    raise
+            conn, returned = self.idle.get(timeout=timeout)
+
+        if time.monotonic() - returned >= PING_INTERVAL:
+            conn = self.check(conn)
+        return conn
+
+    def check(self, conn):
+        """Return conn, reconnected if it was dropped, or a new connection
+        if reconnecting fails."""
+        try:
+            conn.ping(reconnect=True)
+            return conn
+        except Error:
+            self.discard(conn)
+            with self.lock:
+                self.opened += 1
+            try:
+                return connect(**self.kwargs)
+            except BaseException:
+                with self.lock:
+                    self.opened -= 1
+                raise
+
+    def put(self, conn):
+        """Return a checked out connection."""
+        self.idle.put((conn, time.monotonic()))
+
+    def discard(self, conn):
+        """Close a checked out connection instead of returning it."""
+        with self.lock:
+            self.opened -= 1
+        try:
+            conn.close()
+        except Error:
+            pass
+
+    def close(self):
+        """Close all idle connections."""
+        while True:
+            try:
+                conn, _ = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            self.discard(conn)
+
+
+pool = Pool()
+atexit.register(lambda: pool.close())
+
+
+def use(backend_):
+    """Open the connections with backend_ from now on, closing the idle
+    connections of the one used so far."""
+    global backend, pool
+    pool.close()
+    backend = backend_
+    pool = Pool(pool.size, **pool.kwargs)
+
+
+_local = threading.local()
+
+
+@contextlib.contextmanager
+def connection():
+    """Check out a connection for a unit of work on the calling thread.
+
+    Within the unit, db refers to this connection on the calling thread.
+    Nested units share the connection of the outermost one, which rolls it
+    back when the unit ends, so that a unit that did not commit, e.g. one
+    that only read, leaves no snapshot open that would hide the rows
+    committed since from the next unit on the connection. The outermost
+    unit then returns the connection to the pool, unless it was kept by
+    current before the unit, or closes it if the rollback fails.
+    """
+    if getattr(_local, 'unit', False):
+        yield _local.conn
+        return
+
+    kept = getattr(_local, 'conn', None)
+    conn = kept if kept is not None else pool.get()
+    _local.conn = conn
+    _local.unit = True
+    try:
+        yield conn
+    finally:
+        try:
+            conn.rollback()
+            broken = False
+        except Error:
+            broken = True
+        _local.unit = False
+        if broken:
+            # Dropped or broken: the next unit would fail on it before the
+            # pool pings it again
+            _local.conn = None
+            pool.discard(conn)
+        elif kept is None:
+            _local.conn = None
+            pool.put(conn)
+
+
+def current():
+    """Return the connection of the unit of work on the calling thread.
+
+    Outside of a unit of work, a connection is checked out for the calling
+    thread and kept until release is called. Prefer a unit of work.
+    """
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = _local.conn = pool.get()
+    return conn
+
+
+def release():
+    """Return the connection kept by current outside of a unit of work."""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and not getattr(_local, 'unit', False):
+        _local.conn = None
+        pool.put(conn)
+
+
+class ThreadConnection:
+    """Stands for the connection returned by current on whichever thread
+    uses it."""
 
-from mysql_config import config
+    def __getattr__(self, name):
+        return getattr(current(), name)
 
 
-db = pymysql.connect(**config['mysql'])
-atexit.register(db.close)
+db = ThreadConnection()
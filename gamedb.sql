@@ -44,6 +44,34 @@ LOCK TABLES `company` WRITE;
 /*!40000 ALTER TABLE `company` ENABLE KEYS */;
 UNLOCK TABLES;
 
+--
+-- Table structure for table `crawl_shard`
+--
+
+DROP TABLE IF EXISTS `crawl_shard`;
+/*!40101 SET @saved_cs_client     = @@character_set_client */;
+ SET character_set_client = utf8mb4 ;
+CREATE TABLE `crawl_shard` (
+  `shards` int(11) NOT NULL,
+  `shard` int(11) NOT NULL,
+  `digest` char(64) DEFAULT NULL,
+  `owner` varchar(255) DEFAULT NULL,
+  `lease_expires` datetime(6) DEFAULT NULL,
+  `position` int(11) NOT NULL DEFAULT '0',
+  `finished` tinyint(1) NOT NULL DEFAULT '0',
+  PRIMARY KEY (`shards`,`shard`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+/*!40101 SET character_set_client = @saved_cs_client */;
+
+--
+-- Dumping data for table `crawl_shard`
+--
+
+LOCK TABLES `crawl_shard` WRITE;
+/*!40000 ALTER TABLE `crawl_shard` DISABLE KEYS */;
+/*!40000 ALTER TABLE `crawl_shard` ENABLE KEYS */;
+UNLOCK TABLES;
+
 --
 -- Table structure for table `developing_company`
 --
@@ -104,7 +132,8 @@ CREATE TABLE `employee` (
   `employee_id` int(11) NOT NULL AUTO_INCREMENT,
   `role` varchar(20) NOT NULL,
   `name` varchar(100) DEFAULT NULL,
-  PRIMARY KEY (`employee_id`,`role`)
+  PRIMARY KEY (`employee_id`,`role`),
+  UNIQUE KEY `name_role_UNIQUE` (`name`,`role`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
 /*!40101 SET character_set_client = @saved_cs_client */;
 
@@ -128,9 +157,11 @@ CREATE TABLE `game` (
   `game_id` int(11) NOT NULL AUTO_INCREMENT,
   `earliest_release_date` date DEFAULT NULL,
   `reception` int(11) DEFAULT NULL,
-  `title` varchar(400) NOT NULL UNIQUE,
+  `title` varchar(400) NOT NULL,
+  `title_hash` binary(16) GENERATED ALWAYS AS (unhex(md5(`title`))) STORED NOT NULL,
   PRIMARY KEY (`game_id`),
-  UNIQUE KEY `game_id_UNIQUE` (`game_id`)
+  UNIQUE KEY `game_id_UNIQUE` (`game_id`),
+  UNIQUE KEY `title_hash_UNIQUE` (`title_hash`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
 /*!40101 SET character_set_client = @saved_cs_client */;
 
@@ -157,8 +188,11 @@ CREATE TABLE `game_release` (
   `region` varchar(4) DEFAULT NULL,
   `release_date` date DEFAULT NULL,
   `title` varchar(400) DEFAULT NULL,
+  `title_hash` binary(16) GENERATED ALWAYS AS (unhex(md5(`title`))) STORED,
   PRIMARY KEY (`release_id`),
-  UNIQUE KEY `release_id_UNIQUE` (`release_id`)
+  UNIQUE KEY `release_id_UNIQUE` (`release_id`),
+  KEY `title_hash` (`title_hash`),
+  KEY `game_platform_region_date` (`game_id`,`platform_id`,`region`,`release_date`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
 /*!40101 SET character_set_client = @saved_cs_client */;
 
@@ -171,6 +205,32 @@ LOCK TABLES `game_release` WRITE;
 /*!40000 ALTER TABLE `game_release` ENABLE KEYS */;
 UNLOCK TABLES;
 
+--
+-- Table structure for table `game_url`
+--
+
+DROP TABLE IF EXISTS `game_url`;
+/*!40101 SET @saved_cs_client     = @@character_set_client */;
+ SET character_set_client = utf8mb4 ;
+CREATE TABLE `game_url` (
+  `url` varchar(2048) NOT NULL,
+  `url_hash` binary(16) GENERATED ALWAYS AS (unhex(md5(`url`))) STORED NOT NULL,
+  `game_id` int(11) NOT NULL,
+  `revision` varchar(64) DEFAULT NULL,
+  UNIQUE KEY `url_hash_UNIQUE` (`url_hash`),
+  KEY `game_id` (`game_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+/*!40101 SET character_set_client = @saved_cs_client */;
+
+--
+-- Dumping data for table `game_url`
+--
+
+LOCK TABLES `game_url` WRITE;
+/*!40000 ALTER TABLE `game_url` DISABLE KEYS */;
+/*!40000 ALTER TABLE `game_url` ENABLE KEYS */;
+UNLOCK TABLES;
+
 --
 -- Table structure for table `manufacturers`
 --
@@ -246,6 +306,33 @@ LOCK TABLES `publishing_company` WRITE;
 /*!40000 ALTER TABLE `publishing_company` DISABLE KEYS */;
 /*!40000 ALTER TABLE `publishing_company` ENABLE KEYS */;
 UNLOCK TABLES;
+
+--
+-- Table structure for table `schema_migrations`
+--
+
+DROP TABLE IF EXISTS `schema_migrations`;
+/*!40101 SET @saved_cs_client     = @@character_set_client */;
+ SET character_set_client = utf8mb4 ;
+CREATE TABLE `schema_migrations` (
+  `version` int(11) NOT NULL,
+  `name` varchar(100) NOT NULL,
+  `applied_at` datetime NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`version`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+/*!40101 SET character_set_client = @saved_cs_client */;
+
+--
+-- Dumping data for table `schema_migrations`
+--
+-- This schema already includes every migration in migrations/
+--
+
+LOCK TABLES `schema_migrations` WRITE;
+/*!40000 ALTER TABLE `schema_migrations` DISABLE KEYS */;
+INSERT INTO `schema_migrations` (`version`, `name`) VALUES (1,'employee_name_role'),(2,'game_title_hash'),(3,'game_release_lookups'),(4,'game_url'),(5,'game_url_revision'),(6,'crawl_shard');
+/*!40000 ALTER TABLE `schema_migrations` ENABLE KEYS */;
+UNLOCK TABLES;
 /*!40103 SET TIME_ZONE=@OLD_TIME_ZONE */;
 
 /*!40101 SET SQL_MODE=@OLD_SQL_MODE */;
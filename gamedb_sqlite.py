@@ -0,0 +1,289 @@
+"""Embedded SQLite backend of gamedb.
+
+The database is a local file in WAL mode, so a crawl on a single node runs
+its many small queries in process instead of over a network round trip, and
+readers do not block the writer. It is created from gamedb_sqlite.sql, the
+schema of gamedb.sql ported to SQLite.
+
+Connections take the statements of the MySQL backend and translate them:
+
+- %s parameters become ?.
+- INSERT IGNORE becomes INSERT OR IGNORE.
+- ON DUPLICATE KEY UPDATE c=VALUES(c) becomes an upsert setting
+  c=excluded.c.
+- ON DUPLICATE KEY UPDATE id=LAST_INSERT_ID(id), whose lastrowid is the id
+  of the row whether it is new or not, is run as an INSERT doing nothing on
+  a conflict, followed if nothing was inserted by an upsert returning the id
+  of the existing row. rowcount is 1 only if the row is new, as with MySQL.
+- The lastrowid of a plain multi-row INSERT is the id of its first row, as
+  with MySQL, instead of the last one.
+- The MD5 and UNHEX functions of the title and url hashes are defined on
+  every connection. Writing the database without them, e.g. from the sqlite3
+  shell, fails on the generated hash columns.
+
+Any other MySQL syntax is passed on as it is, except that of upserts,
+LAST_INSERT_ID, NOW and INTERVAL, which raise NotSupportedError. conformance
+checks that every statement of data runs here.
+
+sqlite3 errors are raised as the gamedb errors of the same names, with
+gamedb.DUP_ENTRY for duplicate keys. Leases (lease.py) and bulk loading
+(bootstrap.py) need the MySQL backend.
+"""
+
+import datetime
+import decimal
+import functools
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+
+import pymysql
+from pymysql.constants import ER
+
+import gamedb
+
+SQLITE_FILE = 'gamedb.sqlite'
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           'gamedb_sqlite.sql')
+# Seconds a statement waits for the write lock held by another connection
+BUSY_TIMEOUT = 30
+
+upsert_id_re = re.compile(
+    r'\s+ON\s+DUPLICATE\s+KEY\s+UPDATE\s+'
+    r'(\w+)\s*=\s*LAST_INSERT_ID\(\s*\1\s*\)\s*$', re.IGNORECASE)
+upsert_re = re.compile(r'\bON\s+DUPLICATE\s+KEY\s+UPDATE\b', re.IGNORECASE)
+upsert_values_re = re.compile(r'\bVALUES\s*\(\s*(\w+)\s*\)', re.IGNORECASE)
+insert_ignore_re = re.compile(r'\bINSERT\s+IGNORE\b', re.IGNORECASE)
+insert_re = re.compile(r'^\s*INSERT\b', re.IGNORECASE)
+# MySQL syntax left in a statement by translate, which SQLite would reject or
+# misread
+unported_re = re.compile(r'\bLAST_INSERT_ID\b|\bDUPLICATE\s+KEY\b|'
+                         r'\bINSERT\s+IGNORE\b|\bNOW\s*\(|\bINTERVAL\b',
+                         re.IGNORECASE)
+
+sqlite3.register_adapter(datetime.date, datetime.date.isoformat)
+sqlite3.register_adapter(datetime.datetime, datetime.datetime.isoformat)
+sqlite3.register_adapter(decimal.Decimal, str)
+sqlite3.register_converter(
+    'date', lambda b: datetime.date.fromisoformat(b.decode()))
+sqlite3.register_converter(
+    'datetime', lambda b: datetime.datetime.fromisoformat(b.decode()))
+sqlite3.register_converter('decimal', lambda b: decimal.Decimal(b.decode()))
+
+
+def md5(value):
+    if value is None:
+        return None
+    return hashlib.md5(str(value).encode('utf-8')).hexdigest()
+
+
+def unhex(value):
+    if value is None:
+        return None
+    return bytes.fromhex(value)
+
+
+def placeholders(sql: str):
+    return sql.replace('%s', '?').replace('%%', '%')
+
+
+# Kinds of statements, by how their lastrowid and rowcount are made MySQL's
+OTHER = 0
+INSERT = 1
+UPSERT_ID = 2
+
+
+@functools.lru_cache(maxsize=256)
+def translate(sql: str):
+    """Return (kind, SQLite statement, upsert returning the id of an
+    existing row or None) of a statement of the MySQL backend.
+
+    Raises NotSupportedError if the statement uses MySQL syntax in a way
+    translate does not know, instead of letting SQLite fail on it or run
+    it with another meaning.
+    """
+    kind, sqlite_sql, returning = port(sql)
+    m = unported_re.search(sqlite_sql)
+    if m:
+        raise pymysql.err.NotSupportedError(
+            0, 'gamedb_sqlite cannot translate {} in: {}'
+               .format(m.group(), ' '.join(sql.split())))
+    return kind, sqlite_sql, returning
+
+
+def port(sql: str):
+    m = upsert_id_re.search(sql)
+    if m:
+        insert = sql[:m.start()]
+        returning = '{} ON CONFLICT DO UPDATE SET {col}={col} ' \
+            'RETURNING {col}'.format(insert, col=m.group(1))
+        return UPSERT_ID, placeholders(insert + ' ON CONFLICT DO NOTHING'), \
+            placeholders(returning)
+    m = upsert_re.search(sql)
+    if m:
+        update = upsert_values_re.sub(r'excluded.\1', sql[m.end():])
+        sql = '{} ON CONFLICT DO UPDATE SET {}'.format(sql[:m.start()],
+                                                       update)
+        return OTHER, placeholders(sql), None
+    if insert_ignore_re.search(sql):
+        return OTHER, placeholders(
+            insert_ignore_re.sub('INSERT OR IGNORE', sql, count=1)), None
+    if insert_re.match(sql):
+        return INSERT, placeholders(sql), None
+    return OTHER, placeholders(sql), None
+
+
+def error(e: sqlite3.Error):
+    """Return the gamedb error of sqlite3 error e."""
+    message = str(e)
+    if isinstance(e, sqlite3.IntegrityError):
+        code = ER.DUP_ENTRY if 'UNIQUE' in message \
+            or 'PRIMARY KEY' in message else ER.BAD_NULL_ERROR
+        return gamedb.IntegrityError(code, message)
+    cls = getattr(pymysql.err, type(e).__name__, gamedb.Error)
+    return cls(0, message)
+
+
+class Cursor:
+    """Cursor taking the statements of the MySQL backend."""
+
+    def __init__(self, cursor: sqlite3.Cursor):
+        self.cursor = cursor
+        self.lastrowid = None
+        self.rowcount = -1
+
+    def execute(self, query: str, args=None):
+        kind, sql, returning = translate(query)
+        args = () if args is None else tuple(args)
+        try:
+            self.cursor.execute(sql, args)
+            self.rowcount = self.cursor.rowcount
+            self.lastrowid = self.cursor.lastrowid
+            if kind == INSERT and self.rowcount > 0:
+                self.lastrowid -= self.rowcount - 1
+            elif kind == UPSERT_ID and self.rowcount != 1:
+                self.cursor.execute(returning, args)
+                self.lastrowid = self.cursor.fetchone()[0]
+                self.rowcount = 0
+        except sqlite3.Error as e:
+            raise error(e) from e
+        return self.rowcount
+
+    def executemany(self, query: str, args):
+        kind, sql, _ = translate(query)
+        if kind == UPSERT_ID:
+            rowcount = sum(self.execute(query, row) for row in args)
+            self.rowcount = rowcount
+            return rowcount
+        try:
+            self.cursor.executemany(sql, [tuple(row) for row in args])
+        except sqlite3.Error as e:
+            raise error(e) from e
+        self.rowcount = self.cursor.rowcount
+        self.lastrowid = self.cursor.lastrowid
+        return self.rowcount
+
+    def fetchone(self):
+        return self.cursor.fetchone()
+
+    def fetchmany(self, size: int = None):
+        return self.cursor.fetchmany(size or self.cursor.arraysize)
+
+    def fetchall(self):
+        return self.cursor.fetchall()
+
+    @property
+    def description(self):
+        return self.cursor.description
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def close(self):
+        self.cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class Connection:
+    """Connection to the SQLite database, with the methods of a pymysql
+    connection that gamedb uses."""
+
+    def __init__(self, path: str):
+        self.db = sqlite3.connect(path, timeout=BUSY_TIMEOUT,
+                                  detect_types=sqlite3.PARSE_DECLTYPES,
+                                  check_same_thread=False)
+        self.db.create_function('md5', 1, md5, deterministic=True)
+        self.db.create_function('unhex', 1, unhex, deterministic=True)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        # Durable at every checkpoint rather than at every commit, the usual
+        # setting in WAL mode
+        self.db.execute('PRAGMA synchronous=NORMAL')
+
+    def cursor(self):
+        return Cursor(self.db.cursor())
+
+    def commit(self):
+        try:
+            self.db.commit()
+        except sqlite3.Error as e:
+            raise error(e) from e
+
+    def rollback(self):
+        self.db.rollback()
+
+    def ping(self, reconnect: bool = True):
+        pass
+
+    def close(self):
+        self.db.close()
+
+
+class SQLite:
+    """Backend storing the database in a local SQLite file."""
+
+    name = 'sqlite'
+    # A single writer at a time: the rows of a multi-row INSERT always get
+    # consecutive ids
+    consecutive_ids = True
+
+    def __init__(self, path: str = SQLITE_FILE):
+        """Initialize SQLite object.
+
+        Args:
+            path: Path of the database. It is created from SCHEMA_FILE when
+                first connected to if it does not exist.
+        """
+        self.path = path
+        self.lock = threading.Lock()
+
+    def connect(self, database: str = None, **kwargs):
+        """Return a new connection.
+
+        Args:
+            database: Path of another database to connect to, e.g. a scratch
+                one.
+            kwargs: Options of the MySQL backend, ignored.
+        """
+        path = database or self.path
+        with self.lock:
+            if not os.path.exists(path):
+                create(path)
+        return Connection(path)
+
+
+def create(path: str):
+    """Create the database at path from SCHEMA_FILE."""
+    with open(SCHEMA_FILE, 'r', encoding='utf-8') as f:
+        schema = f.read()
+    conn = Connection(path)
+    try:
+        conn.db.executescript(schema)
+    finally:
+        conn.close()
@@ -0,0 +1,118 @@
+-- Schema of gamedb.sql ported to SQLite, for gamedb_sqlite.
+--
+-- The tables and their columns are those of gamedb.sql, in the same order.
+-- The ids are INTEGER PRIMARY KEY AUTOINCREMENT, so ids are never reused, as
+-- with MySQL. The title and url hashes are generated with the md5 and unhex
+-- functions that gamedb_sqlite defines on its connections.
+--
+-- The declared types date, datetime and decimal are those gamedb_sqlite
+-- converts back to datetime.date, datetime.datetime and decimal.Decimal.
+
+CREATE TABLE company (
+  company_id INTEGER PRIMARY KEY AUTOINCREMENT,
+  defunct_date date DEFAULT NULL,
+  founder varchar(100) DEFAULT NULL,
+  founding_date date DEFAULT NULL,
+  hq_address varchar(95) DEFAULT NULL,
+  name varchar(50) NOT NULL UNIQUE,
+  website varchar(1745) DEFAULT NULL
+);
+
+CREATE TABLE crawl_shard (
+  shards int NOT NULL,
+  shard int NOT NULL,
+  digest char(64) DEFAULT NULL,
+  owner varchar(255) DEFAULT NULL,
+  lease_expires datetime DEFAULT NULL,
+  position int NOT NULL DEFAULT 0,
+  finished tinyint NOT NULL DEFAULT 0,
+  PRIMARY KEY (shards, shard)
+);
+
+CREATE TABLE developing_company (
+  company_id int NOT NULL PRIMARY KEY
+);
+
+CREATE TABLE develops (
+  release_id int NOT NULL,
+  employee_id int NOT NULL,
+  employee_role varchar(20) NOT NULL,
+  developing_company_id int NOT NULL,
+  publishing_company_id int NOT NULL,
+  PRIMARY KEY (release_id, employee_id, employee_role, developing_company_id,
+               publishing_company_id)
+);
+
+-- The primary key of gamedb.sql is (employee_id, role), but employee_id
+-- alone is unique, and only a single column can be AUTOINCREMENT
+CREATE TABLE employee (
+  employee_id INTEGER PRIMARY KEY AUTOINCREMENT,
+  role varchar(20) NOT NULL,
+  name varchar(100) DEFAULT NULL,
+  UNIQUE (name, role)
+);
+
+CREATE TABLE game (
+  game_id INTEGER PRIMARY KEY AUTOINCREMENT,
+  earliest_release_date date DEFAULT NULL,
+  reception int DEFAULT NULL,
+  title varchar(400) NOT NULL,
+  title_hash binary(16) GENERATED ALWAYS AS (unhex(md5(title))) STORED
+    NOT NULL
+);
+CREATE UNIQUE INDEX title_hash_UNIQUE ON game (title_hash);
+
+CREATE TABLE game_release (
+  release_id INTEGER PRIMARY KEY AUTOINCREMENT,
+  game_id int NOT NULL,
+  platform_id int NOT NULL,
+  region varchar(4) DEFAULT NULL,
+  release_date date DEFAULT NULL,
+  title varchar(400) DEFAULT NULL,
+  title_hash binary(16) GENERATED ALWAYS AS (unhex(md5(title))) STORED
+);
+CREATE INDEX game_release_title_hash ON game_release (title_hash);
+CREATE INDEX game_platform_region_date
+  ON game_release (game_id, platform_id, region, release_date);
+
+CREATE TABLE game_url (
+  url varchar(2048) NOT NULL,
+  url_hash binary(16) GENERATED ALWAYS AS (unhex(md5(url))) STORED NOT NULL,
+  game_id int NOT NULL,
+  revision varchar(64) DEFAULT NULL
+);
+CREATE UNIQUE INDEX url_hash_UNIQUE ON game_url (url_hash);
+CREATE INDEX game_url_game_id ON game_url (game_id);
+
+CREATE TABLE manufacturers (
+  platform_id int NOT NULL,
+  manufacturer_name varchar(50) NOT NULL,
+  PRIMARY KEY (platform_id, manufacturer_name)
+);
+
+CREATE TABLE platform (
+  platform_id INTEGER PRIMARY KEY AUTOINCREMENT,
+  company_id int DEFAULT NULL,
+  discontinued_date date DEFAULT NULL,
+  generation int DEFAULT NULL,
+  introductory_price decimal DEFAULT NULL,
+  name varchar(50) DEFAULT NULL UNIQUE,
+  release_date date DEFAULT NULL,
+  type varchar(50) DEFAULT NULL
+);
+
+CREATE TABLE publishing_company (
+  company_id int NOT NULL PRIMARY KEY
+);
+
+CREATE TABLE schema_migrations (
+  version int NOT NULL PRIMARY KEY,
+  name varchar(100) NOT NULL,
+  applied_at datetime NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- This schema already includes every migration in migrations/
+INSERT INTO schema_migrations (version, name) VALUES
+  (1, 'employee_name_role'), (2, 'game_title_hash'),
+  (3, 'game_release_lookups'), (4, 'game_url'), (5, 'game_url_revision'),
+  (6, 'crawl_shard');
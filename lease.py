@@ -0,0 +1,186 @@
+"""Time-limited leases on the shards of a crawl, for crawling one database
+from several nodes.
+
+url_gen --shards N partitions the game urls into N files, and every node has
+a copy of them. A node crawls a shard while it holds its lease, a row of
+crawl_shard, and renews the lease every LEASE_SECONDS / 3. Each renewal
+saves the position up to which the games of the shard are committed (see
+data_gen.UrlFile). If a node stops renewing, e.g. because it crashed, its
+lease expires, and another node claims the shard and resumes it from the
+saved position.
+
+Claims and renewals are single UPDATEs conditioned on the lease, so no two
+nodes hold the same lease, and lease times are the database's, so the clocks
+of the nodes do not matter.
+"""
+
+import hashlib
+import logging
+import os
+import socket
+import threading
+
+import gamedb
+
+# Seconds a lease lasts unless it is renewed
+LEASE_SECONDS = 120
+
+
+def file_digest(path: str):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class ShardLeases:
+    """Leases on the shards of a crawl, held one at a time."""
+
+    create_sql = \
+        "INSERT IGNORE INTO crawl_shard (shards, shard) VALUES (%s, %s)"
+    claimable_sql = """SELECT shard, digest FROM crawl_shard
+                       WHERE shards=%s AND NOT finished
+                         AND (owner IS NULL OR lease_expires < NOW(6))
+                       ORDER BY shard"""
+    claim_sql = """UPDATE crawl_shard
+                   SET owner=%s, digest=%s,
+                       lease_expires=NOW(6) + INTERVAL %s SECOND
+                   WHERE shards=%s AND shard=%s AND NOT finished
+                     AND (owner IS NULL OR lease_expires < NOW(6))"""
+    position_sql = """SELECT position FROM crawl_shard
+                      WHERE shards=%s AND shard=%s"""
+    renew_sql = """UPDATE crawl_shard
+                   SET position=%s, lease_expires=NOW(6) + INTERVAL %s SECOND
+                   WHERE shards=%s AND shard=%s AND owner=%s"""
+    release_sql = """UPDATE crawl_shard
+                     SET position=%s, finished=%s, owner=NULL,
+                         lease_expires=NULL
+                     WHERE shards=%s AND shard=%s AND owner=%s"""
+
+    def __init__(self, paths, owner: str = None,
+                 seconds: float = LEASE_SECONDS):
+        """Initialize ShardLeases object.
+
+        Args:
+            paths: Paths of the url files of the shards, in order.
+            owner: Name of this node in the leases it holds. Defaults to
+                <host name>:<process id>.
+            seconds: Seconds a lease lasts unless it is renewed.
+        """
+        self.paths = list(paths)
+        self.shards = len(self.paths)
+        self.owner = owner or '{}:{}'.format(socket.gethostname(),
+                                             os.getpid())
+        self.seconds = seconds
+        # Shard whose lease is held, or None
+        self.shard = None
+        # Set once the lease held expired and was claimed by another node
+        self.lost = threading.Event()
+        self.stopping = threading.Event()
+        self.renewer = None
+
+    def claim(self, exclude=()):
+        """Claim the lease of an unfinished shard that no node holds.
+
+        Return (shard, position saved in its lease), or None if every shard
+        is finished, held by other nodes or in exclude.
+        """
+        with gamedb.connection() as conn:
+            with conn.cursor() as cu:
+                cu.executemany(ShardLeases.create_sql,
+                               [(self.shards, shard)
+                                for shard in range(self.shards)])
+                conn.commit()
+                cu.execute(ShardLeases.claimable_sql, (self.shards,))
+                claimable = cu.fetchall()
+
+                for shard, digest in claimable:
+                    if shard in exclude:
+                        continue
+                    local_digest = file_digest(self.paths[shard])
+                    if digest is not None and digest != local_digest:
+                        # The saved position is in another order
+                        logging.error('ShardLeases.claim: {} differs from '
+                                      'the file crawled by the other nodes'
+                                      .format(self.paths[shard]))
+                        continue
+                    cu.execute(ShardLeases.claim_sql,
+                               (self.owner, local_digest, self.seconds,
+                                self.shards, shard))
+                    conn.commit()
+                    if cu.rowcount != 1:
+                        # Claimed by another node since
+                        continue
+                    cu.execute(ShardLeases.position_sql,
+                               (self.shards, shard))
+                    position = cu.fetchone()[0]
+                    self.shard = shard
+                    self.lost.clear()
+                    return shard, position
+        return None
+
+    def renew(self, position: int):
+        """Renew the lease held, saving position in it.
+
+        Return False, and set lost, if the lease was lost.
+        """
+        with gamedb.connection() as conn:
+            with conn.cursor() as cu:
+                cu.execute(ShardLeases.renew_sql,
+                           (position, self.seconds, self.shards, self.shard,
+                            self.owner))
+                renewed = cu.rowcount == 1
+            conn.commit()
+        if not renewed:
+            logging.error('ShardLeases.renew: lost the lease of shard {}'
+                          .format(self.shard))
+            self.lost.set()
+        return renewed
+
+    def renew_every(self, checkpoint):
+        """Renew the lease held every third of its duration, on a thread,
+        until release.
+
+        Args:
+            checkpoint: Function returning the position to save, up to which
+                the games of the shard are committed.
+        """
+        self.stopping.clear()
+        self.renewer = threading.Thread(target=self.renew_loop,
+                                        args=(checkpoint,), daemon=True)
+        self.renewer.start()
+
+    def renew_loop(self, checkpoint):
+        while not self.stopping.wait(self.seconds / 3):
+            try:
+                if not self.renew(checkpoint()):
+                    return
+            except Exception:
+                # Renewed by the next round, if the lease has not expired
+                logging.exception('ShardLeases.renew_loop: shard {}'
+                                  .format(self.shard))
+
+    def release(self, position: int = None, finished: bool = False):
+        """Stop renewing the lease held and give it up, so that another node
+        can claim the shard right away.
+
+        Args:
+            position: Position to save, or None to keep the one saved by the
+                last renewal.
+            finished: Whether every url of the shard is crawled.
+        """
+        self.stopping.set()
+        if self.renewer is not None:
+            self.renewer.join()
+            self.renewer = None
+        if self.shard is None:
+            return
+        with gamedb.connection() as conn:
+            with conn.cursor() as cu:
+                if position is None:
+                    cu.execute(ShardLeases.position_sql,
+                               (self.shards, self.shard))
+                    position = cu.fetchone()[0]
+                cu.execute(ShardLeases.release_sql,
+                           (position, finished, self.shards, self.shard,
+                            self.owner))
+            conn.commit()
+        self.shard = None
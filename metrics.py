@@ -0,0 +1,302 @@
+"""Counters and timing histograms of the stages of a crawl.
+
+Modules declare their metrics once, at import, with counter and histogram,
+and update them as they go:
+
+    pages = metrics.counter('gamedb_pages_total', 'Pages parsed')
+    parse_seconds = metrics.histogram('gamedb_parse_seconds',
+                                      'Seconds to parse a page')
+
+    pages.inc()
+    with parse_seconds.time(kind='game'):
+        ...
+
+Updates are cheap, so metrics are always kept. An Exporter writes them
+periodically in the Prometheus text format to a file for the textfile
+collector of node_exporter, and summary returns them as a dict for a JSON
+report at the end of a run.
+
+Metrics are per process. A process working for another one hands over
+what it updated with Registry.take, for that process to add with
+Registry.merge: the parse processes of data_gen --processes return theirs
+with every game.
+"""
+
+import bisect
+import contextlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+# Upper bounds of the buckets of timing histograms, in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+           1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Seconds between two writes of an Exporter
+EXPORT_INTERVAL = 15
+
+
+def label_text(labels: tuple):
+    if not labels:
+        return ''
+    return '{{{}}}'.format(','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\')
+                         .replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels))
+
+
+def label_key(labels: dict):
+    return tuple(sorted(labels.items()))
+
+
+class Counter:
+    """Sum that only goes up, per set of labels."""
+
+    type_ = 'counter'
+
+    def __init__(self, name: str, help_: str):
+        self.name = name
+        self.help = help_
+        # label_key -> value
+        self.values = dict()
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self.lock:
+            return self.values.get(label_key(labels), 0)
+
+    def total(self):
+        with self.lock:
+            return sum(self.values.values())
+
+    def samples(self):
+        with self.lock:
+            return [(self.name, key, value)
+                    for key, value in sorted(self.values.items())]
+
+    def summary(self):
+        with self.lock:
+            return {label_text(key) or 'total': value
+                    for key, value in sorted(self.values.items())}
+
+    def take(self):
+        with self.lock:
+            values, self.values = self.values, dict()
+        return values
+
+    def merge(self, values: dict):
+        with self.lock:
+            for key, value in values.items():
+                self.values[key] = self.values.get(key, 0) + value
+
+
+class Histogram:
+    """Counts of observations by bucket, with their sum, per set of
+    labels."""
+
+    type_ = 'histogram'
+
+    def __init__(self, name: str, help_: str, buckets=BUCKETS):
+        self.name = name
+        self.help = help_
+        self.buckets = tuple(buckets)
+        # label_key -> [count per bucket, with +Inf last, sum]
+        self.values = dict()
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = label_key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = [0] * (len(self.buckets) + 1) \
+                    + [0.0]
+            counts[i] += 1
+            counts[-1] += value
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """Observe the seconds the block takes, even if it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            for key, counts in sorted(self.values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), counts):
+                    cumulative += count
+                    samples.append((self.name + '_bucket',
+                                    key + (('le', bound),), cumulative))
+                samples.append((self.name + '_sum', key, counts[-1]))
+                samples.append((self.name + '_count', key, cumulative))
+        return samples
+
+    def summary(self):
+        summary = dict()
+        with self.lock:
+            for key, counts in sorted(self.values.items()):
+                count = sum(counts[:-1])
+                summary[label_text(key) or 'total'] = {
+                    'count': count,
+                    'sum': counts[-1],
+                    'mean': counts[-1] / count if count else None,
+                }
+        return summary
+
+    def take(self):
+        with self.lock:
+            values, self.values = self.values, dict()
+        return values
+
+    def merge(self, values: dict):
+        with self.lock:
+            for key, counts in values.items():
+                mine = self.values.get(key)
+                if mine is None:
+                    self.values[key] = list(counts)
+                else:
+                    self.values[key] = [a + b for a, b in zip(mine, counts)]
+
+
+class Registry:
+    """Metrics by name."""
+
+    def __init__(self):
+        self.metrics = dict()
+        self.lock = threading.Lock()
+
+    def add(self, cls, name: str, *args):
+        with self.lock:
+            if name not in self.metrics:
+                self.metrics[name] = cls(name, *args)
+            return self.metrics[name]
+
+    def render(self):
+        """Return the metrics in the Prometheus text format."""
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.append('# HELP {} {}'.format(metric.name, metric.help))
+            lines.append('# TYPE {} {}'.format(metric.name, metric.type_))
+            for name, key, value in metric.samples():
+                lines.append('{}{} {}'.format(name, label_text(key),
+                                              repr(float(value))))
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        return {name: metric.summary()
+                for name, metric in sorted(self.metrics.items())}
+
+    def take(self):
+        """Return the values of the metrics updated since the last take,
+        by metric name, and reset them."""
+        with self.lock:
+            metrics = list(self.metrics.values())
+        taken = dict()
+        for metric in metrics:
+            values = metric.take()
+            if values:
+                taken[metric.name] = values
+        return taken
+
+    def merge(self, taken: dict):
+        """Add the values returned by take, e.g. of another process, to the
+        metrics of the same names."""
+        for name, values in taken.items():
+            with self.lock:
+                metric = self.metrics.get(name)
+            if metric is not None:
+                metric.merge(values)
+
+
+registry = Registry()
+
+
+def counter(name: str, help_: str):
+    """Return the Counter of registry named name, creating it if needed."""
+    return registry.add(Counter, name, help_)
+
+
+def histogram(name: str, help_: str, buckets=BUCKETS):
+    """Return the Histogram of registry named name, creating it if
+    needed."""
+    return registry.add(Histogram, name, help_, buckets)
+
+
+def write_atomic(path: str, text: str):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)))
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.chmod(tmp, 0o644)
+    os.replace(tmp, path)
+
+
+class Exporter:
+    """Writes the metrics of registry to a Prometheus textfile every
+    interval seconds, on a thread, until stopped."""
+
+    def __init__(self, path: str, interval: float = EXPORT_INTERVAL,
+                 registry: Registry = registry):
+        """Initialize Exporter object.
+
+        Args:
+            path: File written, ending in .prom for node_exporter. It is
+                replaced atomically, so never read half written.
+            interval: Seconds between two writes.
+            registry: Metrics written.
+        """
+        self.path = path
+        self.interval = interval
+        self.registry = registry
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def write(self):
+        write_atomic(self.path, self.registry.render())
+
+    def start(self):
+        self.thread = threading.Thread(target=self.loop, daemon=True)
+        self.thread.start()
+
+    def loop(self):
+        while not self.stopping.wait(self.interval):
+            self.write()
+
+    def stop(self):
+        """Stop writing, after a last write of the final values."""
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.write()
+
+
+def write_summary(path: str, extra: dict = None):
+    """Write the summary of registry to path as JSON, with extra, e.g.
+    ratios derived from the metrics."""
+    summary = registry.summary()
+    if extra:
+        summary.update(extra)
+    write_atomic(path, json.dumps(summary, indent=1, sort_keys=True) + '\n')
+
+
+def _after_fork():
+    # A forked child has none of the threads of its parent, e.g. of an
+    # Exporter, which may have held the locks of the metrics
+    registry.lock = threading.Lock()
+    for metric in registry.metrics.values():
+        metric.lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_after_fork)
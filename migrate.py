@@ -0,0 +1,103 @@
+#!/usr/bin/python3
+"""Apply the schema migrations in migrations/ that a database lacks.
+
+Each migration is a file named <version>_<name>.sql holding one or more
+statements, each ending with a semicolon at the end of a line. The
+migrations applied to a database are recorded in its schema_migrations
+table; gamedb.sql already records all of them.
+
+MySQL commits DDL statements implicitly, so a failed migration is not
+rolled back. It is not recorded either, and has to be finished or undone by
+hand before running migrate again.
+"""
+
+import argparse
+import os
+import re
+
+import gamedb
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              'migrations')
+
+migration_re = re.compile(r'^(\d+)_(\w+)\.sql$')
+
+create_sql = """CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version int(11) NOT NULL,
+                    name varchar(100) NOT NULL,
+                    applied_at datetime NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (version)
+                ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4"""
+applied_sql = "SELECT version FROM schema_migrations"
+record_sql = "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)"
+
+
+def migrations(path: str = MIGRATIONS_DIR):
+    """Return (version, name, filename) of every migration in path, ordered
+    by version."""
+    found = []
+    for filename in os.listdir(path):
+        m = migration_re.match(filename)
+        if m:
+            found.append((int(m.group(1)), m.group(2),
+                          os.path.join(path, filename)))
+    return sorted(found)
+
+
+def statements(sql: str):
+    """Split the text of a migration into its statements."""
+    lines = [line for line in sql.splitlines()
+             if not line.lstrip().startswith('--')]
+    return [stmt.strip() for stmt in re.split(r';\s*$', '\n'.join(lines),
+                                              flags=re.MULTILINE)
+            if stmt.strip()]
+
+
+def applied(db):
+    with db.cursor() as cu:
+        cu.execute(create_sql)
+        cu.execute(applied_sql)
+        versions = {tuple_[0] for tuple_ in cu.fetchall()}
+    db.commit()
+    return versions
+
+
+def migrate(db=None, path: str = MIGRATIONS_DIR, dry_run: bool = False):
+    """Apply the migrations in path not yet applied to db, in order.
+
+    Returns the names of the applied migrations.
+    """
+    if db is None:
+        db = gamedb.db
+    done = applied(db)
+    names = []
+    for version, name, filename in migrations(path):
+        if version in done:
+            continue
+        names.append(name)
+        print('{:04d} {}'.format(version, name))
+        if dry_run:
+            continue
+
+        with open(filename, 'r', encoding='utf-8') as f:
+            sql = f.read()
+        with db.cursor() as cu:
+            for stmt in statements(sql):
+                cu.execute(stmt)
+            cu.execute(record_sql, (version, name))
+        db.commit()
+    return names
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dry-run', action='store_true',
+                        help='only list the migrations that would be applied')
+    args = parser.parse_args()
+    with gamedb.connection() as conn:
+        if not migrate(conn, dry_run=args.dry_run):
+            print('Up to date.')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+-- Employee.insert_if_not_exist resolves existing employees through this key
+-- with INSERT ... ON DUPLICATE KEY UPDATE
+--
+-- Databases written before it may hold the same (name, role) more than once.
+-- Every duplicate is merged into the one with the lowest id first: the
+-- develops rows of the others are moved to it, unless it already has the
+-- same row, and the others are deleted. Names are grouped under the
+-- collation of the key, so that the duplicates merged are those it rejects.
+CREATE TEMPORARY TABLE `employee_duplicate` AS
+  SELECT `employee`.`employee_id`, `employee`.`role`, `kept`.`kept_id`
+  FROM `employee`
+  JOIN (SELECT `name`, `role`, MIN(`employee_id`) AS `kept_id`
+        FROM `employee`
+        WHERE `name` IS NOT NULL
+        GROUP BY `name`, `role`
+        HAVING COUNT(*) > 1) AS `kept`
+    ON `employee`.`name` = `kept`.`name` AND `employee`.`role` = `kept`.`role`
+  WHERE `employee`.`employee_id` <> `kept`.`kept_id`;
+UPDATE IGNORE `develops`
+  JOIN `employee_duplicate`
+    ON `develops`.`employee_id` = `employee_duplicate`.`employee_id`
+   AND `develops`.`employee_role` = `employee_duplicate`.`role`
+  SET `develops`.`employee_id` = `employee_duplicate`.`kept_id`;
+-- The rows left are those the kept employee already has
+DELETE `develops` FROM `develops`
+  JOIN `employee_duplicate`
+    ON `develops`.`employee_id` = `employee_duplicate`.`employee_id`
+   AND `develops`.`employee_role` = `employee_duplicate`.`role`;
+DELETE `employee` FROM `employee`
+  JOIN `employee_duplicate`
+    ON `employee`.`employee_id` = `employee_duplicate`.`employee_id`
+   AND `employee`.`role` = `employee_duplicate`.`role`;
+DROP TEMPORARY TABLE `employee_duplicate`;
+ALTER TABLE `employee`
+  ADD UNIQUE KEY `name_role_UNIQUE` (`name`,`role`);
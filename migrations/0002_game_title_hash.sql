@@ -0,0 +1,17 @@
+-- Look up and enforce the uniqueness of the 400 character game.title through
+-- a 16 byte hash instead of an index on the title itself
+--
+-- This changes what a duplicate title is. The hash is of the exact title,
+-- whereas the index dropped compared titles under utf8mb4_0900_ai_ci, which
+-- ignores case and accents. So titles that differ only in case or accents,
+-- e.g. "Pokémon Snap" and "Pokemon Snap", were one game and are now two.
+-- The rows already in the table are unique under both rules, so this
+-- migration changes none of them, but later crawls may add such variants of
+-- their titles. To list them, grouped under the collation of title:
+--
+--   SELECT title, COUNT(*), GROUP_CONCAT(game_id) FROM game
+--   GROUP BY title HAVING COUNT(*) > 1;
+ALTER TABLE `game`
+  ADD COLUMN `title_hash` binary(16) AS (UNHEX(MD5(`title`))) STORED NOT NULL,
+  ADD UNIQUE KEY `title_hash_UNIQUE` (`title_hash`),
+  DROP INDEX `title`;
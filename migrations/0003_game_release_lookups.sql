@@ -0,0 +1,6 @@
+-- Index GameRelease.check_sql_title and GameRelease.get_id_sql, which would
+-- otherwise scan the whole table
+ALTER TABLE `game_release`
+  ADD COLUMN `title_hash` binary(16) AS (UNHEX(MD5(`title`))) STORED,
+  ADD KEY `title_hash` (`title_hash`),
+  ADD KEY `game_platform_region_date` (`game_id`,`platform_id`,`region`,`release_date`);
@@ -0,0 +1,9 @@
+-- Url of the wikipedia page of every game, written with the game, so that a
+-- crawl skips the pages of the games it already has before fetching them
+CREATE TABLE `game_url` (
+  `url` varchar(2048) NOT NULL,
+  `url_hash` binary(16) AS (UNHEX(MD5(`url`))) STORED NOT NULL,
+  `game_id` int(11) NOT NULL,
+  UNIQUE KEY `url_hash_UNIQUE` (`url_hash`),
+  KEY `game_id` (`game_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
@@ -0,0 +1,4 @@
+-- Revision of the page each game was last extracted from (see
+-- data.page_revision), so that a refresh skips the pages that did not change
+ALTER TABLE `game_url`
+  ADD COLUMN `revision` varchar(64) DEFAULT NULL;
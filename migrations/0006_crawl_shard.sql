@@ -0,0 +1,12 @@
+-- Leases on the shards of a crawl by several nodes (see lease.py), with the
+-- position up to which each shard is crawled
+CREATE TABLE `crawl_shard` (
+  `shards` int(11) NOT NULL,
+  `shard` int(11) NOT NULL,
+  `digest` char(64) DEFAULT NULL,
+  `owner` varchar(255) DEFAULT NULL,
+  `lease_expires` datetime(6) DEFAULT NULL,
+  `position` int(11) NOT NULL DEFAULT 0,
+  `finished` tinyint(1) NOT NULL DEFAULT 0,
+  PRIMARY KEY (`shards`, `shard`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
@@ -0,0 +1,204 @@
+#!/usr/bin/python3
+"""Check extraction against a corpus of wikipedia pages, and time it.
+
+The corpus is in fixtures/: game, company and platform pages in the
+subdirectories of the same names, and the fields expected of every page in
+fixtures/expected.json. Each field is extracted with the same data functions
+and get_* methods that data_gen uses, without fetching pages or using the
+database. A field whose extraction raises is recorded as the name of the
+exception.
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import sys
+import time
+
+import data
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            'fixtures')
+EXPECTED_FILE = 'expected.json'
+REPEAT = 20
+
+
+def jsonable(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, (list, tuple)):
+        return [jsonable(v) for v in value]
+    return value
+
+
+def attempt(f, *args):
+    """Return f(*args), or the name of the exception it raises."""
+    try:
+        return jsonable(f(*args))
+    except Exception as e:
+        return {'error': type(e).__name__}
+
+
+def get_field(obj, attr: str, page):
+    getattr(obj, 'get_' + attr)(page)
+    return getattr(obj, attr)
+
+
+def game_fields(page):
+    def reception():
+        return get_field(data.Game(), 'reception', page)
+
+    def employees():
+        infobox = data.wiki_infobox(page)
+        return [(role, data.Employee.get_names(infobox, role_re))
+                for role, role_re in zip(data.Employee.roles,
+                                         data.Employee.role_res)]
+
+    def company_urls(company_re):
+        return data.Company.get_urls(data.wiki_infobox(page), company_re)
+
+    def link_urls(th_re):
+        return data.infobox_link_urls(data.wiki_infobox(page), th_re)
+
+    def releases():
+        game_release = data.GameRelease()
+        game_release.get_releases(page, use_db=False)
+        return [(platform.name, region, release_date)
+                for _, platform, region, release_date
+                in game_release.releases]
+
+    def platform_urls_by_name():
+        names = sorted({name for name, _, _ in releases()})
+        return [(name, data.get_platform_url(page, name)) for name in names]
+
+    data.Company.companies.clear()
+    return {
+        'title': attempt(data.wiki_title, page),
+        'reception': attempt(reception),
+        'employees': attempt(employees),
+        'developers': attempt(company_urls, data.Company.developing_re),
+        'publishers': attempt(company_urls, data.Company.publishing_re),
+        'developer_links': attempt(link_urls, data.Company.developing_re),
+        'publisher_links': attempt(link_urls, data.Company.publishing_re),
+        'platform_links': attempt(link_urls, data.platform_re),
+        'platform_urls': attempt(data.get_platform_urls, page),
+        'platform_names': attempt(data.get_platform_names, page),
+        'releases': attempt(releases),
+        'platform_urls_by_name': attempt(platform_urls_by_name),
+    }
+
+
+def company_fields(page):
+    company = data.Company()
+    return {attr: attempt(get_field, company, attr, page)
+            for attr in ('defunct_date', 'founder', 'founding_date',
+                         'hq_address', 'name', 'website')}
+
+
+def platform_fields(page):
+    platform = data.Platform()
+    fields = {attr: attempt(get_field, platform, attr, page)
+              for attr in ('discontinued_date', 'generation',
+                           'introductory_price', 'name', 'manufacturers',
+                           'release_date', 'type')}
+    fields['company_url'] = attempt(data.platform_company_url, page)
+    return fields
+
+
+extractors = {
+    'game': game_fields,
+    'company': company_fields,
+    'platform': platform_fields,
+}
+
+
+def corpus(path: str = FIXTURES_DIR):
+    """Return (kind, filename, html) of every page in path."""
+    pages = []
+    for kind in sorted(extractors):
+        dir_ = os.path.join(path, kind)
+        for filename in sorted(os.listdir(dir_)):
+            with open(os.path.join(dir_, filename), 'r',
+                      encoding='utf-8') as f:
+                pages.append((kind, filename, f.read()))
+    return pages
+
+
+def extract(kind: str, html: str):
+    return extractors[kind](data.parse_html(html))
+
+
+def compare(pages, expected):
+    """Print the fields that differ from expected, and return how many do."""
+    mismatches = 0
+    for kind, filename, html in pages:
+        key = '{}/{}'.format(kind, filename)
+        want = expected.get(key)
+        if want is None:
+            print('{}: not in {}'.format(key, EXPECTED_FILE))
+            mismatches += 1
+            continue
+        got = extract(kind, html)
+        for field in sorted(set(want) | set(got)):
+            if want.get(field) != got.get(field):
+                print('{} {}:\n    expected {!r}\n    got      {!r}'
+                      .format(key, field, want.get(field), got.get(field)))
+                mismatches += 1
+    return mismatches
+
+
+def benchmark(pages, repeat: int = REPEAT):
+    """Return the pages parsed and extracted per second of CPU time."""
+    start = time.process_time()
+    for _ in range(repeat):
+        for kind, _, html in pages:
+            extract(kind, html)
+    return repeat * len(pages) / (time.process_time() - start)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--update', action='store_true',
+                        help='record the current fields as the expected ones')
+    parser.add_argument('--repeat', type=int, default=REPEAT,
+                        help='times the corpus is extracted when timing it')
+    parser.add_argument('--fixtures', default=FIXTURES_DIR,
+                        help='corpus directory')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    # Extraction logs the links it cannot resolve, for every repetition
+    logging.disable(logging.ERROR)
+    # Relative links resolve the same wherever the corpus was saved from
+    data.wikipedia_baseurl = 'https://en.wikipedia.org/'
+    pages = corpus(args.fixtures)
+    expected_path = os.path.join(args.fixtures, EXPECTED_FILE)
+
+    if args.update:
+        expected = {'{}/{}'.format(kind, filename): extract(kind, html)
+                    for kind, filename, html in pages}
+        with open(expected_path, 'w', encoding='utf-8') as f:
+            json.dump(expected, f, indent=1, sort_keys=True,
+                      ensure_ascii=False)
+            f.write('\n')
+        print('Recorded {} pages.'.format(len(pages)))
+        mismatches = 0
+    else:
+        with open(expected_path, 'r', encoding='utf-8') as f:
+            expected = json.load(f)
+        mismatches = compare(pages, expected)
+        print('{} pages, {} mismatched fields'
+              .format(len(pages), mismatches))
+
+    if args.repeat:
+        print('{:.1f} pages per core-second'
+              .format(benchmark(pages, args.repeat)))
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,258 @@
+"""Adaptive flow control of the requests sent to each host.
+
+Every request fetch sends goes through the Host of its host, which:
+
+- spaces requests with a token bucket of rate requests per second, and
+  allows at most limit of them in flight at once;
+- tunes limit and rate by AIMD (additive increase, multiplicative
+  decrease): each response that is fast and not an error adds to them a
+  little, and a 429 or 503 response, an error, a timeout or a response much
+  slower than the usual ones halves them, at most once per DECREASE_INTERVAL;
+- honors the Retry-After of 429 and 503 responses by sending nothing to the
+  host until then;
+- has a circuit breaker: after BREAKER_FAILURES failures in a row, requests
+  to the host fail with CircuitOpen for BREAKER_SECONDS, after which a
+  single request is let through to probe the host, and closes the breaker
+  if it succeeds.
+
+So a crawl speeds up to about the highest rate a host sustains, and slows
+down as soon as the host's latency or errors grow, before it starts refusing
+requests. The limits are per process, unless the Throttle is served by a
+Manager to the processes forked after it started, as data_gen --processes
+does for its parse processes.
+"""
+
+import email.utils
+from multiprocessing.managers import BaseManager
+import signal
+import threading
+import time
+from urllib.parse import urlsplit
+
+# Requests per second and requests in flight a host starts at
+RATE = 5.0
+CONCURRENCY = 4
+# Bounds of the tuning
+MIN_RATE = 0.2
+MAX_RATE = 50.0
+MAX_CONCURRENCY = 32
+# Requests allowed at once by the bucket after an idle time
+BURST = 4
+# Increase of the rate per fast response, and of the concurrency limit per
+# limit fast responses (one per round of requests)
+RATE_STEP = 0.1
+# A response slower than this times the usual latency counts as congestion
+SLOW_FACTOR = 3.0
+# Weight of a new latency in the moving average of the usual latency
+LATENCY_WEIGHT = 0.1
+# Seconds between two decreases, so that the responses of one burst of
+# congestion decrease once
+DECREASE_INTERVAL = 2.0
+BREAKER_FAILURES = 5
+BREAKER_SECONDS = 60.0
+# Seconds to wait after a 429 or 503 response without a Retry-After
+RETRY_AFTER = 10.0
+MAX_RETRY_AFTER = 600.0
+
+
+class CircuitOpen(Exception):
+    """Raised instead of sending a request to a host whose circuit breaker
+    is open."""
+
+
+def retry_after(headers):
+    """Return the seconds to wait given by a Retry-After header, or None."""
+    value = headers.get('Retry-After') if headers else None
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = email.utils.parsedate_to_datetime(value).timestamp() \
+                - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(MAX_RETRY_AFTER, max(0.0, seconds))
+
+
+class Host:
+    """Flow control of the requests to one host."""
+
+    def __init__(self, name: str, rate: float = RATE,
+                 concurrency: int = CONCURRENCY,
+                 max_rate: float = MAX_RATE,
+                 max_concurrency: int = MAX_CONCURRENCY):
+        """Initialize Host object.
+
+        Args:
+            name: Host name, for messages.
+            rate: Requests per second to start at.
+            concurrency: Requests in flight to start at.
+            max_rate: Highest rate tuned to.
+            max_concurrency: Highest number of requests in flight tuned to.
+        """
+        self.name = name
+        self.rate = rate
+        self.limit = float(concurrency)
+        self.max_rate = max_rate
+        self.max_concurrency = max_concurrency
+        self.tokens = float(BURST)
+        self.refilled = time.monotonic()
+        self.in_flight = 0
+        # Moving average of the latency of fast, successful responses
+        self.latency = None
+        self.decreased = 0.0
+        # Nothing is sent before this time (see retry_after)
+        self.paused_until = 0.0
+        self.failures = 0
+        # Time the breaker opened at, or None if it is closed
+        self.opened = None
+        self.probing = False
+        self.cond = threading.Condition()
+
+    def acquire(self):
+        """Wait until a request can be sent, and count it in flight.
+
+        Raises CircuitOpen if the breaker is open.
+        """
+        with self.cond:
+            while True:
+                now = time.monotonic()
+                if self.opened is not None:
+                    if self.probing \
+                            or now - self.opened < BREAKER_SECONDS:
+                        raise CircuitOpen(
+                            'Too many failures of {}'.format(self.name))
+                    # Half open: let a single request probe the host
+                    self.probing = True
+                    break
+                self.refill(now)
+                wait = max(self.paused_until - now,
+                           (1 - self.tokens) / self.rate)
+                if self.in_flight < int(self.limit) and wait <= 0:
+                    break
+                self.cond.wait(wait if wait > 0 else None)
+            self.tokens -= 1
+            self.in_flight += 1
+
+    def refill(self, now: float):
+        self.tokens = min(BURST, self.tokens
+                          + (now - self.refilled) * self.rate)
+        self.refilled = now
+
+    def release(self, latency: float = None, status: int = None,
+                headers=None):
+        """Count a request as done and tune the limits by its outcome.
+
+        Args:
+            latency: Seconds the request took, or None if it failed without
+                a response.
+            status: Status code of the response, or None.
+            headers: Headers of the response, or None.
+        """
+        with self.cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if status in (429, 503):
+                seconds = retry_after(headers)
+                self.paused_until = now + (RETRY_AFTER if seconds is None
+                                           else seconds)
+                self.decrease(now)
+                self.fail(now)
+            elif latency is None or (status is not None and status >= 500):
+                self.decrease(now)
+                self.fail(now)
+            else:
+                self.succeed()
+                if self.latency is not None \
+                        and latency > SLOW_FACTOR * self.latency:
+                    self.decrease(now)
+                else:
+                    self.increase()
+                    self.latency = latency if self.latency is None \
+                        else (1 - LATENCY_WEIGHT) * self.latency \
+                        + LATENCY_WEIGHT * latency
+            self.cond.notify_all()
+
+    def increase(self):
+        self.rate = min(self.max_rate, self.rate + RATE_STEP)
+        self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+
+    def decrease(self, now: float):
+        if now - self.decreased < DECREASE_INTERVAL:
+            return
+        self.decreased = now
+        self.rate = max(MIN_RATE, self.rate / 2)
+        self.limit = max(1.0, self.limit / 2)
+
+    def succeed(self):
+        self.failures = 0
+        self.opened = None
+        self.probing = False
+
+    def fail(self, now: float):
+        self.failures += 1
+        if self.probing or self.failures >= BREAKER_FAILURES:
+            self.opened = now
+            self.probing = False
+
+
+class Throttle:
+    """Hosts by name, created as they are first requested."""
+
+    def __init__(self, rate: float = RATE, concurrency: int = CONCURRENCY,
+                 max_rate: float = MAX_RATE,
+                 max_concurrency: int = MAX_CONCURRENCY):
+        """Initialize Throttle object.
+
+        Args:
+            rate, concurrency, max_rate, max_concurrency: Passed to the Host
+                of every host.
+        """
+        self.rate = rate
+        self.concurrency = concurrency
+        self.max_rate = max_rate
+        self.max_concurrency = max_concurrency
+        self.hosts = dict()
+        self.lock = threading.Lock()
+
+    def host(self, url: str):
+        name = urlsplit(url).netloc
+        with self.lock:
+            if name not in self.hosts:
+                self.hosts[name] = Host(name, self.rate, self.concurrency,
+                                        self.max_rate, self.max_concurrency)
+            return self.hosts[name]
+
+    def acquire(self, url: str):
+        """Wait until a request to url can be sent (see Host.acquire)."""
+        self.host(url).acquire()
+
+    def release(self, url: str, latency: float = None, status: int = None,
+                headers=None):
+        """Count a request to url as done (see Host.release)."""
+        self.host(url).release(latency, status, headers)
+
+    def reset(self):
+        """Forget every host, e.g. in a forked child, whose locks may have
+        been held by threads of its parent."""
+        self.hosts = dict()
+        self.lock = threading.Lock()
+
+
+class Manager(BaseManager):
+    """Serves Throttles from a process of its own.
+
+    Processes forked after the manager started share the Throttles it
+    returns, so that all of them together keep to the limits of each host.
+    Every acquire and release is a round trip to the manager's process.
+    """
+
+    def start(self):
+        # Interrupts are handled by the processes using the manager, which
+        # still need it while they stop
+        super().start(signal.signal, (signal.SIGINT, signal.SIG_IGN))
+
+
+Manager.register('Throttle', Throttle, exposed=('acquire', 'release'))
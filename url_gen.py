@@ -1,12 +1,38 @@
 #!/usr/bin/python3
-
-from urllib.parse import urljoin
-
-from bs4 import BeautifulSoup
-import requests
+"""Harvest the urls of game pages from the wikipedia lists of games.
+
+The list pages are fetched and parsed concurrently. A game is in the lists
+of all the platforms it was released on, under variants of its title
+(percent-encoded or not, with underscores or spaces, with a section), so the
+links are deduplicated by normalized title: each game is written once, with
+the url of its first link in the order of list_urls.
+
+URL_FILENAME has the urls in that order, and SOURCES_FILENAME the lists each
+of them was found in. The urls are also shuffled into SHUFFLED_FILENAME, so
+that crawling any part of it samples every platform, or with --shards N into
+N files that partition the games by title, one per crawler.
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import logging
+import os
+import random
+from urllib.parse import unquote, urldefrag, urljoin, urlsplit
+
+import lxml.html
+
+import archive
+import extract
+import fetch
 
 wikipedia_baseurl = 'https://en.wikipedia.org/'
 URL_FILENAME = 'url.txt'
+SHUFFLED_FILENAME = 'url_shuf.txt'
+SOURCES_FILENAME = 'url_sources.tsv'
+# Number of list pages fetched and parsed at once
+CONCURRENCY = 8
 
 # No PC games because the format is too different from the other platforms,
 # and that would elongate the execution time
@@ -43,20 +69,19 @@ list_urls = (
             '/wiki/List_of_PlayStation_3_games_released_on_disc'),
     urljoin(wikipedia_baseurl,
             '/wiki/List_of_PlayStation_4_games'),
-    urljoin(wikipedia_baseurl,
-            '/wiki/List_of_PlayStation_4_games'),
     urljoin(wikipedia_baseurl,
             '/wiki/List_of_PlayStation_Vita_games_(A%E2%80%93L)'),
 )
 urls_len = len(list_urls)
 
 
-def gls_method1(soup: BeautifulSoup):
-    return soup.find('table', id='softwarelist')
+def gls_method1(root):
+    return extract.find(root, 'table', id='softwarelist')
 
 
-def gls_method2(soup: BeautifulSoup):
-    return soup.find('table', class_='wikitable sortable')
+def gls_method2(root):
+    # The whole class attribute, as BeautifulSoup matches a class with spaces
+    return extract.find(root, 'table', **{'class': 'wikitable sortable'})
 
 
 gls_methods = (
@@ -77,30 +102,138 @@ gls_methods = (
     gls_method1,
     gls_method1,
     gls_method1,
-    gls_method1,
 )
 
 
-def game_list_soup(i: int):
+def list_name(i: int):
     """i: index of list_urls"""
-    r = requests.get(list_urls[i])
-    r.raise_for_status()
-    soup = BeautifulSoup(r.text, 'lxml')
-    return gls_methods[i](soup)
+    return unquote(urlsplit(list_urls[i]).path.rsplit('/', 1)[-1])
 
 
-def download_all_urls(file_):
-    for i, game_list in enumerate(map(game_list_soup, range(len(list_urls)))):
-        for tr in game_list('tr'):
-            try:
-                print(urljoin(wikipedia_baseurl, tr.td.a['href']), file=file_)
-            except BaseException:
-                continue
+def game_list_table(i: int):
+    """i: index of list_urls"""
+    root = lxml.html.document_fromstring(fetch.get(list_urls[i]))
+    return gls_methods[i](root)
+
+
+def game_links(i: int):
+    """Return the href of the first link in the first cell of every row of
+    the list at list_urls[i]."""
+    table = game_list_table(i)
+    if table is None:
+        logging.error('url_gen: {}: No list of games'.format(list_urls[i]))
+        return []
+    hrefs = []
+    for tr in table.iter('tr'):
+        td = extract.find(tr, 'td')
+        a = extract.find(td, 'a') if td is not None else None
+        href = a.get('href') if a is not None else None
+        if href:
+            hrefs.append(href)
+    return hrefs
+
+
+def title_key(url: str):
+    """Return the normalized title of the article at url, which is the same
+    for every link to it, or None if url is not a link to an article."""
+    path = urlsplit(url).path
+    if not path.startswith('/wiki/'):
+        # e.g. /w/index.php?title=...&redlink=1, for an article that does
+        # not exist
+        return None
+    title = extract.normalize(unquote(path[len('/wiki/'):]).replace('_', ' '))
+    if not title:
+        return None
+    # Only the first letter of a title is case-insensitive
+    return title[0].upper() + title[1:]
+
+
+def harvest(concurrency: int = CONCURRENCY):
+    """Return url -> names of the lists it is in, of every game in the
+    lists, in the order of list_urls and deduplicated by title_key."""
+    urls = dict()
+    # title_key -> url
+    titles = dict()
+    with ThreadPoolExecutor(concurrency) as executor:
+        lists = executor.map(game_links, range(urls_len))
+        for i, hrefs in enumerate(lists):
+            name = list_name(i)
+            for href in hrefs:
+                url, _ = urldefrag(urljoin(wikipedia_baseurl, href))
+                title = title_key(url)
+                if title is None:
+                    continue
+                sources = urls.setdefault(titles.setdefault(title, url), [])
+                if name not in sources:
+                    sources.append(name)
+    return urls
+
+
+def shard(url: str, shards: int):
+    """Return the shard of the game at url, which is the same for all its
+    links and for every harvest."""
+    digest = hashlib.md5(title_key(url).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % shards
+
+
+def shard_paths(shards: int):
+    if shards == 1:
+        return [SHUFFLED_FILENAME]
+    root, ext = os.path.splitext(SHUFFLED_FILENAME)
+    return ['{}.{}{}'.format(root, i, ext) for i in range(shards)]
+
+
+def write_lines(path: str, lines):
+    """Replace the file at path with lines, all at once."""
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as file_:
+        for line in lines:
+            print(line, file=file_)
+    os.replace(tmp, path)
+
+
+def write_shuffled(urls, shards: int = 1, seed=None):
+    rng = random.Random(seed)
+    sharded = [[] for _ in range(shards)]
+    for url in urls:
+        sharded[shard(url, shards)].append(url)
+    for path, shard_urls in zip(shard_paths(shards), sharded):
+        rng.shuffle(shard_urls)
+        write_lines(path, shard_urls)
+        # The position data_gen --resume starts from (see
+        # data_gen.position_path) is in the old order
+        position_path = os.path.splitext(path)[0] + '.pos'
+        if os.path.exists(position_path):
+            os.remove(position_path)
+
+
+def download_all_urls(concurrency: int = CONCURRENCY, shards: int = 1,
+                      seed=None):
+    urls = harvest(concurrency)
+    write_lines(URL_FILENAME, urls)
+    write_lines(SOURCES_FILENAME,
+                ('\t'.join([url] + sources) for url, sources in urls.items()))
+    write_shuffled(urls, shards, seed)
+    print('{} game urls from {} lists'.format(len(urls), urls_len))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY,
+                        help='maximum number of list pages in flight')
+    parser.add_argument('--shards', type=int, default=1, metavar='N',
+                        help='shuffle the urls into N files instead of {}, '
+                             'for N crawlers'.format(SHUFFLED_FILENAME))
+    parser.add_argument('--seed', type=int, default=None,
+                        help='seed of the shuffle')
+    archive.add_arguments(parser)
+    return parser.parse_args()
 
 
 def main():
-    with open(URL_FILENAME, 'w', encoding='utf-8') as file_:
-        download_all_urls(file_)
+    args = parse_args()
+    archive.setup(args)
+    download_all_urls(args.concurrency, args.shards, args.seed)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,250 @@
+"""Durable work queue of game urls, in a local SQLite database.
+
+Every url in the queue is in one of the states:
+
+pending: Not crawled yet.
+in_flight: Handed to a crawler, and neither done nor failed yet. The urls
+    left in flight by a run that stopped are pending again when the queue is
+    next opened.
+done: Its game was committed, or it was skipped.
+retry: Failed with a transient error, e.g. a timeout or an HTTP 429 or 5xx
+    response. It is due again after a backoff doubling with every attempt,
+    or after the Retry-After of the response.
+failed: Failed with a permanent error, e.g. an HTTP 404 response or a page
+    that cannot be extracted, or MAX_ATTEMPTS times.
+
+A url whose game is added to a data.WriteUnit is only marked done once the
+unit is committed (see WorkQueue.commit), so a crawl that stops, crashes or
+is killed replays neither the urls done before nor loses the ones whose
+games were never written. A url whose game the unit drops on a rollback is
+failed with the error instead (see WorkQueue.rolled_back).
+"""
+
+import logging
+import random
+import sqlite3
+import threading
+import time
+
+import requests
+
+import gamedb
+import throttle
+
+QUEUE_FILE = 'url_queue.sqlite'
+# Attempts after which a url that keeps failing is failed
+MAX_ATTEMPTS = 5
+# Seconds before the first retry of a url, doubled with every attempt
+BACKOFF = 30
+BACKOFF_MAX = 3600
+
+PENDING = 'pending'
+IN_FLIGHT = 'in_flight'
+DONE = 'done'
+RETRY = 'retry'
+FAILED = 'failed'
+STATES = (PENDING, IN_FLIGHT, DONE, RETRY, FAILED)
+
+create_sql = """CREATE TABLE IF NOT EXISTS url_queue (
+                    url TEXT NOT NULL PRIMARY KEY,
+                    position INTEGER NOT NULL,
+                    state TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    due REAL NOT NULL DEFAULT 0,
+                    error TEXT,
+                    updated REAL
+                )"""
+create_index_sql = """CREATE INDEX IF NOT EXISTS url_queue_state_due
+                      ON url_queue (state, due, position)"""
+recover_sql = "UPDATE url_queue SET state='pending' WHERE state='in_flight'"
+max_position_sql = "SELECT COALESCE(MAX(position), 0) FROM url_queue"
+add_sql = "INSERT OR IGNORE INTO url_queue (url, position) VALUES (?, ?)"
+due_sql = """SELECT url FROM url_queue
+             WHERE state IN ('pending', 'retry') AND due <= ?
+             ORDER BY due, position LIMIT 1"""
+claim_sql = "UPDATE url_queue SET state='in_flight' WHERE url=?"
+next_due_sql = "SELECT MIN(due) FROM url_queue WHERE state='retry'"
+set_state_sql = """UPDATE url_queue SET state=?, updated=?
+                   WHERE url=? AND state='in_flight'"""
+attempts_sql = "SELECT attempts FROM url_queue WHERE url=?"
+fail_sql = """UPDATE url_queue
+              SET state=?, attempts=?, due=?, error=?, updated=?
+              WHERE url=? AND state='in_flight'"""
+requeue_sql = """UPDATE url_queue SET state='pending', attempts=0, due=0
+                 WHERE state='failed'"""
+counts_sql = "SELECT state, COUNT(*) FROM url_queue GROUP BY state"
+
+
+def status_code(e: BaseException):
+    response = getattr(e, 'response', None)
+    return getattr(response, 'status_code', None)
+
+
+def retryable(e: BaseException):
+    """Return whether a url that failed with e may succeed later."""
+    if isinstance(e, requests.exceptions.HTTPError):
+        code = status_code(e)
+        return code is None or code in (408, 429) or code >= 500
+    return isinstance(e, (requests.exceptions.ConnectionError,
+                          requests.exceptions.Timeout,
+                          throttle.CircuitOpen,
+                          gamedb.OperationalError))
+
+
+def retry_after(e: BaseException):
+    """Return the seconds to wait given by the Retry-After header of the
+    response e failed with, or None."""
+    response = getattr(e, 'response', None)
+    return throttle.retry_after(getattr(response, 'headers', None))
+
+
+def backoff(attempts: int):
+    """Return the seconds to wait before attempt attempts + 1, with jitter so
+    that urls that failed together are not retried together."""
+    delay = min(BACKOFF_MAX, BACKOFF * 2 ** (attempts - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+class WorkQueue:
+    """Urls to crawl, with their states, in a SQLite database.
+
+    Safe to use from several threads: every statement runs under one lock
+    and is committed right away, except done, whose urls are marked done by
+    the next commit.
+    """
+
+    def __init__(self, path: str = QUEUE_FILE,
+                 max_attempts: int = MAX_ATTEMPTS):
+        """Initialize WorkQueue object.
+
+        Args:
+            path: Path of the database. It is created if it does not exist.
+            max_attempts: Attempts after which a url that keeps failing is
+                failed.
+        """
+        self.path = path
+        self.max_attempts = max_attempts
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.lock = threading.Lock()
+        # Urls done since the last commit
+        self.finished = []
+        # Whether the last iterator returned by due ran out of due urls
+        self.exhausted = False
+        with self.lock, self.db:
+            self.db.execute(create_sql)
+            self.db.execute(create_index_sql)
+            # Left in flight by a run that stopped
+            self.db.execute(recover_sql)
+
+    def close(self):
+        """Make the urls still in flight pending again and close the
+        database."""
+        with self.lock, self.db:
+            self.db.execute(recover_sql)
+        self.db.close()
+
+    def add(self, urls):
+        """Add urls to the end of the queue, skipping those already in it.
+
+        Return the number of urls added.
+        """
+        with self.lock, self.db:
+            start = self.db.execute(max_position_sql).fetchone()[0]
+            before = self.db.total_changes
+            self.db.executemany(add_sql,
+                                ((url, position) for position, url
+                                 in enumerate(filter(None, urls),
+                                              start + 1)))
+            return self.db.total_changes - before
+
+    def due(self):
+        """Yield the urls that are due, in queue order, moving each to in
+        flight as it is yielded, until none is due."""
+        self.exhausted = False
+        while True:
+            with self.lock, self.db:
+                row = self.db.execute(due_sql, (time.time(),)).fetchone()
+                if row is None:
+                    break
+                self.db.execute(claim_sql, row)
+            yield row[0]
+        self.exhausted = True
+
+    def next_due(self):
+        """Return the seconds until the next retry is due, or None if no url
+        is left to retry."""
+        with self.lock:
+            due = self.db.execute(next_due_sql).fetchone()[0]
+        if due is None:
+            return None
+        return max(0.0, due - time.time())
+
+    def done(self, url: str):
+        """Record that the game at url was added to the write unit, or that
+        url was skipped. url is done once the unit is committed."""
+        with self.lock:
+            self.finished.append(url)
+
+    def commit(self):
+        """Mark done the urls recorded by done, whose games are all
+        committed by now.
+
+        Pass as the on_commit of the data.WriteUnit the games are added to.
+        """
+        with self.lock, self.db:
+            finished, self.finished = self.finished, []
+            now = time.time()
+            self.db.executemany(set_state_sql,
+                                ((DONE, now, url) for url in finished))
+
+    def rolled_back(self, url: str, e: BaseException):
+        """Record that the game at url was dropped from the write unit by
+        a rollback with e. url is failed with e, or pending again if e is an
+        interrupt.
+
+        Pass as the on_rollback of the data.WriteUnit the games are added
+        to, through data_gen.rolled_back.
+        """
+        with self.lock:
+            if url in self.finished:
+                self.finished.remove(url)
+        if isinstance(e, Exception):
+            self.failed(url, e)
+            return
+        with self.lock, self.db:
+            self.db.execute(set_state_sql, (PENDING, time.time(), url))
+
+    def failed(self, url: str, e: BaseException):
+        """Record that crawling url failed with e, scheduling a retry if e is
+        transient and url has attempts left."""
+        with self.lock, self.db:
+            row = self.db.execute(attempts_sql, (url,)).fetchone()
+            if row is None:
+                return
+            attempts = row[0] + 1
+            now = time.time()
+            if retryable(e) and attempts < self.max_attempts:
+                state = RETRY
+                delay = retry_after(e)
+                due = now + (backoff(attempts) if delay is None else delay)
+            else:
+                state = FAILED
+                due = 0
+            error = '{}: {}'.format(type(e).__name__, e)[:1000]
+            self.db.execute(fail_sql,
+                            (state, attempts, due, error, now, url))
+        logging.error('WorkQueue.failed: {} ({}, attempt {}): {}'
+                      .format(url, state, attempts, error))
+
+    def requeue_failed(self):
+        """Make the failed urls pending again, with no attempts. Return their
+        number."""
+        with self.lock, self.db:
+            return self.db.execute(requeue_sql).rowcount
+
+    def counts(self):
+        """Return a dict from every state to the number of urls in it."""
+        with self.lock:
+            counts = dict(self.db.execute(counts_sql).fetchall())
+        return {state: counts.get(state, 0) for state in STATES}